@@ -0,0 +1,268 @@
+import asyncio
+from argparse import ArgumentParser, Namespace
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Set, Tuple
+
+import asyncpg
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import BulkIndexError
+from prometheus_client import start_http_server
+from redis.asyncio import Redis
+
+from services import extract
+from services.aio import POSTGRES_ERRORS, AsyncDataTransform, AsyncElasticsearchLoader, AsyncPostgresExtractor
+from services.load import check_errors, get_failed_ids
+from services.state import STATE_KEY, WATERMARKS_KEY, dump_state, load_state, read_watermarks
+from core.config import (
+    ASYNC_CONCURRENCY,
+    ELASTIC_PARAMS,
+    METRICS_PORT,
+    POSTGRES_PARAMS,
+    REDIS_PARAMS,
+    VALIDATION_SAMPLE_RATE,
+)
+from core.decorators import async_backoff, timed
+from core.logger import logger
+from core.metrics import observe_watermark
+from db.aio import get_async_elastic, get_async_postgres, get_async_redis
+from models.genre import Genre
+from models.movie import Movie
+from models.person import Person
+
+QUEUE = 'movie_ids'
+
+
+@async_backoff(errors=POSTGRES_ERRORS)
+async def etl_process(
+    postgres: AsyncPostgresExtractor,
+    data: AsyncDataTransform,
+    elastic: AsyncElasticsearchLoader,
+    redis: Redis,
+    concurrency: int,
+):
+    """Run the internal components of the Extract-Transform-Load (ETL) process with asyncio.
+
+    - Runs again from the saved watermarks if the connection to PostgreSQL fails while updates are streamed
+
+    Args:
+        postgres: Extracts data from PostgreSQL.
+        data: Transforms and stores intermediate data.
+        elastic: Loads data into Elasticsearch.
+        redis: Connection to Redis holding the state.
+        concurrency: Maximum number of movie batches loaded at the same time.
+    """
+    state = load_state(await redis.get(STATE_KEY))
+    watermarks = read_watermarks(state, postgres.TABLES, postgres.INITIAL_WATERMARK)
+    try:
+        async for table, rows in postgres.get_updates(watermarks):
+            await process_updates(postgres, data, elastic, table, rows)
+            watermarks[table] = extract.get_watermark(rows)
+            state[WATERMARKS_KEY] = watermarks
+            await redis.set(STATE_KEY, dump_state(state))
+            observe_watermark(table, watermarks[table])
+    except extract.UpdatesNotFoundError:
+        await load_movies(postgres, data, elastic, concurrency)
+        raise
+    await load_movies(postgres, data, elastic, concurrency)
+
+
+async def process_updates(
+    postgres: AsyncPostgresExtractor,
+    data: AsyncDataTransform,
+    elastic: AsyncElasticsearchLoader,
+    table: str,
+    rows: List[Dict],
+):
+    """Load a batch of updated persons or genres and collect the movies affected by the batch.
+
+    Args:
+        postgres: Extracts data from PostgreSQL.
+        data: Transforms and stores intermediate data.
+        elastic: Loads data into Elasticsearch.
+        table: Table name.
+        rows: Batch of updated rows.
+    """
+    if table == 'person':
+        check_errors(await elastic.bulk_insert(Person, rows))
+    if table == 'genre':
+        check_errors(await elastic.bulk_insert(Genre, rows))
+    await data.collector(QUEUE, await postgres.get_film_work_ids(table, rows))
+
+
+async def load_movies(
+    postgres: AsyncPostgresExtractor,
+    data: AsyncDataTransform,
+    elastic: AsyncElasticsearchLoader,
+    concurrency: int,
+):
+    """Build and load the movies collected for the update.
+
+    - Up to `concurrency` batches are fetched and loaded at the same time,
+      so the queries and bulk requests of different batches overlap
+
+    Args:
+        postgres: Extracts data from PostgreSQL.
+        data: Transforms and stores intermediate data.
+        elastic: Loads data into Elasticsearch.
+        concurrency: Maximum number of movie batches loaded at the same time.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks: Set[asyncio.Task] = set()
+    async for movie_ids in data.batcher(QUEUE):
+        await semaphore.acquire()
+        tasks.add(asyncio.create_task(load_batch(postgres, data, elastic, movie_ids, semaphore)))
+        done = {task for task in tasks if task.done()}
+        for task in done:
+            task.result()
+        tasks -= done
+    await asyncio.gather(*tasks)
+
+
+@timed('load_batch')
+async def load_batch(
+    postgres: AsyncPostgresExtractor,
+    data: AsyncDataTransform,
+    elastic: AsyncElasticsearchLoader,
+    movie_ids: List[str],
+    semaphore: asyncio.Semaphore,
+):
+    """Load a batch of movies and free its slot of the concurrency limit.
+
+    - Movies that failed to load stay unacknowledged and are taken back by the next run
+
+    Args:
+        postgres: Extracts data from PostgreSQL.
+        data: Transforms and stores intermediate data.
+        elastic: Loads data into Elasticsearch.
+        movie_ids: Batch of movie IDs.
+        semaphore: Limit of concurrent batches, released when the batch is done.
+    """
+    try:
+        await index_batch(postgres, data, elastic, movie_ids)
+    finally:
+        semaphore.release()
+
+
+async def index_batch(
+    postgres: AsyncPostgresExtractor,
+    data: AsyncDataTransform,
+    elastic: AsyncElasticsearchLoader,
+    movie_ids: List[str],
+):
+    """Fetch, build and load a batch of movies, then acknowledge the ones that were loaded.
+
+    Args:
+        postgres: Extracts data from PostgreSQL.
+        data: Transforms and stores intermediate data.
+        elastic: Loads data into Elasticsearch.
+        movie_ids: Batch of movie IDs.
+    """
+    rows = await postgres.get_movie_documents(movie_ids)
+    errors = await elastic.bulk_insert(Movie, [data.build_movie(row) for row in rows])
+    await data.acknowledge(QUEUE, set(movie_ids).difference(get_failed_ids(errors)))
+
+
+async def postgres_to_elastic(args: Namespace):
+    """Load data from PostgreSQL into Elasticsearch.
+
+    Args:
+        args: Command line arguments.
+    """
+    async with connect(args.concurrency) as (postgres_pool, redis_conn, elastic_conn):
+        elastic = AsyncElasticsearchLoader(elastic_conn, validation_rate=args.validation_rate)
+        await elastic.create_indices()
+        await sync_forever(
+            AsyncPostgresExtractor(postgres_pool),
+            AsyncDataTransform(redis_conn),
+            elastic,
+            redis_conn,
+            args.concurrency,
+        )
+
+
+@asynccontextmanager
+async def connect(concurrency: int) -> AsyncIterator[Tuple[asyncpg.Pool, Redis, AsyncElasticsearch]]:
+    """Open the connections to PostgreSQL, Redis and Elasticsearch.
+
+    Args:
+        concurrency: Maximum number of movie batches loaded at the same time, each of them taking a connection.
+
+    Yields:
+        Tuple: Pool of connections to PostgreSQL, connection to Redis and connection to Elasticsearch.
+    """
+    async with get_async_postgres(**POSTGRES_PARAMS, size=concurrency + 1) as postgres_pool:
+        async with get_async_redis(**REDIS_PARAMS) as redis_conn:
+            async with get_async_elastic(**ELASTIC_PARAMS) as elastic_conn:
+                yield postgres_pool, redis_conn, elastic_conn
+
+
+async def sync_forever(
+    postgres: AsyncPostgresExtractor,
+    data: AsyncDataTransform,
+    elastic: AsyncElasticsearchLoader,
+    redis: Redis,
+    concurrency: int,
+):
+    """Run the ETL process every minute.
+
+    - Documents that failed to load stay unacknowledged and are taken back by the next run
+
+    Args:
+        postgres: Extracts data from PostgreSQL.
+        data: Transforms and stores intermediate data.
+        elastic: Loads data into Elasticsearch.
+        redis: Connection to Redis holding the state.
+        concurrency: Maximum number of movie batches loaded at the same time.
+    """
+    while True:
+        try:
+            await etl_process(postgres, data, elastic, redis, concurrency)
+        except extract.UpdatesNotFoundError:
+            logger.info('No updates found.')
+        except BulkIndexError as error:
+            logger.error(error.args[0])
+        else:
+            logger.info('Updates found!')
+        finally:
+            logger.info('Retrying in 1 minute.')
+            await asyncio.sleep(60)
+
+
+def parse_args() -> Namespace:
+    """Parse the command line arguments.
+
+    Returns:
+        Namespace: Command line arguments.
+    """
+    parser = ArgumentParser(description='Synchronize data from PostgreSQL into Elasticsearch with asyncio.')
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=ASYNC_CONCURRENCY,
+        help='Maximum number of movie batches fetched and loaded at the same time.',
+    )
+    parser.add_argument(
+        '--validation-rate',
+        type=float,
+        default=VALIDATION_SAMPLE_RATE,
+        help='Share of documents validated by the models before loading, from 0 to 1 for debug runs.',
+    )
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        default=METRICS_PORT,
+        help='Port of the HTTP endpoint exporting Prometheus metrics, or 0 to disable it.',
+    )
+    return parser.parse_args()
+
+
+def main():
+    """Execute the main program logic."""
+    args = parse_args()
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    asyncio.run(postgres_to_elastic(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+import io
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple
+from uuid import UUID
+
+from psycopg2.extensions import connection
+
+GENRES = 30
+
+ROLES = (
+    ('actor', (4, 12)),
+    ('writer', (1, 3)),
+    ('director', (1, 2)),
+)
+
+GENRE_LINKS = (('genre', (1, 3)),)
+
+TABLES = ('film_work', 'person', 'genre', 'person_film_work', 'genre_film_work')
+
+COPY_CHUNK_ROWS = 10000
+
+TABLE_ID_SHIFT = 96
+
+EPOCH = datetime.fromisoformat('2023-01-01T00:00:00+00:00')
+
+Row = Tuple
+
+Bounds = Tuple[int, int]
+
+Kinds = Tuple[Tuple[str, Bounds], ...]
+
+Link = Tuple[int, int, str]
+
+
+def make_id(table: int, number: int) -> str:
+    """Return a deterministic UUID of a row.
+
+    Args:
+        table: Number of the table.
+        number: Number of the row.
+
+    Returns:
+        str: UUID.
+    """
+    return str(UUID(int=(table << TABLE_ID_SHIFT) | number))
+
+
+def modified(number: int) -> datetime:
+    """Return a deterministic modification time of a row.
+
+    Args:
+        number: Number of the row.
+
+    Returns:
+        datetime: Modification time.
+    """
+    return EPOCH + timedelta(seconds=number)
+
+
+def draw(rng: random.Random, population: int, bounds: Bounds) -> List[int]:
+    """Draw a random number of distinct rows.
+
+    Args:
+        rng: Random generator.
+        population: Number of rows to draw from.
+        bounds: Minimum and maximum number of drawn rows.
+
+    Returns:
+        list[int]: Numbers of the drawn rows.
+    """
+    return rng.sample(range(population), rng.randint(*bounds))
+
+
+def to_line(row: Row) -> str:
+    """Format a row in the text format of COPY.
+
+    Args:
+        row: Row.
+
+    Returns:
+        str: Line ending with a newline.
+    """
+    return '{0}\n'.format('\t'.join(map(str, row)))
+
+
+def chunks(rows: Iterator[Row]) -> Iterator[io.StringIO]:
+    """Split rows into chunks in the text format of COPY.
+
+    Args:
+        rows: Rows.
+
+    Yields:
+        StringIO: Chunk of rows.
+    """
+    lines: List[str] = []
+    for row in rows:
+        lines.append(to_line(row))
+        if len(lines) == COPY_CHUNK_ROWS:
+            yield io.StringIO(''.join(lines))
+            lines = []
+    if lines:
+        yield io.StringIO(''.join(lines))
+
+
+@dataclass
+class Catalog(object):
+    """Synthetic movie catalog of a configurable size.
+
+    - Rows are generated lazily and deterministically from the seed, so catalogs of millions
+      of films can be streamed into PostgreSQL without being held in memory
+    - Every film has 1-3 genres, 4-12 actors, 1-3 writers and 1-2 directors
+      drawn from a pool of persons twice as large as the number of films
+
+    Attributes:
+        films: Number of films.
+        seed: Seed of the random generator.
+    """
+
+    films: int
+    seed: int = 0
+
+    @property
+    def persons(self) -> int:
+        """Return the number of persons.
+
+        Returns:
+            int: Number of persons.
+        """
+        return self.films * 2
+
+    def film_work(self) -> Iterator[Row]:
+        """Generate films.
+
+        Yields:
+            Row: id, title, description, rating, type, modified.
+        """
+        rng = random.Random(self.seed)
+        for number in range(self.films):
+            yield (
+                make_id(1, number),
+                'Film {0}'.format(number),
+                'Description of the film number {0}'.format(number),
+                round(rng.uniform(1, 10), 1),
+                'movie',
+                modified(number),
+            )
+
+    def person(self) -> Iterator[Row]:
+        """Generate persons.
+
+        Yields:
+            Row: id, full_name, modified.
+        """
+        for number in range(self.persons):
+            yield (make_id(2, number), 'Person {0}'.format(number), modified(number))
+
+    def genre(self) -> Iterator[Row]:
+        """Generate genres.
+
+        Yields:
+            Row: id, name, description, modified.
+        """
+        for number in range(GENRES):
+            yield (
+                make_id(3, number),
+                'Genre {0}'.format(number),
+                'Description of the genre number {0}'.format(number),
+                modified(number),
+            )
+
+    def person_film_work(self) -> Iterator[Row]:
+        """Generate links between films and persons.
+
+        Yields:
+            Row: id, film_work_id, person_id, role.
+        """
+        links = self.draw_links(self.seed + 1, self.persons, ROLES)
+        for number, (film, person, role) in enumerate(links):
+            yield (
+                make_id(4, number),
+                make_id(1, film),
+                make_id(2, person),
+                role,
+            )
+
+    def genre_film_work(self) -> Iterator[Row]:
+        """Generate links between films and genres.
+
+        Yields:
+            Row: id, film_work_id, genre_id.
+        """
+        links = self.draw_links(self.seed + 2, GENRES, GENRE_LINKS)
+        for number, (film, genre, _) in enumerate(links):
+            yield (
+                make_id(5, number),
+                make_id(1, film),
+                make_id(3, genre),
+            )
+
+    def draw_links(self, seed: int, population: int, kinds: Kinds) -> Iterator[Link]:
+        """Link every film to random rows of another table.
+
+        Args:
+            seed: Seed of the random generator.
+            population: Number of rows in the linked table.
+            kinds: Kind of each link with the minimum and maximum number of such links per film.
+
+        Yields:
+            Link: Number of the film, number of the linked row and kind of the link.
+        """
+        rng = random.Random(seed)
+        for film in range(self.films):
+            for kind, bounds in kinds:
+                for linked in draw(rng, population, bounds):
+                    yield film, linked, kind
+
+    def load(self, postgres: connection, schema: str):
+        """Create the tables in a separate schema and fill them with COPY.
+
+        Args:
+            postgres: Connection to PostgreSQL.
+            schema: Schema to create; it is dropped first if it exists.
+        """
+        columns = {
+            'film_work': 'id, title, description, rating, type, modified',
+            'person': 'id, full_name, modified',
+            'genre': 'id, name, description, modified',
+            'person_film_work': 'id, film_work_id, person_id, role',
+            'genre_film_work': 'id, film_work_id, genre_id',
+        }
+        with postgres.cursor() as curs:
+            curs.execute('DROP SCHEMA IF EXISTS {0} CASCADE; CREATE SCHEMA {0};'.format(schema))
+            for table in TABLES:
+                curs.execute('CREATE TABLE {0}.{1} (LIKE content.{1} INCLUDING ALL);'.format(schema, table))
+                for chunk in chunks(getattr(self, table)()):
+                    curs.copy_expert('COPY {0}.{1} ({2}) FROM STDIN'.format(schema, table, columns[table]), chunk)
+            curs.execute('ANALYZE;')
+        postgres.commit()
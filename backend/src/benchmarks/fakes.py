@@ -0,0 +1,450 @@
+import json
+from collections import defaultdict
+from functools import partial
+from itertools import product
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from elasticsearch.serializer import JSONSerializer
+
+from benchmarks.catalog import Catalog, Row
+from core.config import BATCH_SIZE, Watermark
+
+BULK_ACTIONS = frozenset(('index', 'delete', 'create', 'update'))
+
+Credit = Tuple[str, str]
+
+JoinedCredit = Tuple[Optional[str], Optional[str]]
+
+
+def encode(members: Iterable[Any]) -> Set[bytes]:
+    """Encode members of a set like the Redis client does.
+
+    Args:
+        members: Members.
+
+    Returns:
+        set[bytes]: Encoded members.
+    """
+    return {str(member).encode() for member in members}
+
+
+def to_film(row: Row) -> Dict:
+    """Convert a generated film into a row of the film_work table.
+
+    Args:
+        row: Generated film.
+
+    Returns:
+        Dict: Film row.
+    """
+    return {
+        'id': row[0],
+        'modified': row[5],
+        'title': row[1],
+        'description': row[2],
+        'rating': row[3],
+    }
+
+
+def to_person(row: Row) -> Dict:
+    """Convert a generated person into a row of the person table.
+
+    Args:
+        row: Generated person.
+
+    Returns:
+        Dict: Person row.
+    """
+    return {'id': row[0], 'full_name': row[1], 'modified': row[2]}
+
+
+def to_genre(row: Row) -> Dict:
+    """Convert a generated genre into a row of the genre table.
+
+    Args:
+        row: Generated genre.
+
+    Returns:
+        Dict: Genre row.
+    """
+    return {
+        'id': row[0],
+        'name': row[1],
+        'description': row[2],
+        'modified': row[3],
+    }
+
+
+def index_by_id(rows: List[Dict], column: str) -> Dict:
+    """Map the IDs of rows to one of their columns.
+
+    Args:
+        rows: Rows.
+        column: Column name.
+
+    Returns:
+        Dict: Values of the column by row ID.
+    """
+    return {row['id']: row[column] for row in rows}
+
+
+class FakeIndices(object):
+    """In-process replacement of the Elasticsearch indices API."""
+
+    def __init__(self) -> None:
+        """Start without indices."""
+        self.names: Set[str] = set()
+
+    def exists(self, index: str) -> bool:
+        """Check whether an index exists.
+
+        Args:
+            index: Index name.
+
+        Returns:
+            bool: True if the index exists.
+        """
+        return index in self.names
+
+    def create(self, index: str, **kwargs):
+        """Create an index.
+
+        Args:
+            index: Index name.
+            kwargs: Ignored arguments.
+        """
+        self.names.add(index)
+
+
+class FakeTransport(object):
+    """In-process replacement of the Elasticsearch transport holding the serializer."""
+
+    serializer = JSONSerializer()
+
+
+class FakeElasticsearch(object):
+    """In-process replacement of the Elasticsearch client that accepts every bulk request."""
+
+    def __init__(self) -> None:
+        """Start with an empty cluster."""
+        self.indices = FakeIndices()
+        self.transport = FakeTransport()
+        self.documents = 0
+        self.bytes = 0
+
+    def bulk(self, body: str, *args, **kwargs) -> Dict[str, Any]:
+        """Parse a bulk request and report every action as successful.
+
+        Args:
+            body: Bulk request in NDJSON format.
+            args: Ignored arguments.
+            kwargs: Ignored arguments.
+
+        Returns:
+            Dict: Bulk response.
+        """
+        self.bytes += len(body)
+        responses = []
+        for line in body.splitlines():
+            action = json.loads(line)
+            op_type = next(iter(action))
+            metadata = action[op_type]
+            if op_type in BULK_ACTIONS and '_id' in metadata:
+                responses.append({op_type: {'_id': metadata['_id'], 'status': 200}})
+        self.documents += len(responses)
+        return {'errors': False, 'items': responses}
+
+
+class FakePipeline(object):
+    """In-process replacement of a Redis pipeline that runs commands immediately."""
+
+    def __init__(self, redis: 'FakeRedis'):
+        """Bind the pipeline to the storage.
+
+        Args:
+            redis: Storage.
+        """
+        self.redis = redis
+        self.replies: List[Any] = []
+
+    def __enter__(self) -> 'FakePipeline':
+        """Enter the context.
+
+        Returns:
+            FakePipeline: The pipeline.
+        """
+        return self
+
+    def __exit__(self, *args):
+        """Exit the context.
+
+        Args:
+            args: Exception details.
+        """
+
+    def __getattr__(self, name: str) -> Callable:
+        """Forward commands to the storage, keeping their replies.
+
+        Args:
+            name: Command name.
+
+        Returns:
+            Callable: Command.
+        """
+        return partial(self.record, getattr(self.redis, name))
+
+    def record(self, command: Callable, *args, **kwargs):
+        """Run a command and keep its reply.
+
+        Args:
+            command: Command of the storage.
+            args: Arguments of the command.
+            kwargs: Keyword arguments of the command.
+        """
+        self.replies.append(command(*args, **kwargs))
+
+    def execute(self) -> List[Any]:
+        """Return the replies of the commands.
+
+        Returns:
+            List: Replies.
+        """
+        replies = self.replies
+        self.replies = []
+        return replies
+
+
+class FakeRedis(object):
+    """In-process replacement of the Redis commands used by the ETL."""
+
+    def __init__(self) -> None:
+        """Start with an empty storage."""
+        self.sets: Dict[str, Set[bytes]] = defaultdict(set)
+
+    def sadd(self, key: str, *members: str) -> int:
+        """Add members to a set.
+
+        Args:
+            key: Key.
+            members: Members.
+
+        Returns:
+            int: Size of the set.
+        """
+        self.sets[key].update(encode(members))
+        return len(self.sets[key])
+
+    def srem(self, key: str, *members: str) -> int:
+        """Remove members from a set.
+
+        Args:
+            key: Key.
+            members: Members.
+
+        Returns:
+            int: Size of the set.
+        """
+        self.sets[key].difference_update(encode(members))
+        return len(self.sets[key])
+
+    def scard(self, key: str) -> int:
+        """Return the size of a set.
+
+        Args:
+            key: Key.
+
+        Returns:
+            int: Size of the set.
+        """
+        return len(self.sets[key])
+
+    def sunionstore(self, destination: str, *keys: str) -> int:
+        """Store the union of sets.
+
+        Args:
+            destination: Key of the result.
+            keys: Keys of the sets.
+
+        Returns:
+            int: Size of the result.
+        """
+        sources = [self.sets[key] for key in keys]
+        self.sets[destination] = set().union(*sources)
+        return len(self.sets[destination])
+
+    def delete(self, *keys: str) -> int:
+        """Delete keys.
+
+        Args:
+            keys: Keys.
+
+        Returns:
+            int: Number of deleted keys.
+        """
+        return sum(self.sets.pop(key, None) is not None for key in keys)
+
+    def pipeline(self, *args, **kwargs) -> FakePipeline:
+        """Return a pipeline.
+
+        Args:
+            args: Ignored arguments.
+            kwargs: Ignored arguments.
+
+        Returns:
+            FakePipeline: Pipeline.
+        """
+        return FakePipeline(self)
+
+    def register_script(self, script: str) -> Callable:
+        """Return the batch pop script of DataTransform implemented in Python.
+
+        Args:
+            script: Ignored Lua source.
+
+        Returns:
+            Callable: Script.
+        """
+        return self.pop_batch
+
+    def pop_batch(self, keys: List[str], args: List[int]) -> List[bytes]:
+        """Move a batch of members from a set into the processing set.
+
+        Args:
+            keys: Keys of the set and of the processing set.
+            args: Size of the batch.
+
+        Returns:
+            list[bytes]: Moved members.
+        """
+        source = self.sets[keys[0]]
+        count = min(int(args[0]), len(source))
+        batch = [source.pop() for _ in range(count)]
+        self.sets[keys[1]].update(batch)
+        return batch
+
+
+class CatalogExtractor(object):
+    """In-process replacement of PostgresExtractor serving rows of a synthetic catalog."""
+
+    TABLES = ('film_work', 'person', 'genre')
+
+    INITIAL_WATERMARK = ('0001-01-01 00:00:00', '00000000-0000-0000-0000-000000000000')
+
+    def __init__(self, catalog: Catalog, movie_query: str = 'aggregated'):
+        """Materialize the catalog in memory.
+
+        Args:
+            catalog: Synthetic catalog.
+            movie_query: Shape of movie rows, 'aggregated' or 'joined'.
+        """
+        self.movie_query = movie_query
+        self.rows = {
+            'film_work': list(map(to_film, catalog.film_work())),
+            'person': list(map(to_person, catalog.person())),
+            'genre': list(map(to_genre, catalog.genre())),
+        }
+        self.films = {row['id']: row for row in self.rows['film_work']}
+        self.names = index_by_id(self.rows['person'], 'full_name')
+        self.genre_names = index_by_id(self.rows['genre'], 'name')
+        self.film_persons: Dict[str, List[Credit]] = defaultdict(list)
+        self.film_genres: Dict[str, List[str]] = defaultdict(list)
+        self.links: Dict[str, Set[str]] = defaultdict(set)
+        for _, film_id, person_id, role in catalog.person_film_work():
+            self.film_persons[film_id].append((person_id, role))
+            self.links[person_id].add(film_id)
+        for _, film_id, genre_id in catalog.genre_film_work():
+            self.film_genres[film_id].append(genre_id)
+            self.links[genre_id].add(film_id)
+
+    def get_updates(self, watermarks: Dict[str, Watermark]) -> Iterator[Tuple[str, List]]:
+        """Return every row of the catalog in batches.
+
+        Args:
+            watermarks: Ignored watermarks.
+
+        Yields:
+            tuple[str, list]: Table name and a batch of rows.
+        """
+        for table in self.TABLES:
+            rows = self.rows[table]
+            for start in range(0, len(rows), BATCH_SIZE):
+                yield table, rows[start:start + BATCH_SIZE]
+
+    def get_film_work_ids(self, table: str, data: List[Dict]) -> Iterator[Dict]:
+        """Return the films linked to a batch of rows.
+
+        Args:
+            table: Table name.
+            data: Batch of rows.
+
+        Yields:
+            Dict: Row with a film ID.
+        """
+        if table == 'film_work':
+            yield from data
+        else:
+            for row in data:
+                yield from ({'id': film_id} for film_id in self.links[row['id']])
+
+    def get_movie_data(self, film_ids: Iterable[str]) -> Iterator[Dict]:
+        """Return one row per film, person and genre, like the joined query.
+
+        Args:
+            film_ids: Film IDs.
+
+        Yields:
+            Dict: Joined row.
+        """
+        for film_id in film_ids:
+            pairs = product(self.list_credits(film_id), self.list_genres(film_id))
+            for (person_id, role), genre_id in pairs:
+                yield {
+                    **self.films[film_id],
+                    'role': role,
+                    'person_id': person_id,
+                    'full_name': self.names.get(person_id),
+                    'genre_name': self.genre_names.get(genre_id),
+                }
+
+    def list_credits(self, film_id: str) -> List[JoinedCredit]:
+        """Return the persons of a film, or a single empty credit like the outer join.
+
+        Args:
+            film_id: Film ID.
+
+        Returns:
+            list[JoinedCredit]: Person IDs with their roles.
+        """
+        credits: List[JoinedCredit] = list(self.film_persons[film_id])
+        return credits or [(None, None)]
+
+    def list_genres(self, film_id: str) -> List[Optional[str]]:
+        """Return the genres of a film, or a single empty genre like the outer join.
+
+        Args:
+            film_id: Film ID.
+
+        Returns:
+            list[Optional[str]]: Genre IDs.
+        """
+        genres: List[Optional[str]] = list(self.film_genres[film_id])
+        return genres or [None]
+
+    def get_movie_documents(self, film_ids: Iterable[str]) -> Iterator[Dict]:
+        """Return one pre-aggregated row per film, like the aggregated query.
+
+        Args:
+            film_ids: Film IDs.
+
+        Yields:
+            Dict: Aggregated row.
+        """
+        for film_id in film_ids:
+            persons: Dict[str, List[Dict]] = defaultdict(list)
+            for person_id, role in self.film_persons[film_id]:
+                persons[role].append({'id': person_id, 'name': self.names[person_id]})
+            yield {
+                **self.films[film_id],
+                'genres': sorted(self.genre_names[genre_id] for genre_id in self.film_genres[film_id]),
+                'persons': persons,
+            }
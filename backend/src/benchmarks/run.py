@@ -0,0 +1,338 @@
+"""Benchmark of the ETL stages on a synthetic catalog.
+
+Run from `backend/src`:
+
+    python -m benchmarks.run --films 10000
+    python -m benchmarks.run --films 1000000 --backend local --output report.json
+
+The `fake` backend serves the catalog from memory and replaces Redis and Elasticsearch with in-process fakes,
+so it measures the Python stages only. The `local` backend loads the catalog into the `benchmark` schema
+of the configured PostgreSQL with COPY and writes into new, unaliased index versions that are deleted afterwards.
+"""
+import json
+import resource
+import sys
+import time
+from argparse import ArgumentParser, Namespace
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List
+
+from elasticsearch import Elasticsearch
+
+from benchmarks.catalog import Catalog
+from benchmarks.fakes import CatalogExtractor, FakeElasticsearch, FakeRedis
+from services.extract import PostgresExtractor
+from services.load import ElasticsearchLoader
+from services.transform import DataTransform
+from core.config import ELASTIC_PARAMS, POSTGRES_HEALTH_CHECK_INTERVAL, POSTGRES_PARAMS, REDIS_PARAMS
+from db.elastic import get_elastic
+from db.postgres import get_postgres, get_postgres_pool
+from db.redis import get_redis
+from models.genre import Genre
+from models.movie import Movie
+from models.person import Person
+
+QUEUE = 'benchmark_movie_ids'
+
+SCHEMA = 'benchmark'
+
+PERCENTILES = (50, 95, 99)
+
+DEFAULT_FILMS = 10000
+
+
+def get_percentile(ordered: List[float], percentile: int) -> float:
+    """Return a percentile of sorted latencies in milliseconds.
+
+    Args:
+        ordered: Latencies in seconds, sorted in ascending order.
+        percentile: Percentile from 0 to 100.
+
+    Returns:
+        float: Latency in milliseconds.
+    """
+    position = (len(ordered) - 1) * percentile // 100
+    return round(ordered[position] * 1000, 3)
+
+
+@dataclass
+class StageTimer(object):
+    """Collector of latencies and row counts of the ETL stages."""
+
+    latencies: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    rows: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+
+    @contextmanager
+    def measure(self, stage: str, rows: int = 0) -> Iterator[None]:
+        """Measure one call of a stage.
+
+        Args:
+            stage: Stage name.
+            rows: Number of rows processed by the call.
+
+        Yields:
+            None: Control to the measured code.
+        """
+        start = time.perf_counter()
+        yield
+        self.latencies[stage].append(time.perf_counter() - start)
+        self.rows[stage] += rows
+
+    def iterate(self, stage: str, iterable: Iterable[Any]) -> List[Any]:
+        """Consume an iterable, measuring the time to produce all of its items.
+
+        Args:
+            stage: Stage name.
+            iterable: Iterable of rows.
+
+        Returns:
+            List: Produced rows.
+        """
+        start = time.perf_counter()
+        produced = list(iterable)
+        self.latencies[stage].append(time.perf_counter() - start)
+        self.rows[stage] += len(produced)
+        return produced
+
+    def advance(self, stage: str, iterable: Iterable[Any]) -> Iterator[Any]:
+        """Measure the time to produce each batch of an iterable.
+
+        Args:
+            stage: Stage name.
+            iterable: Iterable of tuples ending with a batch of rows.
+
+        Yields:
+            Any: Next batch.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            batch = next(iterator, None)
+            self.latencies[stage].append(time.perf_counter() - start)
+            if batch is None:
+                return
+            self.rows[stage] += len(batch[-1])
+            yield batch
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """Summarize the measurements of every stage.
+
+        Returns:
+            Dict: Calls, rows, total time, throughput and latency percentiles of each stage.
+        """
+        summary = {}
+        for stage, latencies in self.latencies.items():
+            ordered = sorted(latencies)
+            seconds = sum(ordered)
+            summary[stage] = {
+                'calls': len(ordered),
+                'rows': self.rows[stage],
+                'seconds': round(seconds, 6),
+                'rows_per_second': round(self.rows[stage] / seconds, 1) if seconds else 0,
+                **{
+                    'p{0}_ms'.format(percentile): get_percentile(ordered, percentile)
+                    for percentile in PERCENTILES
+                },
+            }
+        return summary
+
+
+def run_stages(
+    timer: StageTimer,
+    postgres: Any,
+    data: DataTransform,
+    elastic: ElasticsearchLoader,
+):
+    """Run a full load of the catalog, measuring every stage separately.
+
+    Args:
+        timer: Collector of measurements.
+        postgres: Extractor of the catalog.
+        data: Transforms and stores intermediate data.
+        elastic: Loads data into Elasticsearch.
+    """
+    run_updates(timer, postgres, data, elastic)
+    for movies in data.batcher(QUEUE):
+        build_movies(timer, postgres, data, movies)
+        with timer.measure('validation', len(movies)):
+            for movie in movies.values():
+                Movie(**movie).dict()
+        with timer.measure('serialize', len(movies)):
+            for movie in movies.values():
+                Movie.serialize(movie)
+        with timer.measure('bulk_insert:{0}'.format(Movie._index), len(movies)):
+            elastic.bulk_insert(Movie, movies.values())
+        data.acknowledge(QUEUE, movies.keys())
+
+
+def run_updates(
+    timer: StageTimer,
+    postgres: Any,
+    data: DataTransform,
+    elastic: ElasticsearchLoader,
+):
+    """Load every person and genre of the catalog and collect the movies to build.
+
+    Args:
+        timer: Collector of measurements.
+        postgres: Extractor of the catalog.
+        data: Transforms and stores intermediate data.
+        elastic: Loads data into Elasticsearch.
+    """
+    watermarks = {table: postgres.INITIAL_WATERMARK for table in postgres.TABLES}
+    for table, rows in timer.advance('get_updates', postgres.get_updates(watermarks)):
+        if table in {'person', 'genre'}:
+            schema = Person if table == 'person' else Genre
+            with timer.measure('bulk_insert:{0}'.format(schema._index), len(rows)):
+                elastic.bulk_insert(schema, rows)
+        film_ids = timer.iterate('get_film_work_ids', postgres.get_film_work_ids(table, rows))
+        data.collector(QUEUE, (row['id'] for row in film_ids))
+
+
+def build_movies(timer: StageTimer, postgres: Any, data: DataTransform, movies: Dict[str, Dict]):
+    """Fetch and build a batch of movies with the configured movie query.
+
+    Args:
+        timer: Collector of measurements.
+        postgres: Extractor of the catalog.
+        data: Transforms and stores intermediate data.
+        movies: Batch of movies to fill, by movie ID.
+    """
+    if postgres.movie_query == 'aggregated':
+        rows = timer.iterate('get_movie_documents', postgres.get_movie_documents(movies.keys()))
+        with timer.measure('build_movie', len(rows)):
+            for row in rows:
+                movies[row['id']] = data.build_movie(row)
+    else:
+        rows = timer.iterate('get_movie_data', postgres.get_movie_data(movies.keys()))
+        with timer.measure('parser', len(rows)):
+            data.parse_rows(rows, movies)
+
+
+def benchmark(args: Namespace) -> Dict[str, Any]:
+    """Generate the catalog, run the stages and build the report.
+
+    Args:
+        args: Command line arguments.
+
+    Returns:
+        Dict: Report.
+    """
+    catalog = Catalog(films=args.films, seed=args.seed)
+    timer = StageTimer()
+    start = time.perf_counter()
+    if args.backend == 'fake':
+        run_fake(timer, catalog, args)
+    else:
+        run_local(timer, catalog, args)
+    return {
+        'films': catalog.films,
+        'persons': catalog.persons,
+        'backend': args.backend,
+        'movie_query': args.movie_query,
+        'seconds': round(time.perf_counter() - start, 3),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'stages': timer.report(),
+    }
+
+
+def run_fake(timer: StageTimer, catalog: Catalog, args: Namespace):
+    """Run the stages on the catalog served from memory, with in-process fakes of Redis and Elasticsearch.
+
+    Args:
+        timer: Collector of measurements.
+        catalog: Synthetic catalog.
+        args: Command line arguments.
+    """
+    run_stages(
+        timer,
+        CatalogExtractor(catalog, movie_query=args.movie_query),
+        DataTransform(FakeRedis()),  # type: ignore[arg-type]
+        ElasticsearchLoader(FakeElasticsearch(), threads=args.bulk_threads),  # type: ignore[arg-type]
+    )
+
+
+def run_local(timer: StageTimer, catalog: Catalog, args: Namespace):
+    """Load the catalog into PostgreSQL and run the stages against the configured services.
+
+    - The index versions written by the run are deleted afterwards, even if the run fails
+
+    Args:
+        timer: Collector of measurements.
+        catalog: Synthetic catalog.
+        args: Command line arguments.
+    """
+    generate(timer, catalog)
+    dsn = {**POSTGRES_PARAMS, 'options': '-c search_path={0}'.format(SCHEMA)}
+    with get_postgres_pool(1, 2, POSTGRES_HEALTH_CHECK_INTERVAL, **dsn) as postgres_pool:
+        with get_redis(**REDIS_PARAMS) as redis_conn, get_elastic(**ELASTIC_PARAMS) as elastic_conn:
+            with get_loader(elastic_conn, args.bulk_threads) as loader:
+                run_stages(
+                    timer,
+                    PostgresExtractor(postgres_pool, movie_query=args.movie_query),
+                    DataTransform(redis_conn),
+                    loader,
+                )
+
+
+def generate(timer: StageTimer, catalog: Catalog):
+    """Load the catalog into its own schema of the configured PostgreSQL.
+
+    Args:
+        timer: Collector of measurements.
+        catalog: Synthetic catalog.
+    """
+    with get_postgres(**POSTGRES_PARAMS) as postgres_conn:
+        with timer.measure('generate', catalog.films):
+            catalog.load(postgres_conn, SCHEMA)
+
+
+@contextmanager
+def get_loader(elastic_conn: Elasticsearch, threads: int) -> Iterator[ElasticsearchLoader]:
+    """Create a loader writing into new index versions and delete them afterwards.
+
+    Args:
+        elastic_conn: Connection to Elasticsearch.
+        threads: Threads sending bulk requests.
+
+    Yields:
+        ElasticsearchLoader: Loader in reindex mode.
+    """
+    loader = ElasticsearchLoader(elastic_conn, threads=threads, reindex=True)
+    versions = ','.join(loader.targets.values())
+    with ExitStack() as cleanup:
+        cleanup.callback(elastic_conn.indices.delete, index=versions)
+        yield loader
+
+
+def parse_args() -> Namespace:
+    """Parse the command line arguments.
+
+    Returns:
+        Namespace: Command line arguments.
+    """
+    parser = ArgumentParser(description='Benchmark the ETL stages on a synthetic catalog.')
+    parser.add_argument('--films', type=int, default=DEFAULT_FILMS, help='Number of films in the catalog.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the catalog generator.')
+    parser.add_argument('--backend', choices=('fake', 'local'), default='fake', help='Backends to run against.')
+    parser.add_argument('--movie-query', choices=('aggregated', 'joined'), default='aggregated')
+    parser.add_argument('--bulk-threads', type=int, default=1, help='Threads sending bulk requests.')
+    parser.add_argument('--output', help='File for the JSON report instead of the standard output.')
+    return parser.parse_args()
+
+
+def main():
+    """Run the benchmark and write the report."""
+    args = parse_args()
+    report = json.dumps(benchmark(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(report)
+    else:
+        sys.stdout.write('{0}\n'.format(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
-from typing import Type, Union
+from datetime import datetime
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Tuple, Type, Union
 
 from psycopg2.extras import DictRow
 
@@ -17,6 +19,106 @@ REDIS_PARAMS = RedisSettings(_env_file='.env').dict()  # type: ignore[call-arg]
 
 BATCH_SIZE = 100
 
-PostgresRow = DictRow
+EXTRACT_BATCH_MIN = 10
+
+EXTRACT_BATCH_MAX = 1000
+
+EXTRACT_BATCH_TARGET = 0.5
+
+EXTRACT_BATCH_STEP = 10
+
+MOVIE_BATCH_MIN = 10
+
+MOVIE_BATCH_MAX = 1000
+
+MOVIE_BATCH_TARGET = 1.0
+
+MOVIE_BATCH_STEP = 10
+
+ITERSIZE = 1000
+
+PAGE_SIZE = 10000
+
+SNAPSHOT_BATCH_SIZE = 1000
+
+POSTGRES_POOL_MIN = 1
+
+POSTGRES_POOL_MAX = 4
+
+POSTGRES_HEALTH_CHECK_INTERVAL = 30
+
+REDIS_MAX_CONNECTIONS = 32
+
+REDIS_HEALTH_CHECK_INTERVAL = 30
+
+ELASTIC_MAXSIZE = 16
+
+BULK_THREADS = 4
+
+BULK_CHUNK_SIZE = 500
+
+BULK_CHUNK_MIN = 50
+
+BULK_CHUNK_MAX = 5000
+
+BULK_CHUNK_TARGET = 1.0
+
+BULK_CHUNK_STEP = 50
+
+BULK_MAX_CHUNK_BYTES = 10 * 1024 * 1024
+
+BULK_MAX_RETRIES = 5
+
+BULK_INITIAL_BACKOFF = 1
+
+BULK_MAX_BACKOFF = 60
+
+PIPELINE_QUEUE_SIZE = 4
+
+SUBMIT_WINDOW = 2
+
+ASYNC_CONCURRENCY = 8
+
+NOTIFY_CHANNEL = 'etl_changes'
+
+NOTIFY_DELAY = 1.0
+
+NOTIFY_MAX_CHANGES = 10000
+
+SWEEP_INTERVAL = 600
+
+RECONCILE_INTERVAL = 3600
+
+LEASE_TTL = 30
+
+LEASE_RENEW_INTERVAL = 10
+
+EXTRACT_LEASE = 'extract'
+
+RECONCILE_PAGE_SIZE = 10000
+
+REPLICATION_SLOT = 'postgres_to_elastic'
+
+REPLICATION_FEEDBACK_INTERVAL = 10
+
+METRICS_PORT = 8000
+
+FINGERPRINT_CACHE_SIZE = 1000000
+
+FINGERPRINT_DIGEST_SIZE = 16
+
+NAME_CACHE_SIZE = 100000
+
+SPOOL_SEGMENT_BYTES = 67108864
+
+SPOOL_REPLAY_INTERVAL = 10
+
+VALIDATION_SAMPLE_RATE = 0.01
+
+PostgresRow = Union[DictRow, Dict[str, Any]]
+
+Watermark = Tuple[Union[datetime, str], str]
 
 Schemas = Union[Type[Genre], Type[Person], Type[Movie]]
+
+TABLE_SCHEMAS: Mapping[str, Schemas] = MappingProxyType({'film_work': Movie, 'person': Person, 'genre': Genre})
@@ -1,8 +1,14 @@
+import asyncio
+import inspect
 import time
 from functools import wraps
-from typing import Any, Callable, Tuple
+from types import GeneratorType
+from typing import Any, Callable, Iterator, Tuple
+
+from prometheus_client import Histogram
 
 from core.logger import logger
+from core.metrics import RETRIES, STAGE_LATENCY
 
 
 def backoff(errors: Tuple, start_sleep_time=0.1, factor=2, border_sleep_time=10) -> Callable:
@@ -19,6 +25,8 @@ def backoff(errors: Tuple, start_sleep_time=0.1, factor=2, border_sleep_time=10)
         Callable: The decorated function.
     """
     def decorator(func) -> Callable:
+        retries = RETRIES.labels(func.__qualname__)
+
         @wraps(func)
         def wrapper(*args, **kwargs) -> Any:
             delay = start_sleep_time
@@ -27,6 +35,7 @@ def backoff(errors: Tuple, start_sleep_time=0.1, factor=2, border_sleep_time=10)
                     conn = func(*args, **kwargs)
                 except errors as message:
                     logger.error('Connection failed: {0}!'.format(message))
+                    retries.inc()
                     if delay < border_sleep_time:
                         delay *= 2
                     logger.error('Reconnecting in {0} seconds.'.format(delay))
@@ -35,3 +44,111 @@ def backoff(errors: Tuple, start_sleep_time=0.1, factor=2, border_sleep_time=10)
                     return conn
         return wrapper
     return decorator
+
+
+def async_backoff(errors: Tuple, start_sleep_time=0.1, factor=2, border_sleep_time=10) -> Callable:
+    """
+    Retry a coroutine function after a certain period if an error occurs, without blocking the event loop.
+
+    Args:
+        errors: Errors to be handled.
+        start_sleep_time: Initial retry time.
+        factor: How many times to increase the waiting time.
+        border_sleep_time: Maximum waiting time.
+
+    Returns:
+        Callable: The decorated function.
+    """
+    def decorator(func) -> Callable:
+        retries = RETRIES.labels(func.__qualname__)
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs) -> Any:
+            delay = start_sleep_time
+            while True:
+                try:
+                    return await func(*args, **kwargs)
+                except errors as message:
+                    logger.error('Connection failed: {0}!'.format(message))
+                    retries.inc()
+                    if delay < border_sleep_time:
+                        delay *= factor
+                    logger.error('Reconnecting in {0} seconds.'.format(delay))
+                    await asyncio.sleep(delay)
+        return wrapper
+    return decorator
+
+
+def timed(stage: str) -> Callable:
+    """
+    Record the latency of a function in the histogram of an ETL stage.
+
+    - For functions returning generators, records the time spent producing all of their items
+    - For coroutine functions, records the time until the coroutine completes
+
+    Args:
+        stage: Stage name.
+
+    Returns:
+        Callable: The decorated function.
+    """
+    histogram = STAGE_LATENCY.labels(stage)
+
+    def decorator(func) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            return timed_coroutine(func, histogram)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs) -> Any:
+            start = time.perf_counter()
+            returned = func(*args, **kwargs)
+            if isinstance(returned, GeneratorType):
+                return timed_generator(returned, histogram, time.perf_counter() - start)
+            histogram.observe(time.perf_counter() - start)
+            return returned
+        return wrapper
+    return decorator
+
+
+def timed_coroutine(func: Callable, histogram: Histogram) -> Callable:
+    """
+    Record the time taken by each call of a coroutine function, including the time it waits.
+
+    Args:
+        func: Coroutine function.
+        histogram: Histogram of the stage.
+
+    Returns:
+        Callable: The decorated coroutine function.
+    """
+    @wraps(func)
+    async def wrapper(*args, **kwargs) -> Any:
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start)
+    return wrapper
+
+
+def timed_generator(generator: Iterator, histogram: Histogram, elapsed: float) -> Iterator:
+    """
+    Yield the items of a generator and record the time spent producing them.
+
+    Args:
+        generator: Generator.
+        histogram: Histogram of the stage.
+        elapsed: Time already spent creating the generator.
+
+    Yields:
+        Any: Items of the generator.
+    """
+    while True:
+        start = time.perf_counter()
+        try:
+            value = next(generator)
+        except StopIteration:
+            histogram.observe(elapsed + time.perf_counter() - start)
+            return
+        elapsed += time.perf_counter() - start
+        yield value
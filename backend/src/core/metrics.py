@@ -0,0 +1,59 @@
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from core.config import Watermark
+
+BY_INDEX = ('index',)
+
+ROWS_EXTRACTED = Counter('etl_rows_extracted_total', 'Rows extracted from PostgreSQL.', ['table'])
+
+DOCUMENTS_INDEXED = Counter('etl_documents_indexed_total', 'Documents indexed in Elasticsearch.', BY_INDEX)
+
+DOCUMENTS_SKIPPED = Counter('etl_documents_skipped_total', 'Unchanged documents not sent to Elasticsearch.', BY_INDEX)
+
+DOCUMENTS_UPDATED = Counter('etl_documents_updated_total', 'Documents updated in place by scripts.', BY_INDEX)
+
+DOCUMENTS_DELETED = Counter('etl_documents_deleted_total', 'Documents deleted from Elasticsearch.', BY_INDEX)
+
+BULK_ERRORS = Counter('etl_bulk_errors_total', 'Bulk items rejected by Elasticsearch.', BY_INDEX)
+
+RETRIES = Counter('etl_retries_total', 'Retries after connection errors.', ['function'])
+
+STAGE_LATENCY = Histogram('etl_stage_seconds', 'Latency of the ETL stages.', ['stage'])
+
+WATERMARK_LAG = Gauge('etl_watermark_lag_seconds', 'Age of the last loaded row of each table.', ['table'])
+
+QUEUE_SIZE = Gauge('etl_queue_size', 'Movies waiting to be loaded.', ['queue'])
+
+SPOOLED_ACTIONS = Counter('etl_spooled_actions_total', 'Bulk actions written to the disk spool.', BY_INDEX)
+
+SPOOL_BYTES = Gauge('etl_spool_bytes', 'Size of the bulk actions waiting in the disk spool.')
+
+BATCH_SIZE_CURRENT = Gauge('etl_batch_size', 'Current batch size of each adaptive stage.', ['stage'])
+
+
+def observe_watermark(table: str, watermark: Watermark):
+    """Update the lag between the current time and the last loaded row of a table.
+
+    Args:
+        table: Table name.
+        watermark: Position of the last loaded row.
+    """
+    modified = watermark[0]
+    if isinstance(modified, datetime):
+        lag = datetime.now(timezone.utc) - modified
+        WATERMARK_LAG.labels(table).set(lag.total_seconds())
+
+
+def observe_indexed(index: str, total: int, errors: List[Dict]):
+    """Count the documents that were indexed and the ones that failed.
+
+    Args:
+        index: Index name.
+        total: Number of documents sent.
+        errors: Items that Elasticsearch failed to index.
+    """
+    DOCUMENTS_INDEXED.labels(index).inc(total - len(errors))
+    BULK_ERRORS.labels(index).inc(len(errors))
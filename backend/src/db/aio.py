@@ -0,0 +1,116 @@
+import json
+import shlex
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+
+import asyncpg
+from elasticsearch import AsyncElasticsearch
+from redis.asyncio import Redis
+
+from db.elastic import get_hosts
+
+
+def get_server_settings(options: str) -> Dict[str, str]:
+    """
+    Convert libpq connection options, e.g. '-c search_path=content', into server settings.
+
+    Args:
+        options (str): Connection options.
+
+    Returns:
+        Dict: Server settings.
+    """
+    words = shlex.split(options)
+    pairs = zip(words, words[1:])
+    settings = [setting for flag, setting in pairs if flag == '-c']
+    return dict(setting.partition('=')[::2] for setting in settings)
+
+
+async def init_connection(conn: asyncpg.Connection):
+    """
+    Decode JSON columns into Python objects, as psycopg2 does.
+
+    Args:
+        conn (asyncpg.Connection): New connection of the pool.
+    """
+    codec = {'encoder': json.dumps, 'decoder': json.loads, 'schema': 'pg_catalog'}
+    await conn.set_type_codec('json', **codec)
+    await conn.set_type_codec('jsonb', **codec)
+
+
+@asynccontextmanager
+async def get_async_postgres(dbname: str, options: str, size: int, **dsn) -> AsyncIterator[asyncpg.Pool]:
+    """
+    Context manager function for opening a pool of asynchronous connections to a PostgreSQL database.
+
+    Args:
+        dbname (str): Database name.
+        options (str): Connection options.
+        size (int): Maximum number of connections.
+        dsn: Other parameters for connecting to the database (user, password, host and port)
+
+    Yields:
+        asyncpg.Pool: Pool of connections.
+    """
+    pool = await asyncpg.create_pool(
+        database=dbname,
+        server_settings=get_server_settings(options),
+        init=init_connection,
+        min_size=1,
+        max_size=size,
+        **dsn,
+    )
+    try:
+        yield pool
+    finally:
+        await pool.close()
+
+
+@asynccontextmanager
+async def get_async_redis(db: int, host: str, port: int) -> AsyncIterator[Redis]:
+    """
+    Context manager function for connecting to a Redis database with an asynchronous client.
+
+    Args:
+        db (int): The database number.
+        host (str): The host for connecting to the database.
+        port (int): The port.
+
+    Yields:
+        Redis: A connection to the database.
+    """
+    redis = Redis(db=db, host=host, port=port)
+    try:
+        yield redis
+    finally:
+        await redis.close()
+
+
+@asynccontextmanager
+async def get_async_elastic(
+    host: str, port: int, hosts: str = '', sniff: bool = False, maxsize: int = 10,
+) -> AsyncIterator[AsyncElasticsearch]:
+    """
+    Context manager function for connecting to the Elasticsearch database with an asynchronous client.
+
+    Args:
+        host (str): The node to connect to the database.
+        port (int): The port.
+        hosts (str): Comma-separated nodes as 'host:port', used instead of the single node.
+        sniff (bool): Discover the nodes of the cluster.
+        maxsize (int): Maximum number of connections per node.
+
+    Yields:
+        AsyncElasticsearch: A connection to the database.
+    """
+    elastic = AsyncElasticsearch(
+        hosts=get_hosts(host, port, hosts),
+        maxsize=maxsize,
+        retry_on_timeout=True,
+        sniff_on_start=sniff,
+        sniff_on_connection_fail=sniff,
+    )
+    try:
+        yield elastic
+    finally:
+        await elastic.close()
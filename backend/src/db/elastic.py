@@ -1,19 +1,59 @@
+from types import MappingProxyType
+from typing import Dict, List
+
 from elasticsearch import Elasticsearch
 from pydantic import BaseSettings, Field
 
+TRANSPORT_DEFAULTS = MappingProxyType({'maxsize': 10, 'timeout': 30})
+
 
-def get_elastic(host: str, port: int) -> Elasticsearch:
+def get_hosts(host: str, port: int, hosts: str = '') -> List[Dict]:
+    """
+    Return the nodes of the cluster.
+
+    Args:
+        host (str): The node to connect to the database.
+        port (int): The port.
+        hosts (str): Comma-separated nodes as 'host:port', used instead of the single node.
+
+    Returns:
+        List: Nodes with their hosts and ports.
+    """
+    if not hosts:
+        return [{'host': host, 'port': port}]
+    nodes = []
+    for node in hosts.split(','):
+        node_host, _, node_port = node.strip().partition(':')
+        nodes.append({'host': node_host, 'port': int(node_port or port)})
+    return nodes
+
+
+def get_elastic(host: str, port: int, hosts: str = '', sniff: bool = False, **transport_options) -> Elasticsearch:
     """
     Connect to the Elasticsearch database.
 
+    - Keeps a pool of up to `maxsize` persistent HTTP connections per node
+    - With sniffing, discovers the nodes of the cluster on start, periodically and after a node fails
+
     Args:
         host (str): The node to connect to the database.
         port (int): The port.
+        hosts (str): Comma-separated nodes as 'host:port', used instead of the single node.
+        sniff (bool): Discover the nodes of the cluster.
+        transport_options: Options of the transport overriding the defaults,
+            such as `maxsize` (connections per node) and `timeout` (request timeout in seconds).
 
     Returns:
         Elasticsearch: A connection to the database.
     """
-    return Elasticsearch(host=host, port=port)
+    return Elasticsearch(
+        hosts=get_hosts(host, port, hosts),
+        retry_on_timeout=True,
+        sniff_on_start=sniff,
+        sniff_on_connection_fail=sniff,
+        sniffer_timeout=60 if sniff else None,
+        **{**TRANSPORT_DEFAULTS, **transport_options},
+    )
 
 
 class ElasticSettings(BaseSettings):
@@ -21,3 +61,5 @@ class ElasticSettings(BaseSettings):
 
     host: str = Field(default='localhost', env='elastic_host')
     port: int = Field(default=9200, env='elastic_port')
+    hosts: str = Field(default='', env='elastic_hosts')
+    sniff: bool = Field(default=False, env='elastic_sniff')
@@ -1,11 +1,16 @@
+import threading
+import time
 from contextlib import contextmanager
-from typing import Iterator
+from typing import Dict, Iterator, List, Set, Tuple
 
 import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
 from psycopg2.extensions import connection as _connection
-from psycopg2.extras import DictCursor
+from psycopg2.extras import DictConnection, DictCursor, LogicalReplicationConnection
 from pydantic import BaseSettings, Field
 
+CONNECTION_ERRORS = (psycopg2.InterfaceError, psycopg2.OperationalError)
+
 
 @contextmanager
 def get_postgres(**dsn) -> Iterator[_connection]:
@@ -24,6 +29,206 @@ def get_postgres(**dsn) -> Iterator[_connection]:
     conn.close()
 
 
+@contextmanager
+def get_replication(**dsn) -> Iterator[LogicalReplicationConnection]:
+    """
+    Context manager function for opening a logical replication connection to a PostgreSQL database.
+
+    Args:
+        dsn: Parameters for connecting to the database (Data Source Name)
+
+    Yields:
+        LogicalReplicationConnection: Replication connection
+    """
+    conn = psycopg2.connect(connection_factory=LogicalReplicationConnection, **dsn)
+    yield conn
+    conn.close()
+
+
+def is_alive(conn: _connection) -> bool:
+    """
+    Check that the server still responds on a connection.
+
+    Args:
+        conn: Database connection
+
+    Returns:
+        bool: True if the connection works
+    """
+    try:
+        with conn.cursor() as curs:
+            curs.execute('SELECT 1;')
+            conn.rollback()
+    except CONNECTION_ERRORS:
+        return False
+    return True
+
+
+def reset(conn: _connection) -> bool:
+    """
+    Roll back the open transaction of a connection, so that it can be reused.
+
+    Args:
+        conn: Database connection
+
+    Returns:
+        bool: True if the connection can be reused
+    """
+    if conn.closed:
+        return False
+    if conn.info.transaction_status == TRANSACTION_STATUS_IDLE:
+        return True
+    try:
+        conn.rollback()
+    except CONNECTION_ERRORS:
+        return False
+    return True
+
+
+class PostgresPool(object):
+    """Thread-safe pool of PostgreSQL connections that replaces broken connections.
+
+    - Threads wait for a free connection instead of failing when all of them are checked out
+    - Returned connections are kept open for reuse, so no more than `maxconn` connections are open at a time
+    """
+
+    def __init__(self, minconn: int, maxconn: int, health_check_interval: float, **dsn):
+        """
+        Open the minimum number of connections.
+
+        Args:
+            minconn: Number of connections opened in advance
+            maxconn: Maximum number of connections
+            health_check_interval: Idle time in seconds after which a connection is checked before use
+            dsn: Parameters for connecting to the database (Data Source Name)
+        """
+        self.dsn = dsn
+        self.health_check_interval = health_check_interval
+        opened = time.monotonic()
+        self.idle: List[Tuple[DictConnection, float]] = [
+            (psycopg2.connect(connection_factory=DictConnection, **dsn), opened) for _ in range(minconn)
+        ]
+        self.prepared: Dict[DictConnection, Set[str]] = {}
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(maxconn)
+
+    @contextmanager
+    def connection(self) -> Iterator[DictConnection]:
+        """
+        Check out a live connection and return it to the pool.
+
+        - A connection that raised a connection error is closed and replaced by a new one on the next checkout
+        - An open transaction is rolled back when the connection is returned
+
+        Yields:
+            DictConnection: Database connection
+        """
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, broken)
+
+    def getconn(self) -> DictConnection:
+        """
+        Take the most recently returned connection, replacing the ones that are closed or no longer respond.
+
+        - A new connection is opened when none is idle
+
+        Returns:
+            DictConnection: Database connection
+        """
+        self.slots.acquire()
+        try:
+            while True:
+                with self.lock:
+                    conn, returned = self.idle.pop() if self.idle else (None, 0)
+                if conn is None:
+                    return psycopg2.connect(connection_factory=DictConnection, **self.dsn)
+                if time.monotonic() - returned < self.health_check_interval or is_alive(conn):
+                    return conn
+                self.discard(conn)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn: DictConnection, broken: bool = False):
+        """
+        Return a connection to the pool.
+
+        Args:
+            conn: Database connection
+            broken: Close the connection instead of reusing it
+        """
+        if not broken and reset(conn):
+            with self.lock:
+                self.idle.append((conn, time.monotonic()))
+        else:
+            self.discard(conn)
+        self.slots.release()
+
+    def discard(self, conn: DictConnection):
+        """
+        Close a connection and forget the statements prepared on it.
+
+        Args:
+            conn: Database connection
+        """
+        with self.lock:
+            self.prepared.pop(conn, None)
+        if not conn.closed:
+            conn.close()
+
+    def prepare(self, conn: DictConnection, name: str, statement: str):
+        """
+        Prepare a statement on a connection unless it has already been prepared there.
+
+        - Prepared statements live as long as the connection, so each of them is planned once per connection
+
+        Args:
+            conn: Database connection
+            name: Statement name
+            statement: Statement with parameters as $1, $2, ...
+        """
+        with self.lock:
+            prepared = self.prepared.setdefault(conn, set())
+        if name not in prepared:
+            with conn.cursor() as curs:
+                curs.execute('PREPARE {name} AS {statement}'.format(name=name, statement=statement))
+            prepared.add(name)
+
+    def close(self):
+        """Close the idle connections."""
+        with self.lock:
+            idle = self.idle
+            self.idle = []
+        for conn, _ in idle:
+            self.discard(conn)
+
+
+@contextmanager
+def get_postgres_pool(minconn: int, maxconn: int, health_check_interval: float, **dsn) -> Iterator[PostgresPool]:
+    """
+    Context manager function for opening a pool of connections to a PostgreSQL database.
+
+    Args:
+        minconn: Number of connections kept open
+        maxconn: Maximum number of connections
+        health_check_interval: Idle time in seconds after which a connection is checked before use
+        dsn: Parameters for connecting to the database (Data Source Name)
+
+    Yields:
+        PostgresPool: Pool of connections
+    """
+    pool = PostgresPool(minconn, maxconn, health_check_interval, **dsn)
+    yield pool
+    pool.close()
+
+
 class PostgresSettings(BaseSettings):
     """
     Class for validating connection settings to PostgreSQL.
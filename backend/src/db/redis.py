@@ -1,20 +1,38 @@
 from pydantic import BaseSettings, Field
-from redis import Redis
+from redis import ConnectionPool, Redis
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError, TimeoutError
+from redis.retry import Retry
 
 
-def get_redis(db: int, host: str, port: int) -> Redis:
+def get_redis(db: int, host: str, port: int, retries: int = 3, **pool_options) -> Redis:
     """
-    Connect to a Redis database.
+    Connect to a Redis database through a pool of connections.
+
+    - Idle connections are pinged before use once `health_check_interval` seconds have passed
+    - Commands failing on a broken connection are retried on a new one
 
     Args:
         db (int): The database number.
         host (str): The host for connecting to the database.
         port (int): The port.
+        retries (int): Number of retries of a command after a connection error.
+        pool_options: Options of the pool, such as `max_connections` and `health_check_interval`
+            (idle time in seconds after which a connection is checked).
 
     Returns:
         Redis: A connection to the database.
     """
-    return Redis(db=db, host=host, port=port)
+    pool = ConnectionPool(
+        db=db,
+        host=host,
+        port=port,
+        socket_keepalive=True,
+        retry=Retry(ExponentialBackoff(cap=10, base=0.1), retries),
+        retry_on_error=[ConnectionError, TimeoutError],
+        **pool_options,
+    )
+    return Redis(connection_pool=pool)
 
 
 class RedisSettings(BaseSettings):
@@ -1,84 +1,985 @@
+import random
 import time
-from datetime import datetime
+from argparse import ArgumentParser, Namespace
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
 from elasticsearch import Elasticsearch
-from psycopg2.extensions import connection
-from pytz import timezone
+from elasticsearch.helpers import BulkIndexError
+from prometheus_client import start_http_server
+from psycopg2 import InterfaceError, OperationalError
 from redis import Redis
 
 from services import extract, load, transform
-from services.state import RedisStorage, State
-from core.config import ELASTIC_PARAMS, POSTGRES_PARAMS, REDIS_PARAMS
+from services.cache import FingerprintCache
+from services.lease import LeaseManager
+from services.listen import ChangeListener, Changes
+from services.pipeline import Pipeline, Stage
+from services.reconcile import Reconciler
+from services.snapshot import SnapshotExtractor
+from services.spool import Spool
+from services.replication import ReplicationExtractor
+from services.state import WATERMARKS_KEY, RedisStorage, State, read_watermarks
+from services.workers import TransformPool, get_pool
+from core.config import (
+    BULK_THREADS,
+    ELASTIC_MAXSIZE,
+    ELASTIC_PARAMS,
+    EXTRACT_LEASE,
+    METRICS_PORT,
+    POSTGRES_HEALTH_CHECK_INTERVAL,
+    POSTGRES_PARAMS,
+    POSTGRES_POOL_MAX,
+    POSTGRES_POOL_MIN,
+    REDIS_HEALTH_CHECK_INTERVAL,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_PARAMS,
+    REPLICATION_FEEDBACK_INTERVAL,
+    SPOOL_REPLAY_INTERVAL,
+    SWEEP_INTERVAL,
+    TABLE_SCHEMAS,
+    VALIDATION_SAMPLE_RATE,
+    Schemas,
+    Watermark,
+)
+from core.decorators import backoff, timed
 from core.logger import logger
+from core.metrics import observe_watermark
 from db.elastic import get_elastic
-from db.postgres import get_postgres
+from db.postgres import PostgresPool, get_postgres, get_postgres_pool, get_replication
 from db.redis import get_redis
 from models.genre import Genre
 from models.movie import Movie
 from models.person import Person
 
+QUEUE = 'movie_ids'
 
+RENAMED_TABLES = ('person', 'genre')
+
+MovieBatch = Tuple[Dict[str, Dict], List]
+
+Sources = Dict[str, Dict]
+
+
+def get_id(row: Dict) -> str:
+    """Return the ID of a row or document as a string.
+
+    Args:
+        row: Row or document.
+
+    Returns:
+        str: ID.
+    """
+    return str(row['id'])
+
+
+@contextmanager
+def log_outcome(not_found: str) -> Iterator[None]:
+    """Log the end of a run that found no updates or failed to load some documents, instead of raising.
+
+    - Documents that failed to load stay unacknowledged and are taken back by the next run
+
+    Args:
+        not_found: Message logged when no updates are found.
+
+    Yields:
+        None: Runs the block.
+    """
+    try:
+        yield
+    except extract.UpdatesNotFoundError:
+        logger.info(not_found)
+    except BulkIndexError as error:
+        logger.error(error.args[0])
+
+
+@backoff(errors=(InterfaceError, OperationalError))
 def etl_process(
     postgres: extract.PostgresExtractor,
     data: transform.DataTransform,
     elastic: load.ElasticsearchLoader,
     state: State,
+    queue: str = QUEUE,
+    workers: int = 0,
+    pool: Optional[TransformPool] = None,
+    leases: Optional[LeaseManager] = None,
 ):
     """Run the internal components of the Extract-Transform-Load (ETL) process.
 
+    - Runs again from the saved watermarks if the connection to PostgreSQL fails while updates are streamed
+
     Args:
         postgres: Extracts data from PostgreSQL.
         data: Transforms and stores intermediate data.
         elastic: Loads data into Elasticsearch.
         state: System state.
+        queue: Key of the movies to be updated.
+        workers: Number of threads building and loading movies, or 0 to run serially.
+        pool: Worker processes building movies, used instead of threads.
+        leases: Claims the shards of the movies shared with other instances.
+    """
+    elastic.replay_spool()
+    watermarks = read_watermarks(state.data, postgres.TABLES, postgres.INITIAL_WATERMARK)
+    try:
+        for table, rows in postgres.get_updates(watermarks):
+            process_updates(postgres, data, elastic, table, rows, queue)
+            watermarks[table] = extract.get_watermark(rows)
+            state.write_state(WATERMARKS_KEY, watermarks)
+            observe_watermark(table, watermarks[table])
+    except extract.UpdatesNotFoundError:
+        load_movies(postgres, data, elastic, queue, workers, pool, leases)
+        raise
+    load_movies(postgres, data, elastic, queue, workers, pool, leases)
+
+
+def process_updates(
+    postgres: extract.PostgresExtractor,
+    data: transform.DataTransform,
+    elastic: load.ElasticsearchLoader,
+    table: str,
+    rows: List,
+    queue: str,
+):
+    """Load a batch of updated persons or genres and collect the movies affected by the batch.
+
+    - With partial updates, renamed persons and genres are updated inside the movies by Elasticsearch
+      and only the rows that cannot be updated in place are collected for a rebuild
+
+    Args:
+        postgres: Extracts data from PostgreSQL.
+        data: Transforms and stores intermediate data.
+        elastic: Loads data into Elasticsearch.
+        table: Table name.
+        rows: Batch of updated rows.
+        queue: Key of the movies to be updated.
+    """
+    if table in RENAMED_TABLES and elastic.partial_updates and not elastic.targets:
+        rows = rename_movies(postgres, elastic, table, rows)
+    elif table in RENAMED_TABLES:
+        load.check_errors(elastic.bulk_insert(TABLE_SCHEMAS[table], rows))
+    if rows:
+        film_works = postgres.get_film_work_ids(table, rows)
+        data.collector(queue, map(get_id, film_works))
+
+
+def rename_movies(
+    postgres: extract.PostgresExtractor,
+    elastic: load.ElasticsearchLoader,
+    table: str,
+    rows: List,
+) -> List:
+    """Load a batch of updated persons or genres and update their names inside the movies in place.
+
+    - Rows with unchanged names, such as genre description changes, do not touch the movies
+    - Rows missing in the index and directors, which are stored in movies without IDs, need a rebuild
+
+    Args:
+        postgres: Extracts data from PostgreSQL.
+        elastic: Loads data into Elasticsearch.
+        table: Table name, 'person' or 'genre'.
+        rows: Batch of updated rows.
+
+    Returns:
+        List: Rows whose movies must be rebuilt.
     """
-    timestamp = state.read_state('last_updated', datetime.min)
-    for table, rows in postgres.get_updates(timestamp):
-        if table == 'person':
-            elastic.bulk_insert(Person, rows)
-        if table == 'genre':
-            elastic.bulk_insert(Genre, rows)
-        for row in postgres.get_film_work_ids(table, rows):
-            data.collector('movie_ids', row['id'])
-    for movies in data.batcher('movie_ids'):
-        for row in postgres.get_movie_data(movies.keys()):
-            data.parser(row, movies.get(row['id']))
-        elastic.bulk_insert(Movie, movies.values())
-
-
-def postgres_to_elastic(postgres: connection, elastic: Elasticsearch, redis: Redis):
+    schema = TABLE_SCHEMAS[table]
+    previous = elastic.get_sources(schema._index, map(get_id, rows))
+    load.check_errors(elastic.bulk_insert(schema, rows))
+    missing = [row for row in rows if get_id(row) not in previous]
+    if table == 'person':
+        return missing + rename_persons(postgres, elastic, rows, previous)
+    rename_genres(elastic, rows, previous)
+    return missing
+
+
+def rename_persons(
+    postgres: extract.PostgresExtractor,
+    elastic: load.ElasticsearchLoader,
+    rows: List,
+    previous: Sources,
+) -> List:
+    """Update the names of renamed persons inside the movies they act in or write.
+
+    Args:
+        postgres: Extracts data from PostgreSQL.
+        elastic: Loads data into Elasticsearch.
+        rows: Batch of updated persons.
+        previous: Documents of the persons before the update by ID.
+
+    Returns:
+        List: Renamed directors, whose movies must be rebuilt.
+    """
+    renamed = get_renamed(rows, previous, 'full_name')
+    directors = postgres.get_director_ids(renamed)
+    names = {
+        person_id: renamed[person_id]
+        for person_id in renamed.keys() - directors
+    }
+    logger.info('Renamed {0} person rows in {1} movies.'.format(
+        len(names), elastic.rename_persons(names),
+    ))
+    return [row for row in rows if get_id(row) in directors]
+
+
+def rename_genres(elastic: load.ElasticsearchLoader, rows: List, previous: Sources):
+    """Update the names of renamed genres inside movies.
+
+    Args:
+        elastic: Loads data into Elasticsearch.
+        rows: Batch of updated genres.
+        previous: Documents of the genres before the update by ID.
+    """
+    renamed = get_renamed(rows, previous, 'name')
+    names = {
+        previous[genre_id]['name']: name
+        for genre_id, name in renamed.items()
+    }
+    logger.info('Renamed {0} genre rows in {1} movies.'.format(
+        len(names), elastic.rename_genres(names),
+    ))
+
+
+def get_renamed(rows: List, previous: Sources, field: str) -> Dict[str, str]:
+    """Return the new names of the rows whose names differ from their documents.
+
+    Args:
+        rows: Batch of updated rows.
+        previous: Documents of the rows before the update by ID.
+        field: Name field of the rows and documents.
+
+    Returns:
+        Dict: New names by ID.
+    """
+    names = {get_id(row): row[field] for row in rows}
+    return {
+        row_id: name
+        for row_id, name in names.items()
+        if row_id in previous and previous[row_id][field] != name
+    }
+
+
+@backoff(errors=(InterfaceError, OperationalError))
+def process_changes(
+    postgres: extract.PostgresExtractor,
+    data: transform.DataTransform,
+    elastic: load.ElasticsearchLoader,
+    changes: Changes,
+    workers: int = 0,
+    pool: Optional[TransformPool] = None,
+):
+    """Load the rows reported as changed by PostgreSQL notifications.
+
+    - Runs again if the connection to PostgreSQL fails while the rows are streamed
+
+    Args:
+        postgres: Extracts data from PostgreSQL.
+        data: Transforms and stores intermediate data.
+        elastic: Loads data into Elasticsearch.
+        changes: Changed IDs for each table.
+        workers: Number of threads building and loading movies, or 0 to run serially.
+        pool: Worker processes building movies, used instead of threads.
+    """
+    data.collector(QUEUE, changes['film_work'])
+    for table in RENAMED_TABLES:
+        for rows in postgres.get_rows(table, changes[table]):
+            process_updates(postgres, data, elastic, table, rows, QUEUE)
+    load_movies(postgres, data, elastic, QUEUE, workers, pool)
+
+
+def process_deletions(elastic: load.ElasticsearchLoader, deletes: Changes):
+    """Delete the documents of removed rows from the indices.
+
+    Args:
+        elastic: Loads data into Elasticsearch.
+        deletes: Deleted IDs for each table.
+    """
+    for table, ids in deletes.items():
+        if ids:
+            load.check_errors(elastic.bulk_delete(TABLE_SCHEMAS[table]._index, ids))
+
+
+def load_movies(
+    postgres: extract.PostgresExtractor,
+    data: transform.DataTransform,
+    elastic: load.ElasticsearchLoader,
+    queue: str,
+    workers: int = 0,
+    pool: Optional[TransformPool] = None,
+    leases: Optional[LeaseManager] = None,
+):
+    """Build and load the movies collected for the update.
+
+    - With workers, fetching, building and loading run as pipelined stages,
+      so PostgreSQL, Python and Elasticsearch work on different batches at the same time
+    - With a pool of processes, movies are fetched, built and serialized on several cores
+
+    Args:
+        postgres: Extracts data from PostgreSQL.
+        data: Transforms and stores intermediate data.
+        elastic: Loads data into Elasticsearch.
+        queue: Key of the movies to be updated.
+        workers: Number of threads building and loading movies, or 0 to run serially.
+        pool: Worker processes building movies, used instead of threads.
+        leases: Claims the shards of the movies shared with other instances.
+    """
+    if leases:
+        load_shards(postgres, data, elastic, queue, workers, pool, leases)
+        return
+    if pool:
+        pool.load_movies(data, elastic, queue)
+        return
+    fetch = partial(fetch_movies, postgres)
+    build = partial(build_movies, postgres, data)
+    insert = partial(index_movies, data, elastic, queue)
+    if workers:
+        stages = [Stage(fetch), Stage(build, workers), Stage(insert, workers)]
+        Pipeline(stages).run(data.batcher(queue))
+    else:
+        for movies in data.batcher(queue):
+            insert(build(fetch(movies)))
+
+
+def load_shards(
+    postgres: extract.PostgresExtractor,
+    data: transform.DataTransform,
+    elastic: load.ElasticsearchLoader,
+    queue: str,
+    workers: int,
+    pool: Optional[TransformPool],
+    leases: LeaseManager,
+):
+    """Load the shards of the movies that no other instance is loading.
+
+    - Shards are visited in random order, so instances do not contend for the same shard
+    - A claimed shard first takes back the movies left unacknowledged by a dead instance
+
+    Args:
+        postgres: Extracts data from PostgreSQL.
+        data: Transforms and stores intermediate data.
+        elastic: Loads data into Elasticsearch.
+        queue: Key of the movies to be updated.
+        workers: Number of threads building and loading movies, or 0 to run serially.
+        pool: Worker processes building movies, used instead of threads.
+        leases: Claims the shards of the movies shared with other instances.
+    """
+    shard_keys = data.shard_keys(queue)
+    random.shuffle(shard_keys)
+    for shard_key in shard_keys:
+        with leases.lease(shard_key) as claimed:
+            if claimed:
+                load_movies(postgres, data, elastic, shard_key, workers, pool)
+
+
+def index_movies(
+    data: transform.DataTransform,
+    elastic: load.ElasticsearchLoader,
+    queue: str,
+    movies: Dict[str, Dict],
+):
+    """Load a batch of movies into Elasticsearch and acknowledge the ones that were loaded.
+
+    - Movies that were not found in PostgreSQL are skipped
+    - Movies that failed to load stay unacknowledged and are taken back by the next run
+
+    Args:
+        data: Transforms and stores intermediate data.
+        elastic: Loads data into Elasticsearch.
+        queue: Key of the movies to be updated.
+        movies: Movie IDs with movies in dictionary format.
+    """
+    found = [movie for movie in movies.values() if movie['id']]
+    failed = load.get_failed_ids(elastic.bulk_insert(Movie, found))
+    data.acknowledge(queue, set(movies).difference(failed))
+
+
+def fetch_movies(postgres: extract.PostgresExtractor, movies: Dict[str, Dict]) -> MovieBatch:
+    """Fetch the data of a batch of movies from PostgreSQL.
+
+    Args:
+        postgres: Extracts data from PostgreSQL.
+        movies: Movie IDs with the movie model schema.
+
+    Returns:
+        Tuple: Movies with the rows fetched for them.
+    """
+    if postgres.movie_query == 'aggregated':
+        return movies, postgres.get_movie_documents(movies.keys())
+    if postgres.movie_query == 'cached':
+        return movies, postgres.get_cached_movie_documents(movies.keys())
+    return movies, postgres.get_movie_data(movies.keys())
+
+
+@timed('build_movies')
+def build_movies(
+    postgres: extract.PostgresExtractor,
+    data: transform.DataTransform,
+    batch: MovieBatch,
+) -> Dict[str, Dict]:
+    """Build movies from the rows fetched for them.
+
+    Args:
+        postgres: Extracts data from PostgreSQL.
+        data: Transforms and stores intermediate data.
+        batch: Movies with the rows fetched for them.
+
+    Returns:
+        Dict: Movie IDs with movies in dictionary format.
+    """
+    movies, rows = batch
+    if postgres.movie_query == 'joined':
+        data.parse_rows(rows, movies)
+        return movies
+    for row in rows:
+        movies[get_id(row)] = data.build_movie(row)
+    return movies
+
+
+def make_loader(
+    elastic: Elasticsearch,
+    redis: Redis,
+    args: Namespace,
+    reindex: bool = False,
+) -> load.ElasticsearchLoader:
+    """Create a loader configured by the command line arguments.
+
+    - Movies that fail to load when the spool is replayed are put back in the queue of the incremental sync
+
+    Args:
+        elastic: Connection to Elasticsearch.
+        redis: Connection to Redis.
+        args: Command line arguments.
+        reindex: Load into new versions of the indices.
+
+    Returns:
+        ElasticsearchLoader: Loader.
+    """
+    return load.ElasticsearchLoader(
+        elastic,
+        threads=args.bulk_threads,
+        reindex=reindex,
+        fingerprints=FingerprintCache(redis) if args.skip_unchanged else None,
+        validation_rate=args.validation_rate,
+        partial_updates=args.partial_updates,
+        spool=Spool(args.spool) if args.spool else None,
+        requeue=partial(transform.DataTransform(redis, shards=args.shards).collector, QUEUE),
+    )
+
+
+def postgres_to_elastic(
+    postgres: PostgresPool,
+    elastic: Elasticsearch,
+    redis: Redis,
+    args: Namespace,
+    pool: Optional[TransformPool] = None,
+):
     """Load data from PostgreSQL into Elasticsearch.
 
+    - With shards, one instance at a time extracts updates and owns the state, which is read again
+      on every run as another instance may have moved the watermarks, while every instance
+      loads the shards of the movies it has claimed
+
     Args:
-        postgres: Connection to PostgreSQL.
+        postgres: Pool of connections to PostgreSQL.
         elastic: Connection to Elasticsearch.
         redis: Connection to Redis.
+        args: Command line arguments.
+        pool: Worker processes building movies.
     """
-    state = State(RedisStorage(redis))
+    extractor = extract.PostgresExtractor(postgres, movie_query=args.movie_query)
+    data = transform.DataTransform(redis, shards=args.shards)
+    loader = make_loader(elastic, redis, args)
+    leases = LeaseManager(redis) if args.shards else None
+    reconciler = Reconciler(extractor, data, loader) if args.reconcile else None
+    with leases.heartbeat() if leases else nullcontext():
+        while True:
+            with log_outcome('No updates found.'):
+                sync_updates(extractor, data, loader, redis, args, pool, leases, reconciler)
+            logger.info('Retrying in 1 minute.')
+            time.sleep(60)
+
+
+def sync_updates(
+    postgres: extract.PostgresExtractor,
+    data: transform.DataTransform,
+    elastic: load.ElasticsearchLoader,
+    redis: Redis,
+    args: Namespace,
+    pool: Optional[TransformPool],
+    leases: Optional[LeaseManager],
+    reconciler: Optional[Reconciler],
+):
+    """Extract and load the updates if this instance leads, otherwise only load the claimed shards of the movies.
+
+    Args:
+        postgres: Extracts data from PostgreSQL.
+        data: Transforms and stores intermediate data.
+        elastic: Loads data into Elasticsearch.
+        redis: Connection to Redis holding the state.
+        args: Command line arguments.
+        pool: Worker processes building movies.
+        leases: Claims the extraction and the shards of the movies shared with other instances.
+        reconciler: Deletes orphaned documents, if enabled.
+    """
+    with leases.lease(EXTRACT_LEASE) if leases else nullcontext(True) as leader:
+        if not leader:
+            logger.info('Another instance is extracting updates.')
+            load_movies(postgres, data, elastic, QUEUE, args.workers, pool, leases)
+            return
+        if reconciler:
+            reconciler.reconcile_if_due()
+        state = State(RedisStorage(redis))
+        etl_process(postgres, data, elastic, state, workers=args.workers, pool=pool, leases=leases)
+    logger.info('Updates found!')
+
+
+def listen_to_changes(
+    postgres: PostgresPool,
+    elastic: Elasticsearch,
+    redis: Redis,
+    args: Namespace,
+    pool: Optional[TransformPool] = None,
+):
+    """Load changes as soon as PostgreSQL reports them, with a periodic sweep as a safety net.
+
+    - Notifications are received on a separate connection
+    - The timestamp-based sync runs every `SWEEP_INTERVAL` seconds to catch anything missed
+
+    Args:
+        postgres: Pool of connections to PostgreSQL.
+        elastic: Connection to Elasticsearch.
+        redis: Connection to Redis.
+        args: Command line arguments.
+        pool: Worker processes building movies.
+    """
+    extractor = extract.PostgresExtractor(postgres, movie_query=args.movie_query)
+    data = transform.DataTransform(redis)
+    loader = make_loader(elastic, redis, args)
+    sweep = partial(
+        sweep_updates,
+        extractor,
+        data,
+        loader,
+        State(RedisStorage(redis)),
+        args.workers,
+        pool,
+        Reconciler(extractor, data, loader) if args.reconcile else None,
+    )
+    with get_postgres(**POSTGRES_PARAMS) as listen_conn:
+        receive_changes(
+            ChangeListener(listen_conn),
+            loader,
+            sweep,
+            partial(process_changes, extractor, data, loader, workers=args.workers, pool=pool),
+        )
+
+
+def receive_changes(
+    listener: ChangeListener,
+    elastic: load.ElasticsearchLoader,
+    sweep: Callable[[], None],
+    process: Callable[[Changes], None],
+):
+    """Process the notified changes as they arrive and sweep for updates every `SWEEP_INTERVAL` seconds.
+
+    Args:
+        listener: Receives the notifications.
+        elastic: Loads data into Elasticsearch.
+        sweep: Runs the timestamp-based sync.
+        process: Loads the changed rows.
+    """
+    next_sweep = time.monotonic()
     while True:
+        if time.monotonic() >= next_sweep:
+            sweep()
+            next_sweep = time.monotonic() + SWEEP_INTERVAL
+        changes = listener.listen(timeout=next_sweep - time.monotonic())
+        elastic.replay_spool()
+        if any(changes.values()):
+            logger.info('Changes received!')
+            with log_outcome('Notified rows not found.'):
+                process(changes)
+
+
+def sweep_updates(
+    postgres: extract.PostgresExtractor,
+    data: transform.DataTransform,
+    elastic: load.ElasticsearchLoader,
+    state: State,
+    workers: int,
+    pool: Optional[TransformPool],
+    reconciler: Optional[Reconciler],
+):
+    """Run the timestamp-based sync to catch the changes missed by the notifications.
+
+    Args:
+        postgres: Extracts data from PostgreSQL.
+        data: Transforms and stores intermediate data.
+        elastic: Loads data into Elasticsearch.
+        state: System state.
+        workers: Number of threads building and loading movies, or 0 to run serially.
+        pool: Worker processes building movies.
+        reconciler: Deletes orphaned documents, if enabled.
+    """
+    if reconciler:
+        reconciler.reconcile_if_due()
+    with log_outcome('Sweep found no updates.'):
+        etl_process(postgres, data, elastic, state, workers=workers, pool=pool)
+
+
+def replicate_changes(
+    postgres: PostgresPool,
+    elastic: Elasticsearch,
+    redis: Redis,
+    args: Namespace,
+    pool: Optional[TransformPool] = None,
+):
+    """Load changes captured from a logical replication slot, including deletions.
+
+    - Changes are confirmed to PostgreSQL only after they have been loaded into Elasticsearch
+
+    Args:
+        postgres: Pool of connections to PostgreSQL.
+        elastic: Connection to Elasticsearch.
+        redis: Connection to Redis.
+        args: Command line arguments.
+        pool: Worker processes building movies.
+    """
+    extractor = extract.PostgresExtractor(postgres, movie_query=args.movie_query)
+    data = transform.DataTransform(redis)
+    loader = make_loader(elastic, redis, args)
+    process = partial(process_changes, extractor, data, loader, workers=args.workers, pool=pool)
+    with get_replication(**POSTGRES_PARAMS) as replication_conn:
+        receive_replication(ReplicationExtractor(replication_conn), loader, process)
+
+
+def receive_replication(
+    stream: ReplicationExtractor,
+    elastic: load.ElasticsearchLoader,
+    process: Callable[[Changes], None],
+):
+    """Load the changes read from the replication slot and confirm them once they have been loaded.
+
+    - A batch that failed to load is not confirmed, so its changes are read again with the next batch after a pause
+
+    Args:
+        stream: Reads the changes from the replication slot.
+        elastic: Loads data into Elasticsearch.
+        process: Loads the changed rows.
+    """
+    while True:
+        updates, deletes = stream.read_changes(timeout=REPLICATION_FEEDBACK_INTERVAL)
+        elastic.replay_spool()
+        if any(updates.values()) or any(deletes.values()):
+            logger.info('Changes received!')
+            if not load_replicated(elastic, process, updates, deletes):
+                time.sleep(REPLICATION_FEEDBACK_INTERVAL)
+                continue
+        stream.acknowledge()
+
+
+def load_replicated(
+    elastic: load.ElasticsearchLoader,
+    process: Callable[[Changes], None],
+    updates: Changes,
+    deletes: Changes,
+) -> bool:
+    """Load a batch of replicated changes, logging a failure instead of raising.
+
+    Args:
+        elastic: Loads data into Elasticsearch.
+        process: Loads the changed rows.
+        updates: Updated IDs for each table.
+        deletes: Deleted IDs for each table.
+
+    Returns:
+        bool: Whether the batch was loaded.
+    """
+    with log_outcome('Replicated rows not found.'):
+        process(updates)
+        process_deletions(elastic, deletes)
+        return True
+    return False
+
+
+def reindex(
+    postgres: PostgresPool,
+    elastic: Elasticsearch,
+    redis: Redis,
+    args: Namespace,
+    pool: Optional[TransformPool] = None,
+):
+    """Rebuild the indices from scratch and swap them in once they are complete.
+
+    - Documents are loaded into new versions of the indices, so search traffic is not affected
+    - The reindex has its own state, and its watermarks become the starting point of the incremental sync
+    - With a snapshot, the tables are exported with COPY instead of being paged through by the incremental sync
+
+    Args:
+        postgres: Pool of connections to PostgreSQL.
+        elastic: Connection to Elasticsearch.
+        redis: Connection to Redis.
+        args: Command line arguments.
+        pool: Worker processes building movies.
+    """
+    reindex_state = State(RedisStorage(redis, key='reindex'))
+    reindex_state.write_state(WATERMARKS_KEY, {})
+    loader = make_loader(elastic, redis, args, reindex=True)
+    if args.snapshot:
+        reindex_state.write_state(WATERMARKS_KEY, load_snapshot(postgres, transform.DataTransform(redis), loader))
+    else:
         try:
             etl_process(
-                extract.PostgresExtractor(postgres),
+                extract.PostgresExtractor(postgres, movie_query=args.movie_query),
                 transform.DataTransform(redis),
-                load.ElasticsearchLoader(elastic),
-                state,
+                loader,
+                reindex_state,
+                queue='reindex_movie_ids',
+                workers=args.workers,
+                pool=pool,
             )
         except extract.UpdatesNotFoundError:
-            logger.info('No updates found.')
-        else:
-            logger.info('Updates found!')
-            state.write_state('last_updated', datetime.now(tz=timezone('Europe/Moscow')))
-        finally:
-            logger.info('Retrying in 1 minute.')
-            time.sleep(60)
+            logger.info('No data found.')
+    wait_for_spool(loader)
+    loader.swap_indices()
+    State(RedisStorage(redis)).write_state(WATERMARKS_KEY, reindex_state.read_state(WATERMARKS_KEY))
+    logger.info('Reindex completed.')
+
+
+def wait_for_spool(elastic: load.ElasticsearchLoader):
+    """Wait until Elasticsearch has loaded the spooled actions.
+
+    Args:
+        elastic: Loads data into Elasticsearch.
+    """
+    while not elastic.replay_spool():
+        logger.warning('Waiting for Elasticsearch to load the spool before swapping the indices.')
+        time.sleep(SPOOL_REPLAY_INTERVAL)
+
+
+def load_snapshot(
+    postgres: PostgresPool,
+    data: transform.DataTransform,
+    elastic: load.ElasticsearchLoader,
+) -> Dict[str, Watermark]:
+    """Load all genres, persons and movies from a snapshot of PostgreSQL exported with COPY.
+
+    Args:
+        postgres: Pool of connections to PostgreSQL.
+        data: Transforms and stores intermediate data.
+        elastic: Loads data into Elasticsearch.
+
+    Returns:
+        Dict: Watermark of each table at the time of the snapshot.
+    """
+    return SnapshotExtractor(postgres).export({
+        'genre': partial(index_snapshot_rows, elastic, Genre),
+        'person': partial(index_snapshot_rows, elastic, Person),
+        'film_work': partial(index_snapshot_movies, data, elastic),
+    })
+
+
+def index_snapshot_rows(elastic: load.ElasticsearchLoader, schema: Schemas, rows: List[Dict]):
+    """Load a batch of genres or persons from a snapshot.
+
+    Args:
+        elastic: Loads data into Elasticsearch.
+        schema: Schema of the rows.
+        rows: Rows of the table.
+    """
+    load.check_errors(elastic.bulk_insert(schema, rows))
+
+
+def index_snapshot_movies(data: transform.DataTransform, elastic: load.ElasticsearchLoader, rows: List[Dict]):
+    """Build and load a batch of pre-joined movies from a snapshot.
+
+    Args:
+        data: Transforms and stores intermediate data.
+        elastic: Loads data into Elasticsearch.
+        rows: Movies in the shape of the aggregated movie query.
+    """
+    movies = [data.build_movie(row) for row in rows]
+    load.check_errors(elastic.bulk_insert(Movie, movies))
+
+
+def parse_args() -> Namespace:
+    """Parse the command line arguments.
+
+    Returns:
+        Namespace: Command line arguments.
+    """
+    parser = ArgumentParser(description='Synchronize data from PostgreSQL into Elasticsearch.')
+    add_mode_arguments(parser)
+    add_load_arguments(parser)
+    args = parser.parse_args()
+    if args.shards and (args.listen or args.replicate or args.reindex):
+        parser.error('--shards is supported only by the timestamp-based sync.')
+    if args.snapshot and not args.reindex:
+        parser.error('--snapshot is supported only with --reindex.')
+    if args.movie_query == 'cached' and (args.processes or args.shards):
+        parser.error('--movie-query cached needs the updates of names in the same process as the movies.')
+    return args
+
+
+def add_mode_arguments(parser: ArgumentParser):
+    """Add the arguments choosing how changes are found and how instances share the work.
+
+    Args:
+        parser: Command line parser.
+    """
+    add_flag(
+        parser,
+        '--listen',
+        'Load changes reported by PostgreSQL notifications, sweeping for updates periodically.',
+    )
+    add_flag(
+        parser,
+        '--replicate',
+        'Load changes, including deletions, from a logical replication slot decoded by wal2json.',
+    )
+    add_flag(
+        parser,
+        '--reindex',
+        'Rebuild the indices from scratch, swap them in and exit.',
+    )
+    add_flag(
+        parser,
+        '--snapshot',
+        'With --reindex, export the tables from a consistent snapshot with COPY instead of paging through them.',
+    )
+    parser.add_argument(
+        '--shards',
+        type=int,
+        default=0,
+        help='Number of shards of the movie queue shared by several instances of the sync, or 0 for a single one.',
+    )
+    add_flag(
+        parser,
+        '--reconcile',
+        'Periodically delete documents whose rows no longer exist in PostgreSQL.',
+    )
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        default=METRICS_PORT,
+        help='Port of the HTTP endpoint exporting Prometheus metrics, or 0 to disable it.',
+    )
+
+
+def add_load_arguments(parser: ArgumentParser):
+    """Add the arguments tuning how movies are built and loaded.
+
+    Args:
+        parser: Command line parser.
+    """
+    parser.add_argument(
+        '--movie-query',
+        choices=('aggregated', 'joined', 'cached'),
+        default='aggregated',
+        help=(
+            'Fetch movies as one pre-aggregated row per film, as joined rows per person and genre, '
+            'or as link rows with person and genre names from an in-process cache.'
+        ),
+    )
+    parser.add_argument(
+        '--bulk-threads',
+        type=int,
+        default=BULK_THREADS,
+        help='Number of threads sending bulk requests to Elasticsearch.',
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=0,
+        help='Number of threads building and loading movies in a pipeline, or 0 to run serially.',
+    )
+    parser.add_argument(
+        '--processes',
+        type=int,
+        default=0,
+        help='Number of processes fetching, building and serializing movies, or 0 to build them in this process.',
+    )
+    add_flag(
+        parser,
+        '--skip-unchanged',
+        'Skip documents identical to the ones last written, remembering their hashes in Redis.',
+    )
+    parser.add_argument(
+        '--validation-rate',
+        type=float,
+        default=VALIDATION_SAMPLE_RATE,
+        help='Share of documents validated by the models before loading, from 0 to 1 for debug runs.',
+    )
+    add_flag(
+        parser,
+        '--partial-updates',
+        'Update renamed persons and genres inside the movies in place instead of rebuilding the movies.',
+    )
+    parser.add_argument(
+        '--spool',
+        help='Directory where bulk actions are kept while Elasticsearch is unavailable, replayed once it is back.',
+    )
+
+
+def add_flag(parser: ArgumentParser, flag: str, description: str):
+    """Add an argument switching a behaviour on.
+
+    Args:
+        parser: Command line parser.
+        flag: Name of the argument.
+        description: Help of the argument.
+    """
+    parser.add_argument(flag, action='store_true', help=description)
+
+
+@contextmanager
+def connect(workers: int) -> Iterator[Tuple[PostgresPool, Redis, Elasticsearch]]:
+    """Open the pools of connections to PostgreSQL, Redis and Elasticsearch.
+
+    Args:
+        workers: Number of threads building and loading movies, each of them taking a PostgreSQL connection.
+
+    Yields:
+        Tuple: Pool of connections to PostgreSQL, connection to Redis and connection to Elasticsearch.
+    """
+    maxconn = max(POSTGRES_POOL_MAX, workers + 2)
+    redis_params = {
+        **REDIS_PARAMS,
+        'max_connections': REDIS_MAX_CONNECTIONS,
+        'health_check_interval': REDIS_HEALTH_CHECK_INTERVAL,
+    }
+    with get_postgres_pool(POSTGRES_POOL_MIN, maxconn, POSTGRES_HEALTH_CHECK_INTERVAL, **POSTGRES_PARAMS) as postgres:
+        with get_redis(**redis_params) as redis:
+            with get_elastic(**ELASTIC_PARAMS, maxsize=ELASTIC_MAXSIZE) as elastic:
+                yield postgres, redis, elastic
+
+
+def get_runner(args: Namespace) -> Callable[..., None]:
+    """Choose the entry point of the sync from the command line arguments.
+
+    Args:
+        args: Command line arguments.
+
+    Returns:
+        Callable: Function running the sync with the connections, the arguments and the pool of processes.
+    """
+    if args.reindex:
+        return reindex
+    if args.replicate:
+        return replicate_changes
+    if args.listen:
+        return listen_to_changes
+    return postgres_to_elastic
 
 
 def main():
     """Execute the main program logic."""
-    with get_postgres(**POSTGRES_PARAMS) as postgres_conn:
-        with get_redis(**REDIS_PARAMS) as redis_conn:
-            with get_elastic(**ELASTIC_PARAMS) as elastic_conn:
-                postgres_to_elastic(postgres_conn, elastic_conn, redis_conn)
+    args = parse_args()
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    with get_pool(args.processes, args.movie_query, args.validation_rate) as pool:
+        with connect(args.workers) as (postgres_pool, redis_conn, elastic_conn):
+            get_runner(args)(postgres_pool, elastic_conn, redis_conn, args, pool)
 
 
 if __name__ == '__main__':
@@ -1,4 +1,4 @@
-from typing import ClassVar
+from typing import Any, ClassVar, Dict
 
 from models.base import UUIDMixin
 
@@ -17,3 +17,20 @@ class Genre(UUIDMixin):
     name: str
     description: str
     _index: ClassVar[str] = 'genres'
+
+    @classmethod
+    def serialize(cls, document: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Build the genre document from trusted data without validation.
+
+        Args:
+            document: Genre data.
+
+        Returns:
+            Dict: Document with the same fields as the validated model.
+        """
+        return {
+            'id': str(document['id']),
+            'name': document['name'],
+            'description': document['description'],
+        }
@@ -6,6 +6,32 @@ from models.base import UUIDMixin
 from models.person import Person
 
 
+def get_id(document: Dict[str, Any]) -> str:
+    """
+    Return the ID of a document as a string.
+
+    Args:
+        document: Document with an ID of any type.
+
+    Returns:
+        str: ID.
+    """
+    return str(document['id'])
+
+
+def serialize_persons(persons: List[Dict]) -> List[Dict]:
+    """
+    Build the nested participants of a movie document from trusted data.
+
+    Args:
+        persons: Participants as dictionaries of ID and name.
+
+    Returns:
+        List: Participants with string IDs.
+    """
+    return [dict(person, id=get_id(person)) for person in persons]
+
+
 class Movie(UUIDMixin):
     """Class for validating movie data."""
 
@@ -41,6 +67,30 @@ class Movie(UUIDMixin):
                 properties[field] = 0
         return properties
 
+    @classmethod
+    def serialize(cls, document: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Build the movie document from trusted data without validation.
+
+        Args:
+            document: Movie data with participants as dictionaries of ID and name.
+
+        Returns:
+            Dict: Document with the same fields as the validated model.
+        """
+        return {
+            'id': get_id(document),
+            'imdb_rating': float(document['imdb_rating']),
+            'genre': document['genre'],
+            'title': document['title'],
+            'description': document['description'],
+            'director': document['directors_names'],
+            'actors_names': document['actors_names'],
+            'writers_names': document['writers_names'],
+            'actors': serialize_persons(document['actors']),
+            'writers': serialize_persons(document['writers']),
+        }
+
     @validator('actors', 'writers', each_item=True)
     def change_person_field(cls, person: Person) -> Dict:
         """
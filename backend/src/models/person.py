@@ -1,4 +1,4 @@
-from typing import ClassVar
+from typing import Any, ClassVar, Dict
 
 from pydantic import Field
 
@@ -11,6 +11,19 @@ class Person(UUIDMixin):
     full_name: str = Field(alias='name')
     _index: ClassVar[str] = 'persons'
 
+    @classmethod
+    def serialize(cls, document: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Build the person document from trusted data without validation.
+
+        Args:
+            document: Person data.
+
+        Returns:
+            Dict: Document with the same fields as the validated model.
+        """
+        return {'id': str(document['id']), 'full_name': document['full_name']}
+
     class Config(object):
         """Configuration for the Person class."""
 
@@ -0,0 +1,390 @@
+import asyncio
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, Iterable, List, Tuple, Union
+
+import asyncpg
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.exceptions import ConnectionError as ElasticConnectionError
+from elasticsearch.helpers import async_streaming_bulk
+from redis.asyncio import Redis
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from services.base import UpdatesNotFoundError
+from services.batching import BatchController
+from services.extract import (
+    FILM_WORK_IDS_QUERY,
+    HAS_UPDATES_QUERY,
+    MOVIE_DOCUMENTS_QUERY,
+    UPDATES_QUERY,
+    PostgresExtractor,
+    get_watermark,
+)
+from services.load import ElasticsearchLoader, serialize
+from services.transform import DataTransform
+from core.config import (
+    BATCH_SIZE,
+    BULK_CHUNK_SIZE,
+    BULK_INITIAL_BACKOFF,
+    BULK_MAX_BACKOFF,
+    BULK_MAX_CHUNK_BYTES,
+    BULK_MAX_RETRIES,
+    EXTRACT_BATCH_MAX,
+    EXTRACT_BATCH_MIN,
+    EXTRACT_BATCH_STEP,
+    EXTRACT_BATCH_TARGET,
+    ITERSIZE,
+    PAGE_SIZE,
+    VALIDATION_SAMPLE_RATE,
+    Schemas,
+    Watermark,
+)
+from core.decorators import async_backoff, timed
+from core.logger import logger
+from core.metrics import QUEUE_SIZE, ROWS_EXTRACTED, observe_indexed
+
+POSTGRES_ERRORS = (OSError, asyncpg.InterfaceError, asyncpg.PostgresConnectionError)
+
+Update = Tuple[str, List[Dict]]
+
+
+def to_asyncpg(query: str) -> str:
+    """Replace the positional parameters of psycopg2 with the numbered parameters of asyncpg.
+
+    Args:
+        query: Query with %s parameters
+
+    Returns:
+        str: Query with $1, $2, ... parameters
+    """
+    numbers = iter(range(1, query.count('%s') + 1))
+    return re.sub('%s', lambda _: '${0}'.format(next(numbers)), query)
+
+
+def to_timestamp(value: Union[datetime, str]) -> datetime:
+    """Convert the modification time of a watermark, which may be read from the state as a string.
+
+    Args:
+        value: Modification time
+
+    Returns:
+        datetime: Modification time with a time zone, UTC if it had none
+    """
+    modified = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    return modified if modified.tzinfo else modified.replace(tzinfo=timezone.utc)
+
+
+def observe_errors(index: str, total: int, errors: List[Dict]):
+    """Log the documents that failed to load and count the loaded ones.
+
+    Args:
+        index: Index name
+        total: Number of documents sent
+        errors: Items that Elasticsearch failed to index
+    """
+    for failure in errors:
+        logger.error('Failed to process document: {0}'.format(failure))
+    observe_indexed(index, total, errors)
+
+
+@dataclass
+class AsyncPostgresExtractor(object):
+    """Class for retrieving data from PostgreSQL through a pool of asynchronous connections."""
+
+    postgres: asyncpg.Pool
+
+    itersize: int = ITERSIZE
+    page_size: int = PAGE_SIZE
+
+    TABLES = PostgresExtractor.TABLES
+
+    COLUMNS = PostgresExtractor.COLUMNS
+
+    INITIAL_WATERMARK = PostgresExtractor.INITIAL_WATERMARK
+
+    def __post_init__(self):
+        """Start the batches of extracted rows at `BATCH_SIZE` and tune them from the time taken to process them."""
+        self.batches = BatchController(
+            'extract', BATCH_SIZE, EXTRACT_BATCH_MIN, EXTRACT_BATCH_MAX, EXTRACT_BATCH_TARGET, EXTRACT_BATCH_STEP,
+        )
+
+    @async_backoff(errors=POSTGRES_ERRORS)
+    async def has_updates(self, table: str, watermark: Watermark) -> bool:
+        """Check whether the table has rows past the watermark.
+
+        Args:
+            table: Table name
+            watermark: Position of the last loaded row
+
+        Returns:
+            bool: True if at least one row has been modified
+        """
+        query = to_asyncpg(HAS_UPDATES_QUERY.format(table=table))
+        modified = to_timestamp(watermark[0])
+        return await self.postgres.fetchval(query, modified, watermark[1])
+
+    async def get_updates(self, watermarks: Dict[str, Watermark]) -> AsyncIterator[Update]:
+        """Retrieve new data following the watermark of each table.
+
+        - Pages through every table by the (modified, id) key with a server-side cursor
+
+        Args:
+            watermarks: Position of the last loaded row for each table
+
+        Raises:
+            UpdatesNotFoundError: No updates found
+
+        Yields:
+            tuple[str, list]: Table name and a batch of data from it
+        """
+        pending = [self.has_updates(table, watermarks[table]) for table in self.TABLES]
+        if not any(await asyncio.gather(*pending)):
+            raise UpdatesNotFoundError
+        for table in self.TABLES:
+            async for update in self.get_table_updates(table, watermarks[table]):
+                yield update
+
+    async def get_table_updates(self, table: str, watermark: Watermark) -> AsyncIterator[Update]:
+        """Retrieve the updates of a table page by page, until a page is not full.
+
+        Args:
+            table: Table name
+            watermark: Position of the last loaded row
+
+        Yields:
+            tuple[str, list]: Table name and a batch of data from it
+        """
+        page_size = self.page_size
+        while page_size == self.page_size:
+            page_size = 0
+            async for data in self.get_page(table, watermark):
+                page_size += len(data)
+                watermark = get_watermark(data)
+                yield (table, data)
+
+    async def get_page(self, table: str, watermark: Watermark) -> AsyncIterator[List[Dict]]:
+        """Retrieve a page of updates in batches, tuning the batch size by the time taken to process each of them.
+
+        Args:
+            table: Table name
+            watermark: Position of the last loaded row
+
+        Yields:
+            list: Batch of data in PostgreSQL format
+        """
+        async with self.postgres.acquire() as conn, conn.transaction():
+            started = time.monotonic()
+            data: List[Dict] = []
+            async for row in self.select_table(conn, table, watermark):
+                data.append(dict(row))
+                if len(data) >= self.batches.size:
+                    ROWS_EXTRACTED.labels(table).inc(len(data))
+                    yield data
+                    self.batches.observe(len(data), time.monotonic() - started)
+                    started = time.monotonic()
+                    data = []
+            if data:
+                ROWS_EXTRACTED.labels(table).inc(len(data))
+                yield data
+
+    def select_table(
+        self,
+        conn: asyncpg.Connection,
+        table: str,
+        watermark: Watermark,
+    ) -> AsyncIterator[asyncpg.Record]:
+        """Open a server-side cursor over the rows of the table past the watermark.
+
+        Args:
+            conn: Connection with an open transaction
+            table: Table name
+            watermark: Position of the last loaded row
+
+        Returns:
+            AsyncIterator: Cursor over one page of rows ordered by (modified, id)
+        """
+        columns = ', '.join(self.COLUMNS[table])
+        query = to_asyncpg(UPDATES_QUERY.format(table=table, columns=columns))
+        return conn.cursor(
+            query,
+            to_timestamp(watermark[0]),
+            watermark[1],
+            self.page_size,
+            prefetch=self.itersize,
+        )
+
+    @timed('get_film_work_ids')
+    @async_backoff(errors=POSTGRES_ERRORS)
+    async def get_film_work_ids(self, table: str, data: List[Dict]) -> List[str]:
+        """Retrieve film IDs that have changed.
+
+        Args:
+            table: Table name
+            data: Batch of data in PostgreSQL format
+
+        Returns:
+            List: Film IDs to be updated
+        """
+        ids = [str(row['id']) for row in data]
+        if table == 'film_work':
+            return ids
+        query = to_asyncpg(FILM_WORK_IDS_QUERY.format(table=table))
+        rows = await self.postgres.fetch(query, ids)
+        return [str(row['id']) for row in rows]
+
+    @timed('get_movie_documents')
+    @async_backoff(errors=POSTGRES_ERRORS)
+    async def get_movie_documents(self, film_ids: Iterable[str]) -> List[Dict]:
+        """Retrieve movies for the Elasticsearch index named 'movies' as one row per film.
+
+        Args:
+            film_ids: Film IDs
+
+        Returns:
+            List: Data in PostgreSQL format with a film, its genre names and its persons by role
+        """
+        rows = await self.postgres.fetch(to_asyncpg(MOVIE_DOCUMENTS_QUERY), list(film_ids))
+        return [dict(row) for row in rows]
+
+
+@dataclass
+class AsyncDataTransform(DataTransform):
+    """Class for data transformation and storing intermediate results in Redis with an asynchronous client."""
+
+    redis: Redis  # type: ignore[assignment]
+
+    @timed('collector')
+    @async_backoff(errors=(RedisConnectionError,))
+    async def collector(self, key: str, film_work_ids: Iterable[str]):
+        """Collect movie IDs to be updated at the moment.
+
+        Args:
+            key: The key under which the data is stored.
+            film_work_ids: The movies to be updated.
+        """
+        film_work_ids = list(film_work_ids)
+        if film_work_ids:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.sadd(key, *film_work_ids)
+                pipe.scard(key)
+                QUEUE_SIZE.labels(key).set((await pipe.execute())[-1])
+
+    async def batcher(self, key: str) -> AsyncIterator[List[str]]:
+        """Iterate batches of movie IDs from Redis.
+
+        - Returns movie IDs left unacknowledged by an interrupted run to the set
+        - Atomically pops batches of movie IDs and moves them to the processing set,
+          with the batch size tuned from the time between batches
+
+        Args:
+            key: The key under which the data is stored
+
+        Yields:
+            List: Batch of movie IDs
+        """
+        processing = '{key}:processing'.format(key=key)
+        async with self.redis.pipeline() as pipe:
+            pipe.sunionstore(key, key, processing)
+            pipe.delete(processing)
+            await pipe.execute()
+        keys = [key, processing]
+        started = time.monotonic()
+        while data := await self.pop_batch(keys=keys, args=[self.batches.size]):
+            QUEUE_SIZE.labels(key).dec(len(data))
+            yield [movie_id.decode() for movie_id in data]
+            self.batches.observe(len(data), time.monotonic() - started)
+            started = time.monotonic()
+
+    @timed('acknowledge')
+    @async_backoff(errors=(RedisConnectionError,))
+    async def acknowledge(self, key: str, film_work_ids: Iterable[str]):
+        """Remove movie IDs that have been loaded from the processing set.
+
+        Args:
+            key: The key under which the data is stored.
+            film_work_ids: The movies that have been loaded.
+        """
+        film_work_ids = list(film_work_ids)
+        if film_work_ids:
+            await self.redis.srem('{key}:processing'.format(key=key), *film_work_ids)
+
+
+@dataclass
+class AsyncElasticsearchLoader(object):
+    """Class for validating and loading data into ElasticSearch with an asynchronous client."""
+
+    elastic: AsyncElasticsearch
+    chunk_size: int = BULK_CHUNK_SIZE
+    max_chunk_bytes: int = BULK_MAX_CHUNK_BYTES
+    max_retries: int = BULK_MAX_RETRIES
+    validation_rate: float = VALIDATION_SAMPLE_RATE
+
+    @async_backoff(errors=(ElasticConnectionError,))
+    async def create_indices(self):
+        """Create missing indices with the settings and data schema of ElasticsearchLoader."""
+        await asyncio.gather(*(self.create_index(index) for index in ElasticsearchLoader.INDICES))
+
+    async def create_index(self, index: str):
+        """Create an index unless it exists.
+
+        Args:
+            index: Index name
+        """
+        if not await self.elastic.indices.exists(index=index):
+            body = ElasticsearchLoader.get_body(index)
+            await self.elastic.indices.create(index=index, body=body)
+
+    @timed('bulk_insert')
+    @async_backoff(errors=(ElasticConnectionError,))
+    async def bulk_insert(self, schema: Schemas, data: Iterable[Dict]) -> List[Dict]:
+        """Load data, retrying the documents rejected by Elasticsearch with exponential backoff.
+
+        Args:
+            schema: Schema
+            data: List of data
+
+        Returns:
+            List: Items that Elasticsearch failed to index
+        """
+        actions = [self.get_action(schema, document) for document in data]
+        errors = [response async for ok, response in self.stream(actions) if not ok]
+        observe_errors(schema._index, len(actions), errors)
+        return errors
+
+    def get_action(self, schema: Schemas, document: Dict) -> Dict:
+        """Build the bulk action indexing a document.
+
+        Args:
+            schema: Schema
+            document: Data in PostgreSQL format
+
+        Returns:
+            Dict: Bulk action with the serialized document
+        """
+        return {
+            '_index': schema._index,
+            '_id': str(document['id']),
+            '_source': serialize(schema, document, self.validation_rate),
+        }
+
+    def stream(self, actions: List[Dict]) -> AsyncIterator[Tuple[bool, Dict]]:
+        """Send the actions in chunks, retrying the rejected ones.
+
+        Args:
+            actions: Bulk actions
+
+        Returns:
+            AsyncIterator: Success flag and response for each action
+        """
+        return async_streaming_bulk(
+            self.elastic,
+            actions,
+            chunk_size=self.chunk_size,
+            max_chunk_bytes=self.max_chunk_bytes,
+            max_retries=self.max_retries,
+            initial_backoff=BULK_INITIAL_BACKOFF,
+            max_backoff=BULK_MAX_BACKOFF,
+            raise_on_error=False,
+        )
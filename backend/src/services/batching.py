@@ -0,0 +1,63 @@
+import math
+import threading
+from dataclasses import dataclass, field
+
+from core.metrics import BATCH_SIZE_CURRENT
+
+SLOW_FACTOR = 1.5
+
+DECREASE_FACTOR = 0.5
+
+
+@dataclass
+class BatchController(object):
+    """Class for tuning the size of the batches of a stage from their observed latency.
+
+    - Additive increase, multiplicative decrease: a full batch faster than `target` seconds grows the size by `step`,
+      a batch slower than `SLOW_FACTOR` times the target or a rejection halves it
+    - The size always stays between `min_size` and `max_size`
+    - Observations may come from several threads
+
+    Attributes:
+        stage: Name of the stage, used as the metric label.
+        size: Current batch size.
+        min_size: Smallest batch size.
+        max_size: Largest batch size.
+        target: Target latency of a batch in seconds.
+        step: Growth of the size after a fast batch.
+    """
+
+    stage: str
+    size: int
+    min_size: int
+    max_size: int
+    target: float
+    step: int
+    lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def __post_init__(self):
+        """Clamp the initial size to the bounds and export it."""
+        self.size = min(max(self.size, self.min_size), self.max_size)
+        BATCH_SIZE_CURRENT.labels(self.stage).set(self.size)
+
+    def observe(self, count: int, seconds: float, rejected: bool = False):
+        """Adjust the batch size after a batch has been processed.
+
+        - Work spanning several batches, such as a bulk request split into chunks, is averaged per batch
+        - Batches smaller than the current size do not grow it, as the size was not what limited them
+
+        Args:
+            count: Number of items processed.
+            seconds: Time spent on the items.
+            rejected: The items were rejected as the downstream service is overloaded.
+        """
+        with self.lock:
+            latency = seconds / max(1, math.ceil(count / self.size))
+            if rejected or latency > self.target * SLOW_FACTOR:
+                size = int(self.size * DECREASE_FACTOR)
+            elif latency < self.target and count >= self.size:
+                size = self.size + self.step
+            else:
+                return
+            self.size = min(max(size, self.min_size), self.max_size)
+            BATCH_SIZE_CURRENT.labels(self.stage).set(self.size)
@@ -0,0 +1,236 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union, cast
+
+from pydantic.dataclasses import dataclass
+from redis import Redis
+from redis.exceptions import ConnectionError
+
+from services.base import Config
+from core.config import FINGERPRINT_CACHE_SIZE, FINGERPRINT_DIGEST_SIZE, NAME_CACHE_SIZE
+from core.decorators import backoff
+
+RedisKey = Union[str, bytes]
+
+NameKey = Tuple[str, str]
+
+Filtered = Tuple[List[Dict], Dict[str, str]]
+
+FINGERPRINTS_KEY = 'fingerprints:{index}'
+
+RECENCY_KEY = 'fingerprints:{index}:recency'
+
+
+def dumps(source: Dict) -> str:
+    """Serialize a document to canonical JSON with sorted keys.
+
+    Args:
+        source: Document.
+
+    Returns:
+        str: JSON.
+    """
+    return json.dumps(source, sort_keys=True, separators=(',', ':'), default=str)
+
+
+def fingerprint(source: Union[Dict, str]) -> str:
+    """Return a stable hash of a document.
+
+    Args:
+        source: Document, or the document already serialized by `dumps`.
+
+    Returns:
+        str: Hash of the serialized document.
+    """
+    serialized = source if isinstance(source, str) else dumps(source)
+    return hashlib.blake2b(serialized.encode(), digest_size=FINGERPRINT_DIGEST_SIZE).hexdigest()
+
+
+def get_fingerprints(actions: List[Dict]) -> Dict[str, str]:
+    """Return the fingerprints of the documents of bulk actions.
+
+    Args:
+        actions: Bulk actions with the documents.
+
+    Returns:
+        dict: Fingerprints by document ID.
+    """
+    return {str(action['_id']): fingerprint(action['_source']) for action in actions}
+
+
+def get_unchanged(
+    fingerprints: Dict[str, str],
+    cached: List[Optional[bytes]],
+) -> Set[str]:
+    """Return the IDs of documents whose fingerprints match the cached ones.
+
+    Args:
+        fingerprints: Fingerprints by document ID.
+        cached: Cached fingerprints in the same order.
+
+    Returns:
+        set: Document IDs.
+    """
+    return {
+        document_id
+        for document_id, value in zip(fingerprints, cached)
+        if value is not None and value.decode() == fingerprints[document_id]
+    }
+
+
+@dataclass(config=Config)
+class FingerprintCache(object):
+    """Class for remembering hashes of the documents last written to each index.
+
+    - Fingerprints are stored in Redis in a hash per index, with a sorted set of access times
+    - When an index holds more than `max_size` fingerprints, the least recently used ones are evicted
+    """
+
+    redis: Redis
+    max_size: int = FINGERPRINT_CACHE_SIZE
+
+    @backoff(errors=(ConnectionError,))
+    def filter(self, index: str, actions: List[Dict]) -> Filtered:
+        """Drop actions that would write documents identical to the ones already in the index.
+
+        - The access times of the skipped documents are refreshed, so they are not evicted before stale ones
+
+        Args:
+            index: Index name.
+            actions: Bulk actions with the documents.
+
+        Returns:
+            tuple: Actions with changed documents and fingerprints of all documents by ID.
+        """
+        if not actions:
+            return actions, {}
+        fingerprints = get_fingerprints(actions)
+        cached = self.redis.hmget(FINGERPRINTS_KEY.format(index=index), list(fingerprints))
+        unchanged = get_unchanged(fingerprints, cached)
+        if unchanged:
+            recency: Dict[RedisKey, float] = dict.fromkeys(unchanged, time.time())
+            self.redis.zadd(RECENCY_KEY.format(index=index), recency, xx=True)
+        return [action for action in actions if str(action['_id']) not in unchanged], fingerprints
+
+    @backoff(errors=(ConnectionError,))
+    def update(self, index: str, fingerprints: Dict[str, str]):
+        """Remember the fingerprints of documents written to the index and evict the least recently used ones.
+
+        Args:
+            index: Index name.
+            fingerprints: Fingerprints by document ID.
+        """
+        if not fingerprints:
+            return
+        mapping = cast(Dict[RedisKey, str], fingerprints)
+        recency = RECENCY_KEY.format(index=index)
+        with self.redis.pipeline() as pipe:
+            pipe.hset(FINGERPRINTS_KEY.format(index=index), mapping=mapping)
+            pipe.zadd(recency, dict.fromkeys(mapping, time.time()))
+            pipe.zcard(recency)
+            size = pipe.execute()[-1]
+        if size > self.max_size:
+            self.evict(index, size - self.max_size)
+
+    def evict(self, index: str, count: int):
+        """Remove the least recently used fingerprints of an index.
+
+        Args:
+            index: Index name.
+            count: Number of fingerprints to remove.
+        """
+        evicted = self.redis.zpopmin(RECENCY_KEY.format(index=index), count)
+        ids = [document_id for document_id, _ in evicted]
+        self.redis.hdel(FINGERPRINTS_KEY.format(index=index), *ids)
+
+    @backoff(errors=(ConnectionError,))
+    def forget(self, index: str, ids: Iterable[str]):
+        """Remove the fingerprints of documents deleted from the index.
+
+        Args:
+            index: Index name.
+            ids: Document IDs.
+        """
+        ids = [str(document_id) for document_id in ids]
+        if ids:
+            with self.redis.pipeline() as pipe:
+                pipe.hdel(FINGERPRINTS_KEY.format(index=index), *ids)
+                pipe.zrem(RECENCY_KEY.format(index=index), *ids)
+                pipe.execute()
+
+    @backoff(errors=(ConnectionError,))
+    def clear(self, index: str):
+        """Remove all fingerprints of an index, e.g. after it was rebuilt.
+
+        Args:
+            index: Index name.
+        """
+        self.redis.delete(
+            FINGERPRINTS_KEY.format(index=index),
+            RECENCY_KEY.format(index=index),
+        )
+
+
+@dataclass(config=Config)
+class NameCache(object):
+    """Class for keeping the names of persons and genres in memory, so movies can be built from link rows.
+
+    - Keys are (table, ID) pairs and values are the names
+    - When more than `max_size` names are kept, the least recently used ones are evicted
+    """
+
+    max_size: int = NAME_CACHE_SIZE
+
+    def __post_init__(self):
+        """Create the ordered dictionary of names, the most recently used last."""
+        self.names: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_many(
+        self,
+        keys: Iterable[NameKey],
+    ) -> Tuple[Dict[NameKey, str], List[NameKey]]:
+        """Look up names, marking the found ones as recently used.
+
+        Args:
+            keys: Keys of the names.
+
+        Returns:
+            tuple: Found names by key and the keys that are missing.
+        """
+        found, missing = {}, []
+        with self.lock:
+            for key in keys:
+                name = self.names.get(key)
+                if name is None:
+                    missing.append(key)
+                else:
+                    self.names.move_to_end(key)
+                    found[key] = name
+        return found, missing
+
+    def update(self, names: Dict[NameKey, str]):
+        """Add names and evict the least recently used ones.
+
+        Args:
+            names: Names by key.
+        """
+        with self.lock:
+            for key, name in names.items():
+                self.names[key] = name
+                self.names.move_to_end(key)
+            while len(self.names) > self.max_size:
+                self.names.popitem(last=False)
+
+    def refresh(self, names: Dict[NameKey, str]):
+        """Replace the names that are already kept, e.g. with the rows of updated persons and genres.
+
+        Args:
+            names: New names by key.
+        """
+        with self.lock:
+            for key in names.keys() & self.names.keys():
+                self.names[key] = names[key]
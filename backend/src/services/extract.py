@@ -1,51 +1,295 @@
+import time
 from datetime import datetime
-from typing import Iterator, List, Tuple
+from itertools import islice
+from operator import itemgetter
+from typing import Dict, Iterable, Iterator, List, Sequence, Set, Tuple
 
 from psycopg2 import InterfaceError, OperationalError
-from psycopg2.extensions import connection, cursor
-from psycopg2.extras import DictRow
+from psycopg2.extras import DictConnection, DictCursor, DictRow
 from pydantic.dataclasses import dataclass
 
 from services.base import Config, UpdatesNotFoundError
-from core.config import BATCH_SIZE
-from core.decorators import backoff
+from services.batching import BatchController
+from services.cache import NameCache, NameKey
+from core.config import (
+    BATCH_SIZE,
+    EXTRACT_BATCH_MAX,
+    EXTRACT_BATCH_MIN,
+    EXTRACT_BATCH_STEP,
+    EXTRACT_BATCH_TARGET,
+    ITERSIZE,
+    PAGE_SIZE,
+    RECONCILE_PAGE_SIZE,
+    PostgresRow,
+    Watermark,
+)
+from core.decorators import backoff, timed
+from core.metrics import ROWS_EXTRACTED
+from db.postgres import PostgresPool
+
+HAS_UPDATES_QUERY = """
+    SELECT EXISTS (
+        SELECT 1 FROM {table} WHERE (modified, id) > (%s::timestamptz, %s::uuid)
+    );
+"""
+
+UPDATES_QUERY = """
+    SELECT {columns}
+    FROM {table}
+    WHERE (modified, id) > (%s::timestamptz, %s::uuid)
+    ORDER BY modified, id
+    LIMIT %s;
+"""
+
+ROWS_QUERY = 'SELECT {columns} FROM {table} WHERE id = ANY(%s::uuid[]);'
+
+FILM_WORK_IDS_QUERY = """
+    SELECT DISTINCT film_work_id AS id
+    FROM {table}_film_work
+    WHERE {table}_id = ANY(%s::uuid[]);
+"""
+
+IDS_QUERY = """
+    SELECT id::text
+    FROM {table}
+    WHERE id > %s::uuid
+    ORDER BY id
+    LIMIT %s;
+"""
+
+DIRECTOR_IDS_QUERY = """
+    SELECT DISTINCT person_id AS id
+    FROM person_film_work
+    WHERE person_id = ANY(%s::uuid[]) AND role = 'director';
+"""
+
+MOVIES_QUERY = """
+    SELECT
+        fw.id,
+        fw.title,
+        fw.description,
+        fw.rating,
+        COALESCE(g.genres, ARRAY[]::text[]) AS genres,
+        COALESCE(p.persons, '{}'::json) AS persons
+    FROM film_work fw
+    LEFT JOIN LATERAL (
+        SELECT array_agg(g.name ORDER BY g.name) AS genres
+        FROM genre_film_work gfw
+        JOIN genre g ON g.id = gfw.genre_id
+        WHERE gfw.film_work_id = fw.id
+    ) g ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT json_object_agg(roles.role, roles.persons) AS persons
+        FROM (
+            SELECT
+                pfw.role,
+                json_agg(json_build_object('id', p.id, 'name', p.full_name) ORDER BY p.full_name) AS persons
+            FROM person_film_work pfw
+            JOIN person p ON p.id = pfw.person_id
+            WHERE pfw.film_work_id = fw.id
+            GROUP BY pfw.role
+        ) roles
+    ) p ON TRUE
+"""
+
+MOVIE_DOCUMENTS_QUERY = '{query}    WHERE fw.id = ANY(%s::uuid[]);\n'.format(query=MOVIES_QUERY)
+
+MOVIE_LINKS_QUERY = """
+    SELECT
+        fw.id,
+        fw.title,
+        fw.description,
+        fw.rating,
+        COALESCE(p.person_ids, ARRAY[]::text[]) AS person_ids,
+        COALESCE(p.roles, ARRAY[]::text[]) AS roles,
+        COALESCE(g.genre_ids, ARRAY[]::text[]) AS genre_ids
+    FROM film_work fw
+    LEFT JOIN LATERAL (
+        SELECT array_agg(pfw.person_id::text) AS person_ids, array_agg(pfw.role::text) AS roles
+        FROM person_film_work pfw
+        WHERE pfw.film_work_id = fw.id
+    ) p ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT array_agg(gfw.genre_id::text) AS genre_ids
+        FROM genre_film_work gfw
+        WHERE gfw.film_work_id = fw.id
+    ) g ON TRUE
+    WHERE fw.id = ANY(%s::uuid[]);
+"""
+
+NAMES_QUERY = """
+    SELECT id::text, {column} AS name
+    FROM {table}
+    WHERE id = ANY(%s::uuid[]);
+"""
+
+Persons = Dict[str, List[Dict]]
+
+
+def get_watermark(data: Sequence[PostgresRow]) -> Watermark:
+    """Return the position of the last row in a batch sorted by (modified, id).
+
+    Args:
+        data: Batch of data in PostgreSQL format
+
+    Returns:
+        Watermark: Tuple with the modification time and ID of the last row
+    """
+    return (data[-1]['modified'], data[-1]['id'])
+
+
+def get_name_keys(rows: List[DictRow]) -> Set[NameKey]:
+    """Return the keys of the person and genre names needed by rows of link IDs.
+
+    Args:
+        rows: Film columns with the IDs of its persons and genres
+
+    Returns:
+        Set: Keys as (table, ID)
+    """
+    keys = {('person', person_id) for row in rows for person_id in row['person_ids']}
+    keys.update(('genre', genre_id) for row in rows for genre_id in row['genre_ids'])
+    return keys
+
+
+def group_ids(keys: Iterable[NameKey]) -> Dict[str, List[str]]:
+    """Group the IDs of name keys by table.
+
+    Args:
+        keys: Keys as (table, ID)
+
+    Returns:
+        Dict: IDs for each table
+    """
+    grouped: Dict[str, List[str]] = {}
+    for table, row_id in keys:
+        grouped.setdefault(table, []).append(row_id)
+    return grouped
+
+
+def group_persons(row: DictRow, names: Dict[NameKey, str]) -> Persons:
+    """Group the persons of a row of link IDs by role, sorted by name.
+
+    Args:
+        row: Film columns with the IDs of its persons and their roles
+        names: Names by (table, ID)
+
+    Returns:
+        Dict: Persons with ID and name for each role
+    """
+    persons: Persons = {}
+    for person_id, role in zip(row['person_ids'], row['roles']):
+        name = names.get(('person', person_id))
+        if name is not None:
+            persons.setdefault(role, []).append({'id': person_id, 'name': name})
+    for role_persons in persons.values():
+        role_persons.sort(key=itemgetter('name'))
+    return persons
+
+
+def fill_names(row: DictRow, names: Dict[NameKey, str]) -> Dict:
+    """Build a movie row with names from a row of link IDs.
+
+    Args:
+        row: Film columns with the IDs of its persons, their roles and the IDs of its genres
+        names: Names by (table, ID)
+
+    Returns:
+        Dict: Data with a film, its genre names and its persons by role
+    """
+    genres = (names.get(('genre', genre_id)) for genre_id in row['genre_ids'])
+    return {
+        'id': row['id'],
+        'title': row['title'],
+        'description': row['description'],
+        'rating': row['rating'],
+        'genres': sorted(genre for genre in genres if genre is not None),
+        'persons': group_persons(row, names),
+    }
 
 
 @dataclass(config=Config)
 class PostgresExtractor(object):
-    """Class for retrieving data from PostgreSQL."""
+    """Class for retrieving data from PostgreSQL.
+
+    - Every query checks out a connection from the pool, so concurrent stages do not share a connection
+      and a broken connection is replaced before the query is retried
+    """
 
-    postgres: connection
+    postgres: PostgresPool
+
+    itersize: int = ITERSIZE
+    page_size: int = PAGE_SIZE
+    movie_query: str = 'aggregated'
 
     TABLES = ('film_work', 'person', 'genre')
 
+    COLUMNS = {
+        'film_work': ('id', 'modified'),
+        'person': ('id', 'full_name', 'modified'),
+        'genre': ('id', 'name', 'description', 'modified'),
+    }
+
+    NAME_COLUMNS = {'person': 'full_name', 'genre': 'name'}
+
+    INITIAL_WATERMARK = (str(datetime.min), '00000000-0000-0000-0000-000000000000')
+
+    def __post_init__(self):
+        """Start the batches of extracted rows at `BATCH_SIZE` and tune them from the time taken to process them.
+
+        - Creates the cache of person and genre names used by the 'cached' movie query
+        """
+        self.batches = BatchController(
+            'extract', BATCH_SIZE, EXTRACT_BATCH_MIN, EXTRACT_BATCH_MAX, EXTRACT_BATCH_TARGET, EXTRACT_BATCH_STEP,
+        )
+        self.names = NameCache()
+
     @backoff(errors=(InterfaceError, OperationalError))
-    def select_table(self, table: str, timestamp: datetime) -> cursor:
-        """Query updates in the table up to the current timestamp.
+    def has_updates(self, table: str, watermark: Watermark) -> bool:
+        """Check whether the table has rows past the watermark.
 
         Args:
             table: Table name
-            timestamp: Date and time of the last update
+            watermark: Position of the last loaded row
 
         Returns:
-            cursor: Cursor object
+            bool: True if at least one row has been modified
         """
-        curs = self.postgres.cursor()
-        query = """
-            SELECT *
-            FROM {table}
-            WHERE modified > TIMESTAMP '{timestamp}'
-            ORDER BY modified;
+        with self.postgres.connection() as conn, conn.cursor() as curs:
+            curs.execute(HAS_UPDATES_QUERY.format(table=table), watermark)
+            row = curs.fetchone()
+        return bool(row and row[0])
+
+    def select_table(self, postgres: DictConnection, table: str, watermark: Watermark) -> DictCursor:
+        """Query a page of updates in the table following the watermark.
+
+        - Pages through the table by the (modified, id) key, so every query is bounded by `page_size`
+        - Uses a server-side named cursor, so rows are streamed from PostgreSQL
+          in chunks of `itersize` instead of being loaded into memory at once
+
+        Args:
+            postgres: Connection checked out for the page
+            table: Table name
+            watermark: Position of the last loaded row
+
+        Returns:
+            DictCursor: Named cursor object
         """
-        curs.execute(query.format(table=table, timestamp=timestamp))
+        curs = postgres.cursor(name='{table}_updates'.format(table=table))
+        curs.itersize = self.itersize
+        columns = ', '.join(self.COLUMNS[table])
+        query = UPDATES_QUERY.format(table=table, columns=columns)
+        curs.execute(query, (*watermark, self.page_size))
         return curs
 
-    @backoff(errors=(InterfaceError, OperationalError))
-    def get_updates(self, timestamp: datetime) -> Iterator[Tuple[str, List]]:
-        """Retrieve new data since the last update.
+    @timed('get_updates')
+    def get_updates(self, watermarks: Dict[str, Watermark]) -> Iterator[Tuple[str, List]]:
+        """Retrieve new data following the watermark of each table.
+
+        - The batch size adapts to the time between batches, which includes processing them
 
         Args:
-            timestamp: Date and time of the last update
+            watermarks: Position of the last loaded row for each table
 
         Raises:
             UpdatesNotFoundError: No updates found
@@ -53,51 +297,184 @@ class PostgresExtractor(object):
         Yields:
             tuple[str, list]: Generates a tuple with the table name and a batch of data from it
         """
-        updates = {table: self.select_table(table, timestamp) for table in self.TABLES}
-        if not any(curs.rowcount for curs in updates.values()):
+        pending = (self.has_updates(table, watermarks[table]) for table in self.TABLES)
+        if not any(pending):
             raise UpdatesNotFoundError
-        for table, curs in updates.items():
-            while data := curs.fetchmany(BATCH_SIZE):
+        for table in self.TABLES:
+            yield from self.get_table_updates(table, watermarks[table])
+
+    def get_table_updates(self, table: str, watermark: Watermark) -> Iterator[Tuple[str, List]]:
+        """Retrieve the updates of a table page by page, until a page is not full.
+
+        Args:
+            table: Table name
+            watermark: Position of the last loaded row
+
+        Yields:
+            tuple[str, list]: Generates a tuple with the table name and a batch of data from it
+        """
+        page_size = self.page_size
+        while page_size == self.page_size:
+            page_size = 0
+            for data in self.get_page(table, watermark):
+                page_size += len(data)
+                watermark = get_watermark(data)
                 yield (table, data)
+
+    def get_page(self, table: str, watermark: Watermark) -> Iterator[List[DictRow]]:
+        """Retrieve a page of updates in batches, tuning the batch size by the time taken to process each of them.
+
+        Args:
+            table: Table name
+            watermark: Position of the last loaded row
+
+        Yields:
+            list: Batch of data in PostgreSQL format
+        """
+        with self.postgres.connection() as conn:
+            curs = self.select_table(conn, table, watermark)
+            started = time.monotonic()
+            while data := list(islice(curs, self.batches.size)):
+                ROWS_EXTRACTED.labels(table).inc(len(data))
+                self.refresh_names(table, data)
+                yield data
+                self.batches.observe(len(data), time.monotonic() - started)
+                started = time.monotonic()
             curs.close()
 
+    @timed('get_rows')
+    def get_rows(self, table: str, ids: Iterable[str]) -> Iterator[List[DictRow]]:
+        """Retrieve the rows of the table with the given IDs.
+
+        Args:
+            table: Table name
+            ids: Row IDs
+
+        Yields:
+            list: Batch of data in PostgreSQL format
+        """
+        with self.postgres.connection() as conn, conn.cursor() as curs:
+            columns = ', '.join(self.COLUMNS[table])
+            query = ROWS_QUERY.format(table=table, columns=columns)
+            curs.execute(query, (list(ids),))
+            while data := curs.fetchmany(self.batches.size):
+                ROWS_EXTRACTED.labels(table).inc(len(data))
+                self.refresh_names(table, data)
+                yield data
+
+    def get_ids(self, table: str, page_size: int = RECONCILE_PAGE_SIZE) -> Iterator[List[str]]:
+        """Retrieve all IDs of the table in ascending order.
+
+        - Pages through the table by ID, so no transaction stays open for the whole scan
+
+        Args:
+            table: Table name
+            page_size: Number of IDs per page
+
+        Yields:
+            list: Page of IDs
+        """
+        last_id = self.INITIAL_WATERMARK[1]
+        while ids := self.get_ids_page(table, last_id, page_size):
+            yield ids
+            last_id = ids[-1]
+
+    @backoff(errors=(InterfaceError, OperationalError))
+    def get_ids_page(self, table: str, last_id: str, page_size: int) -> List[str]:
+        """Retrieve a page of IDs of the table following the last ID.
+
+        Args:
+            table: Table name
+            last_id: Last ID of the previous page
+            page_size: Number of IDs per page
+
+        Returns:
+            List: IDs in ascending order
+        """
+        with self.postgres.connection() as conn, conn.cursor() as curs:
+            curs.execute(IDS_QUERY.format(table=table), (last_id, page_size))
+            return [row['id'] for row in curs]
+
+    @backoff(errors=(InterfaceError, OperationalError))
+    def get_existing_ids(self, table: str, ids: Iterable[str]) -> Set[str]:
+        """Retrieve the IDs that are still present in the table.
+
+        Args:
+            table: Table name
+            ids: Row IDs
+
+        Returns:
+            Set: IDs found in the table
+        """
+        with self.postgres.connection() as conn, conn.cursor() as curs:
+            query = 'SELECT id::text FROM {table} WHERE id = ANY(%s::uuid[]);'
+            curs.execute(query.format(table=table), (list(ids),))
+            return {row['id'] for row in curs}
+
+    @timed('get_film_work_ids')
     @backoff(errors=(InterfaceError, OperationalError))
-    def get_film_work_ids(self, table: str, data: List[DictRow]) -> Iterator[DictRow]:
+    def get_film_work_ids(self, table: str, data: List[DictRow]) -> List[DictRow]:
         """Retrieve film IDs that have changed.
 
+        - For persons and genres, reads distinct film IDs straight from the link table
+          with a statement prepared once per connection, passing the IDs as a single array
+
         Args:
             table: Table name
             data: List of data in PostgreSQL format
 
-        Yields:
-            DictRow: Data in PostgreSQL format with the film ID to be updated
+        Returns:
+            List: Data in PostgreSQL format with the film ID to be updated
         """
         if table in {'person', 'genre'}:
-            with self.postgres.cursor() as curs:
-                film_ids = ["'{0}'".format(row['id']) for row in data]
-                query = """
-                    SELECT fw.id
-                    FROM film_work fw
-                    LEFT JOIN {table}_film_work gfw ON gfw.film_work_id = fw.id
-                    WHERE gfw.{table}_id IN ({film_ids})
-                    ORDER BY fw.modified;
-                """
-                curs.execute(query.format(table=table, film_ids=', '.join(film_ids)))
-                yield from curs
-        else:
-            yield from data
+            with self.postgres.connection() as conn, conn.cursor() as curs:
+                query = self.prepare_film_work_ids(conn, table)
+                curs.execute(query, ([row['id'] for row in data],))
+                return curs.fetchall()
+        return data
+
+    def prepare_film_work_ids(self, conn: DictConnection, table: str) -> str:
+        """Prepare the query of the films linked to persons or genres on a connection.
+
+        Args:
+            conn: Connection checked out for the query
+            table: Table name
+
+        Returns:
+            str: Statement executing the prepared query with an array of IDs
+        """
+        statement = 'film_work_ids_{table}'.format(table=table)
+        query = FILM_WORK_IDS_QUERY.format(table=table).replace('%s', '$1')
+        self.postgres.prepare(conn, statement, query)
+        return 'EXECUTE {statement} (%s::uuid[]);'.format(statement=statement)
 
+    @timed('get_director_ids')
     @backoff(errors=(InterfaceError, OperationalError))
-    def get_movie_data(self, film_ids: List[str]) -> Iterator[DictRow]:
+    def get_director_ids(self, person_ids: Iterable[str]) -> Set[str]:
+        """Retrieve the persons who direct at least one film.
+
+        Args:
+            person_ids: Person IDs
+
+        Returns:
+            Set: IDs of the persons who are directors
+        """
+        with self.postgres.connection() as conn, conn.cursor() as curs:
+            curs.execute(DIRECTOR_IDS_QUERY, (list(person_ids),))
+            return {str(row['id']) for row in curs}
+
+    @timed('get_movie_data')
+    @backoff(errors=(InterfaceError, OperationalError))
+    def get_movie_data(self, film_ids: Iterable[str]) -> List[DictRow]:
         """Retrieve all the necessary information for writing to the Elasticsearch index named 'movies'.
 
         Args:
             film_ids: Keys with film IDs
 
-        Yields:
-            DictRow: Data in PostgreSQL format with all the necessary information about movies
+        Returns:
+            List: Data in PostgreSQL format with all the necessary information about movies
         """
-        with self.postgres.cursor() as curs:
+        with self.postgres.connection() as conn, conn.cursor() as curs:
             film_ids = ["'{0}'".format(film_id) for film_id in film_ids]
             query = """
                 SELECT
@@ -117,4 +494,88 @@ class PostgresExtractor(object):
                 WHERE fw.id IN ({film_ids})
             """
             curs.execute(query.format(film_ids=', '.join(film_ids)))
-            yield from curs
+            return curs.fetchall()
+
+    @timed('get_movie_documents')
+    @backoff(errors=(InterfaceError, OperationalError))
+    def get_movie_documents(self, film_ids: Iterable[str]) -> List[DictRow]:
+        """Retrieve movies for the Elasticsearch index named 'movies' as one row per film.
+
+        - Persons are grouped by role and genres are aggregated by PostgreSQL,
+          so there is no cartesian product of persons and genres
+
+        Args:
+            film_ids: Keys with film IDs
+
+        Returns:
+            List: Data in PostgreSQL format with a film, its genre names and its persons by role
+        """
+        with self.postgres.connection() as conn, conn.cursor() as curs:
+            curs.execute(MOVIE_DOCUMENTS_QUERY, (list(film_ids),))
+            return curs.fetchall()
+
+    @timed('get_cached_movie_documents')
+    @backoff(errors=(InterfaceError, OperationalError))
+    def get_cached_movie_documents(self, film_ids: Iterable[str]) -> List[Dict]:
+        """Retrieve movies as one row per film, filling in person and genre names from the cache.
+
+        - PostgreSQL returns only the film columns with the IDs of its persons and genres,
+          and only the names missing in the cache are queried
+        - Rows have the shape of `get_movie_documents`, with names sorted the same way
+
+        Args:
+            film_ids: Keys with film IDs
+
+        Returns:
+            List: Data with a film, its genre names and its persons by role
+        """
+        with self.postgres.connection() as conn, conn.cursor() as curs:
+            curs.execute(MOVIE_LINKS_QUERY, (list(film_ids),))
+            rows = curs.fetchall()
+            names = self.lookup_names(curs, rows)
+        return [fill_names(row, names) for row in rows]
+
+    def lookup_names(self, curs: DictCursor, rows: List[DictRow]) -> Dict[NameKey, str]:
+        """Look up the person and genre names of rows of link IDs, querying only the ones missing in the cache.
+
+        Args:
+            curs: Cursor of the connection checked out for the movies
+            rows: Film columns with the IDs of its persons and genres
+
+        Returns:
+            Dict: Names by (table, ID)
+        """
+        names, missing = self.names.get_many(get_name_keys(rows))
+        for table, ids in group_ids(missing).items():
+            names.update(self.fetch_names(curs, table, ids))
+        return names
+
+    def fetch_names(self, curs: DictCursor, table: str, ids: List[str]) -> Dict[NameKey, str]:
+        """Query the names of persons or genres and add them to the cache.
+
+        Args:
+            curs: Cursor of the connection checked out for the movies
+            table: Table name
+            ids: Row IDs
+
+        Returns:
+            Dict: Names by (table, ID)
+        """
+        query = NAMES_QUERY.format(table=table, column=self.NAME_COLUMNS[table])
+        curs.execute(query, (ids,))
+        fetched = {(table, row['id']): row['name'] for row in curs}
+        self.names.update(fetched)
+        return fetched
+
+    def refresh_names(self, table: str, data: List[DictRow]):
+        """Replace the cached names of updated persons or genres.
+
+        Args:
+            table: Table name
+            data: Batch of updated rows
+        """
+        column = self.NAME_COLUMNS.get(table)
+        if column:
+            keys = [(table, str(row['id'])) for row in data]
+            names = [row[column] for row in data]
+            self.names.refresh(dict(zip(keys, names)))
@@ -0,0 +1,147 @@
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, Set
+
+from pydantic.dataclasses import dataclass
+from redis import Redis
+from redis.exceptions import ConnectionError
+
+from services.base import Config
+from core.config import LEASE_RENEW_INTERVAL, LEASE_TTL
+from core.decorators import backoff
+from core.logger import logger
+
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def get_key(name: str) -> str:
+    """Return the key of a lease.
+
+    Args:
+        name: Lease name.
+
+    Returns:
+        str: Key.
+    """
+    return 'lease:{name}'.format(name=name)
+
+
+@dataclass(config=Config)
+class LeaseManager(object):
+    """Class for claiming work shared by several ETL instances through expiring Redis leases.
+
+    - A lease is a key holding the ID of its owner, set only if it does not exist and expiring after `ttl` seconds
+    - Held leases are renewed by a heartbeat thread, so the leases of a dead instance expire and can be claimed
+    - Leases are renewed and released only by their owner
+    """
+
+    redis: Redis
+    ttl: int = LEASE_TTL
+    renew_interval: int = LEASE_RENEW_INTERVAL
+
+    def __post_init__(self):
+        """Generate the owner ID of this instance and register the Lua scripts."""
+        self.owner = uuid.uuid4().hex
+        self.ttl_ms = self.ttl * 1000
+        self.held: Set[str] = set()
+        self.lock = threading.Lock()
+        self.renew_lease = self.redis.register_script(RENEW_SCRIPT)
+        self.release_lease = self.redis.register_script(RELEASE_SCRIPT)
+
+    @backoff(errors=(ConnectionError,))
+    def acquire(self, name: str) -> bool:
+        """Claim a lease if no other instance holds it.
+
+        Args:
+            name: Lease name.
+
+        Returns:
+            bool: True if the lease has been claimed.
+        """
+        key = get_key(name)
+        claimed = self.redis.set(key, self.owner, nx=True, px=self.ttl_ms)
+        if not claimed:
+            return False
+        with self.lock:
+            self.held.add(name)
+        return True
+
+    @backoff(errors=(ConnectionError,))
+    def release(self, name: str):
+        """Release a lease held by this instance.
+
+        Args:
+            name: Lease name.
+        """
+        with self.lock:
+            self.held.discard(name)
+        self.release_lease(keys=[get_key(name)], args=[self.owner])
+
+    @contextmanager
+    def lease(self, name: str) -> Iterator[bool]:
+        """Context manager function for holding a lease while its work is done.
+
+        Args:
+            name: Lease name.
+
+        Yields:
+            bool: True if the lease has been claimed, False if another instance holds it.
+        """
+        if not self.acquire(name):
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            self.release(name)
+
+    def renew(self):
+        """Extend the leases held by this instance, forgetting the ones that have expired meanwhile."""
+        with self.lock:
+            names = list(self.held)
+        for name in names:
+            key = get_key(name)
+            renewed = self.renew_lease(keys=[key], args=[self.owner, self.ttl_ms])
+            if not renewed:
+                logger.warning('Lease {0} has expired and may be claimed by another instance.'.format(name))
+                with self.lock:
+                    self.held.discard(name)
+
+    @contextmanager
+    def heartbeat(self) -> Iterator[None]:
+        """Context manager function for renewing the held leases in a background thread."""
+        stopped = threading.Event()
+        thread = threading.Thread(
+            target=self.beat, args=(stopped,), name='lease-heartbeat', daemon=True,
+        )
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+
+    def beat(self, stopped: threading.Event):
+        """Renew the held leases every `renew_interval` seconds until stopped.
+
+        Args:
+            stopped: Event set when the heartbeat has to stop.
+        """
+        while not stopped.wait(self.renew_interval):
+            try:
+                self.renew()
+            except ConnectionError as error:
+                logger.error('Failed to renew leases: {0}'.format(error))
@@ -0,0 +1,89 @@
+import json
+import select
+import time
+from typing import Dict, Set
+
+from psycopg2.extensions import connection
+from pydantic.dataclasses import dataclass
+
+from services.base import Config
+from core.config import NOTIFY_CHANNEL, NOTIFY_DELAY, NOTIFY_MAX_CHANGES
+
+Changes = Dict[str, Set[str]]
+
+
+def count_changes(changes: Changes) -> int:
+    """Count the changed IDs of all tables.
+
+    Args:
+        changes: Changed IDs for each table
+
+    Returns:
+        int: Number of IDs
+    """
+    return sum(map(len, changes.values()))
+
+
+@dataclass(config=Config)
+class ChangeListener(object):
+    """Class for receiving notifications about changed rows from PostgreSQL.
+
+    - The notifications are sent by the triggers from `infra/data/etl_notify.sql`
+      as JSON with the table name and the row ID
+    """
+
+    postgres: connection
+    channel: str = NOTIFY_CHANNEL
+    delay: float = NOTIFY_DELAY
+    max_changes: int = NOTIFY_MAX_CHANGES
+
+    TABLES = ('film_work', 'person', 'genre')
+
+    def __post_init__(self):
+        """Subscribe to the notification channel."""
+        self.postgres.autocommit = True
+        with self.postgres.cursor() as curs:
+            curs.execute('LISTEN {channel};'.format(channel=self.channel))
+
+    def listen(self, timeout: float) -> Changes:
+        """Wait for changes and collect the ones that follow shortly after into a single batch.
+
+        - Waits up to `timeout` seconds for the first notification
+        - Then keeps collecting notifications for `delay` seconds or up to `max_changes`,
+          so bursts of changes are coalesced
+
+        Args:
+            timeout: Maximum time to wait for the first notification in seconds
+
+        Returns:
+            Changes: Changed IDs for each table
+        """
+        changes: Changes = {table: set() for table in self.TABLES}
+        if not self.receive(changes, timeout):
+            return changes
+        deadline = time.monotonic() + self.delay
+        while count_changes(changes) < self.max_changes:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.receive(changes, remaining)
+        return changes
+
+    def receive(self, changes: Changes, timeout: float) -> bool:
+        """Wait for notifications and add their IDs to the changes.
+
+        Args:
+            changes: Changed IDs for each table
+            timeout: Maximum time to wait in seconds
+
+        Returns:
+            bool: True if any notification has been received
+        """
+        if not self.postgres.notifies:
+            select.select([self.postgres], [], [], max(timeout, 0))
+            self.postgres.poll()
+        received = bool(self.postgres.notifies)
+        while self.postgres.notifies:
+            payload = json.loads(self.postgres.notifies.pop(0).payload)
+            changes[payload['table']].add(payload['id'])
+        return received
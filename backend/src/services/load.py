@@ -1,11 +1,163 @@
+import random
+import time
 from dataclasses import dataclass
-from typing import Dict, List, Union, ValuesView
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, cast
 
 from elasticsearch import Elasticsearch, helpers
-from elasticsearch.exceptions import ConnectionError
+from elasticsearch.exceptions import ConnectionError, TransportError
 
-from core.config import BATCH_SIZE, PostgresRow, Schemas
-from core.decorators import backoff
+from services.batching import BatchController
+from services.cache import FingerprintCache
+from services.spool import Spool
+from core.config import (
+    BULK_CHUNK_MAX,
+    BULK_CHUNK_MIN,
+    BULK_CHUNK_SIZE,
+    BULK_CHUNK_STEP,
+    BULK_CHUNK_TARGET,
+    BULK_INITIAL_BACKOFF,
+    BULK_MAX_BACKOFF,
+    BULK_MAX_CHUNK_BYTES,
+    BULK_MAX_RETRIES,
+    BULK_THREADS,
+    RECONCILE_PAGE_SIZE,
+    SPOOL_REPLAY_INTERVAL,
+    VALIDATION_SAMPLE_RATE,
+    PostgresRow,
+    Schemas,
+)
+from core.decorators import backoff, timed
+from core.logger import logger
+from core.metrics import (
+    BULK_ERRORS,
+    DOCUMENTS_DELETED,
+    DOCUMENTS_SKIPPED,
+    DOCUMENTS_UPDATED,
+    SPOOLED_ACTIONS,
+    observe_indexed,
+)
+from models.movie import Movie
+
+NOT_FOUND = 404
+
+TOO_MANY_REQUESTS = 429
+
+SERVICE_UNAVAILABLE = 503
+
+FORCEMERGE_TIMEOUT = 3600
+
+BulkOutcome = Tuple[List[Dict], List[Dict]]
+
+Requeue = Callable[[List[str]], None]
+
+RENAME_PERSONS_SCRIPT = """
+for (String field : params.fields) {
+    if (ctx._source[field] == null) {
+        continue;
+    }
+    List names = new ArrayList();
+    for (Map person : ctx._source[field]) {
+        if (params.names.containsKey(person.id)) {
+            person.name = params.names[person.id];
+        }
+        names.add(person.name);
+    }
+    ctx._source[field + '_names'] = names;
+}
+"""
+
+RENAME_GENRES_SCRIPT = """
+List genres = ctx._source.genre;
+if (genres == null) {
+    return;
+}
+for (int i = 0; i < genres.size(); i++) {
+    if (params.names.containsKey(genres[i])) {
+        genres[i] = params.names[genres[i]];
+    }
+}
+"""
+
+
+def serialize(schema: Schemas, document: PostgresRow, validation_rate: float) -> Dict:
+    """Build the source of a document, validating a random sample of documents by the schema.
+
+    Args:
+        schema: Schema
+        document: Document data
+        validation_rate: Share of documents to validate
+
+    Returns:
+        Dict: Source of the document
+    """
+    if validation_rate and random.random() < validation_rate:
+        return schema(**document).dict()
+    return schema.serialize(cast(Dict[str, Any], document))
+
+
+def check_errors(errors: List[Dict]):
+    """Raise if Elasticsearch failed to process any item of a bulk request.
+
+    Args:
+        errors: Failed items returned by the loader
+
+    Raises:
+        BulkIndexError: Some documents were not processed
+    """
+    if errors:
+        raise helpers.BulkIndexError('{0} document(s) failed to index.'.format(len(errors)), errors)
+
+
+def get_failed_ids(errors: List[Dict]) -> List[str]:
+    """Return the IDs of the documents that Elasticsearch failed to process.
+
+    Args:
+        errors: Failed items returned by the loader
+
+    Returns:
+        List: Document IDs
+    """
+    return [str(action['_id']) for error in errors for action in error.values()]
+
+
+def is_unavailable(error: TransportError) -> bool:
+    """Check whether an error means that Elasticsearch is unreachable or overloaded.
+
+    Args:
+        error: Error of a request
+
+    Returns:
+        bool: True if the request may succeed later
+    """
+    return isinstance(error, ConnectionError) or error.status_code in {TOO_MANY_REQUESTS, SERVICE_UNAVAILABLE}
+
+
+def is_failure(ok: bool, response: Dict) -> bool:
+    """Check whether a bulk action failed, deleting a missing document being no failure.
+
+    Args:
+        ok: Success flag of the action
+        response: Response to the action
+
+    Returns:
+        bool: True if the action failed
+    """
+    if ok:
+        return False
+    outcome = next(iter(response.values()))
+    return 'delete' not in response or outcome.get('status') != NOT_FOUND
+
+
+def get_pending(actions: Iterable[Dict]) -> Dict[str, Dict]:
+    """Return bulk actions by document ID.
+
+    Args:
+        actions: Bulk actions
+
+    Returns:
+        Dict: Bulk actions by document ID
+    """
+    return {str(action['_id']): action for action in actions}
 
 
 @dataclass
@@ -13,9 +165,22 @@ class ElasticsearchLoader(object):
     """Class for validating and loading data into ElasticSearch."""
 
     elastic: Elasticsearch
+    threads: int = BULK_THREADS
+    chunk_size: int = BULK_CHUNK_SIZE
+    max_chunk_bytes: int = BULK_MAX_CHUNK_BYTES
+    max_retries: int = BULK_MAX_RETRIES
+    reindex: bool = False
+    fingerprints: Optional[FingerprintCache] = None
+    validation_rate: float = VALIDATION_SAMPLE_RATE
+    partial_updates: bool = False
+    spool: Optional[Spool] = None
+    requeue: Optional[Requeue] = None
+
+    PERSON_ROLES = ('actors', 'writers')
 
     SETTINGS = {
         'refresh_interval': '1s',
+        'number_of_replicas': 1,
         'analysis': {
             'filter': {
                 'english_stop': {'type': 'stop', 'stopwords': '_english_'},
@@ -37,6 +202,11 @@ class ElasticsearchLoader(object):
         },
     }
 
+    BULK_SETTINGS = {
+        'refresh_interval': '-1',
+        'number_of_replicas': 0,
+    }
+
     INDICES = {
         'movies': {
             'id': {'type': 'keyword'},
@@ -69,31 +239,592 @@ class ElasticsearchLoader(object):
 
     @backoff(errors=(ConnectionError,))
     def __post_init__(self):
-        """Initialize the class and create indices with the corresponding settings and data schema."""
-        for index, properties in self.INDICES.items():
-            if not self.elastic.indices.exists(index=index):
-                body = {
-                    'settings': self.SETTINGS,
-                    'mappings': {
-                        'dynamic': 'strict',
-                        'properties': properties,
-                    },
-                }
-                self.elastic.indices.create(index=index, body=body)
+        """Initialize the class and create indices with the corresponding settings and data schema.
+
+        - In reindex mode, creates a new version of every index with settings for bulk loading
+        - Bulk chunks start at `chunk_size` and are tuned from the latency and rejections of bulk requests
+        """
+        self.chunks = BatchController(
+            'bulk', self.chunk_size, BULK_CHUNK_MIN, BULK_CHUNK_MAX, BULK_CHUNK_TARGET, BULK_CHUNK_STEP,
+        )
+        self.targets: Dict[str, str] = {}
+        for index in self.INDICES:
+            if self.reindex:
+                version = self.get_next_version(index)
+                self.targets[index] = self.create_index(index, version, self.BULK_SETTINGS)
+            elif not self.elastic.indices.exists(index=index):
+                self.create_index(index, index)
+
+    def create_index(self, alias: str, index: str, settings: Optional[Dict] = None) -> str:
+        """Create an index with the settings and data schema of an alias.
+
+        Args:
+            alias: Name under which the index is searched
+            index: Name of the index to create
+            settings: Settings overriding the default ones
+
+        Returns:
+            str: Name of the created index
+        """
+        self.elastic.indices.create(index=index, body=self.get_body(alias, settings))
+        return index
+
+    @classmethod
+    def get_body(cls, alias: str, settings: Optional[Dict] = None) -> Dict:
+        """Return the settings and data schema of an index.
 
+        Args:
+            alias: Name under which the index is searched
+            settings: Settings overriding the default ones
+
+        Returns:
+            Dict: Body of the index creation request
+        """
+        return {
+            'settings': {**cls.SETTINGS, **(settings or {})},
+            'mappings': {
+                'dynamic': 'strict',
+                'properties': cls.INDICES[alias],
+            },
+        }
+
+    def get_next_version(self, alias: str) -> str:
+        """Return the name of the next version of an index, e.g. 'movies_v2'.
+
+        Args:
+            alias: Name under which the index is searched
+
+        Returns:
+            str: Name of the new index
+        """
+        prefix = '{alias}_v'.format(alias=alias)
+        versions = [
+            int(index[len(prefix):])
+            for index in self.elastic.indices.get(index='{prefix}*'.format(prefix=prefix))
+            if index[len(prefix):].isdigit()
+        ]
+        return '{prefix}{version}'.format(prefix=prefix, version=max(versions, default=0) + 1)
+
+    @backoff(errors=(ConnectionError,))
+    def swap_indices(self):
+        """Finish the reindex and make the new indices searchable.
+
+        - Restores the default refresh interval and number of replicas
+        - Merges segments of the new index
+        - Atomically points the alias to the new index and deletes the previous one
+        """
+        for alias, index in self.targets.items():
+            self.elastic.indices.put_settings(
+                index=index,
+                body={setting: self.SETTINGS[setting] for setting in self.BULK_SETTINGS},
+            )
+            self.elastic.indices.refresh(index=index)
+            self.elastic.indices.forcemerge(index=index, max_num_segments=1, request_timeout=FORCEMERGE_TIMEOUT)
+            actions = self.get_alias_actions(alias, index)
+            self.elastic.indices.update_aliases(body={'actions': actions})
+            if self.fingerprints:
+                self.fingerprints.clear(alias)
+        self.targets = {}
+
+    def get_alias_actions(self, alias: str, index: str) -> List[Dict]:
+        """Return the actions pointing an alias to a new index and deleting the indices it pointed to.
+
+        Args:
+            alias: Name under which the index is searched
+            index: Name of the new index
+
+        Returns:
+            List: Alias actions
+        """
+        actions: List[Dict] = []
+        if self.elastic.indices.exists(index=alias):
+            old = self.elastic.indices.get(index=alias)
+            actions.extend({'remove_index': {'index': name}} for name in old)
+        actions.append({'add': {'index': index, 'alias': alias}})
+        return actions
+
+    @timed('bulk_insert')
     @backoff(errors=(ConnectionError,))
-    def bulk_insert(self, schema: Schemas, data: Union[List[PostgresRow], ValuesView[Dict]]):
+    def bulk_insert(self, schema: Schemas, data: Iterable[PostgresRow]) -> List[Dict]:
         """Validate and load data.
 
+        - Documents are built from trusted data without validation, except for a random sample
+          of `validation_rate` of them that are validated by the schema
+        - With a fingerprint cache, documents identical to the ones last written are skipped,
+          except in reindex mode, where the new index starts empty
+
         Args:
             schema: Schema
             data: List of data
+
+        Returns:
+            List: Items that Elasticsearch failed to index
         """
-        actions = (
+        actions = [
             {
-                '_index': schema._index,
+                '_index': self.targets.get(schema._index, schema._index),
                 '_id': document['id'],
-                '_source': schema(**document).dict(),
+                '_source': serialize(schema, document, self.validation_rate),
             } for document in data
+        ]
+        return self.index(schema._index, actions)
+
+    @timed('bulk_insert')
+    @backoff(errors=(ConnectionError,))
+    def bulk_insert_serialized(self, schema: Schemas, sources: Dict[str, str]) -> List[Dict]:
+        """Load documents already serialized to JSON, e.g. by transform worker processes.
+
+        Args:
+            schema: Schema
+            sources: Document IDs with documents serialized by `services.cache.dumps`
+
+        Returns:
+            List: Items that Elasticsearch failed to index
+        """
+        actions = [
+            {
+                '_index': self.targets.get(schema._index, schema._index),
+                '_id': document_id,
+                '_source': source,
+            } for document_id, source in sources.items()
+        ]
+        return self.index(schema._index, actions)
+
+    def index(self, index: str, actions: List[Dict]) -> List[Dict]:
+        """Send index actions, skipping unchanged documents if there is a fingerprint cache.
+
+        Args:
+            index: Index name
+            actions: Index actions
+
+        Returns:
+            List: Items that Elasticsearch failed to index
+        """
+        if self.fingerprints and not self.targets:
+            return self.index_changed(self.fingerprints, index, actions)
+        errors = self.write(index, actions)
+        if errors is None:
+            return []
+        observe_indexed(index, len(actions), errors)
+        return errors
+
+    def index_changed(self, cache: FingerprintCache, index: str, actions: List[Dict]) -> List[Dict]:
+        """Send the index actions with changed documents and remember the fingerprints of the written ones.
+
+        Args:
+            cache: Fingerprints of the documents last written
+            index: Index name
+            actions: Index actions
+
+        Returns:
+            List: Items that Elasticsearch failed to index
+        """
+        changed, fingerprints = cache.filter(index, actions)
+        skipped = len(actions) - len(changed)
+        if skipped:
+            logger.info('Skipped {0} of {1} unchanged documents in {2}.'.format(skipped, len(actions), index))
+        DOCUMENTS_SKIPPED.labels(index).inc(skipped)
+        errors = self.write(index, changed)
+        if errors is None:
+            return []
+        for document_id in get_failed_ids(errors):
+            fingerprints.pop(document_id, None)
+        cache.update(index, fingerprints)
+        observe_indexed(index, len(changed), errors)
+        return errors
+
+    @timed('bulk_delete')
+    @backoff(errors=(ConnectionError,))
+    def bulk_delete(self, index: str, ids: Iterable[str]) -> List[Dict]:
+        """Delete documents from an index.
+
+        Args:
+            index: Index name
+            ids: Document IDs
+
+        Returns:
+            List: Items that Elasticsearch failed to delete
+        """
+        actions = [
+            {
+                '_op_type': 'delete',
+                '_index': self.targets.get(index, index),
+                '_id': document_id,
+            } for document_id in ids
+        ]
+        if self.fingerprints and not self.targets:
+            self.fingerprints.forget(index, (action['_id'] for action in actions))
+        errors = self.write(index, actions)
+        if errors is None:
+            return []
+        DOCUMENTS_DELETED.labels(index).inc(len(actions) - len(errors))
+        BULK_ERRORS.labels(index).inc(len(errors))
+        return errors
+
+    @backoff(errors=(ConnectionError,))
+    def get_sources(self, index: str, ids: Iterable[str]) -> Dict[str, Dict]:
+        """Read the documents currently stored in an index.
+
+        Args:
+            index: Index name
+            ids: Document IDs
+
+        Returns:
+            Dict: Document IDs with the sources of the documents that were found
+        """
+        ids = [str(document_id) for document_id in ids]
+        if not ids:
+            return {}
+        response = self.elastic.mget(index=index, body={'ids': ids})
+        return {
+            document['_id']: document['_source']
+            for document in response['docs']
+            if document.get('found')
+        }
+
+    @timed('rename_persons')
+    def rename_persons(self, names: Dict[str, str]) -> int:
+        """Update the names of persons inside the movies they act in or write.
+
+        Args:
+            names: Person IDs with their new names
+
+        Returns:
+            int: Number of updated movies
+        """
+        if not names:
+            return 0
+        script_params = {'names': names, 'fields': self.PERSON_ROLES}
+        return self.update_movies(self.persons_query(names), RENAME_PERSONS_SCRIPT, script_params)
+
+    @timed('rename_genres')
+    def rename_genres(self, names: Dict[str, str]) -> int:
+        """Update the names of genres inside movies.
+
+        Args:
+            names: Old genre names with the new ones
+
+        Returns:
+            int: Number of updated movies
+        """
+        if not names:
+            return 0
+        query = {'terms': {'genre': list(names)}}
+        return self.update_movies(query, RENAME_GENRES_SCRIPT, {'names': names})
+
+    @backoff(errors=(ConnectionError,))
+    def update_movies(self, query: Dict, script: str, script_params: Dict) -> int:
+        """Apply a script to the movies matching a query inside Elasticsearch.
+
+        - Fingerprints of the matching movies are forgotten, as their documents change outside of bulk_insert
+
+        Args:
+            query: Query selecting the movies
+            script: Painless script
+            script_params: Script parameters
+
+        Returns:
+            int: Number of updated movies
+        """
+        index = Movie._index
+        if self.fingerprints:
+            movie_ids = self.get_movie_ids(query)
+            self.fingerprints.forget(index, movie_ids)
+        response = self.elastic.update_by_query(
+            index=index,
+            body={'query': query, 'script': {'source': script, 'lang': 'painless', 'params': script_params}},
+            conflicts='proceed',
+            refresh=True,
+            slices='auto',
+            request_timeout=FORCEMERGE_TIMEOUT,
+        )
+        if response.get('version_conflicts'):
+            logger.warning('Skipped {0} movies changed during the update.'.format(response['version_conflicts']))
+        DOCUMENTS_UPDATED.labels(index).inc(response.get('updated', 0))
+        return response.get('updated', 0)
+
+    @classmethod
+    def persons_query(cls, ids: Iterable[str]) -> Dict:
+        """Return a query selecting the movies that list any of the persons as actors or writers.
+
+        Args:
+            ids: Person IDs
+
+        Returns:
+            Dict: Query
+        """
+        ids = [str(person_id) for person_id in ids]
+        return {'bool': {'should': [
+            {'nested': {
+                'path': role,
+                'query': {'terms': {'{role}.id'.format(role=role): ids}},
+            }}
+            for role in cls.PERSON_ROLES
+        ]}}
+
+    def get_movie_ids(self, query: Dict) -> Iterator[str]:
+        """Iterate the IDs of the movies matching a query.
+
+        Args:
+            query: Query selecting the movies
+
+        Yields:
+            str: Movie ID
+        """
+        body = {'query': query, '_source': False}
+        hits = helpers.scan(self.elastic, index=Movie._index, query=body)
+        yield from (hit['_id'] for hit in hits)
+
+    def get_ids(self, index: str, page_size: int = RECONCILE_PAGE_SIZE) -> Iterator[List[str]]:
+        """Retrieve all document IDs of an index in ascending order.
+
+        - Pages through the index sorted by the 'id' field with search_after,
+          which matches the order of UUIDs in PostgreSQL
+
+        Args:
+            index: Index name
+            page_size: Number of IDs per page
+
+        Yields:
+            list: Page of IDs
+        """
+        search_after = None
+        while hits := self.get_ids_page(index, search_after, page_size):
+            yield [hit['sort'][0] for hit in hits]
+            search_after = hits[-1]['sort']
+
+    @backoff(errors=(ConnectionError,))
+    def get_ids_page(self, index: str, search_after: Optional[List], page_size: int) -> List[Dict]:
+        """Retrieve a page of document IDs of an index following the last sort values.
+
+        Args:
+            index: Index name
+            search_after: Sort values of the last hit of the previous page, or None for the first page
+            page_size: Number of IDs per page
+
+        Returns:
+            List: Hits with the ID as their sort value
+        """
+        body = {
+            'query': {'match_all': {}},
+            'sort': [{'id': 'asc'}],
+            '_source': False,
+            'size': page_size,
+        }
+        if search_after:
+            body['search_after'] = search_after
+        return self.elastic.search(index=index, body=body)['hits']['hits']
+
+    def write(self, index: str, actions: List[Dict]) -> Optional[List[Dict]]:
+        """Send bulk actions, or append them to the spool while Elasticsearch cannot take them.
+
+        - Without a spool, errors are raised to the caller
+        - While the spool holds actions, it is replayed first and new actions are spooled behind it,
+          so every document is written in order
+
+        Args:
+            index: Index name
+            actions: Bulk actions
+
+        Returns:
+            List: Items that Elasticsearch failed to process, or None if the actions were spooled
+        """
+        if not self.spool:
+            return self.bulk(actions)
+        errors = self.try_bulk(actions) if self.spool.empty else None
+        if errors is not None:
+            return errors
+        with self.spool.lock:
+            errors = self.try_bulk(actions) if self.replay_spool() else None
+            if errors is not None:
+                return errors
+            logger.warning('Spooling {0} actions.'.format(len(actions)))
+            self.spool.append(actions)
+        SPOOLED_ACTIONS.labels(index).inc(len(actions))
+        return None
+
+    def try_bulk(self, actions: List[Dict]) -> Optional[List[Dict]]:
+        """Send bulk actions unless Elasticsearch is unavailable.
+
+        Args:
+            actions: Bulk actions
+
+        Returns:
+            List: Items that Elasticsearch failed to process, or None if Elasticsearch is unavailable
+        """
+        try:
+            return self.bulk(actions)
+        except TransportError as error:
+            if not is_unavailable(error):
+                raise
+            logger.warning('Elasticsearch is unavailable: {0}'.format(error))
+        return None
+
+    def replay_spool(self) -> bool:
+        """Send the spooled actions in order, removing each segment once it has been loaded.
+
+        - A segment interrupted by an error is replayed again from its start,
+          which is safe as actions carry their document IDs
+        - After a failure, the next replay waits `SPOOL_REPLAY_INTERVAL` seconds,
+          so writes are spooled without waiting for an unavailable cluster every time
+
+        Returns:
+            bool: True if the spool is empty, False if Elasticsearch is still unavailable
+        """
+        if not self.spool:
+            return True
+        with self.spool.lock:
+            if self.spool.empty:
+                return True
+            if time.monotonic() < self.spool.retry_at:
+                return False
+            self.spool.seal()
+            segments = list(self.spool.segments)
+            return all(self.replay_segment(self.spool, segment) for segment in segments)
+
+    def replay_segment(self, spool: Spool, segment: str) -> bool:
+        """Send the actions of a spooled segment and remove it once they have been loaded.
+
+        - Movies that Elasticsearch failed to index are queued again by `requeue_failed` before the segment is removed
+
+        Args:
+            spool: Spool holding the segment
+            segment: Segment path
+
+        Returns:
+            bool: True if the segment was loaded, False if Elasticsearch is still unavailable
+        """
+        try:
+            for actions in spool.read(segment):
+                self.requeue_failed(actions, self.bulk(actions))
+        except TransportError as error:
+            if not is_unavailable(error):
+                raise
+            logger.warning('Elasticsearch is still unavailable, keeping the spool: {0}'.format(error))
+            spool.retry_at = time.monotonic() + SPOOL_REPLAY_INTERVAL
+            return False
+        spool.remove(segment)
+        logger.info('Replayed the spooled segment {0}.'.format(segment))
+        return True
+
+    def requeue_failed(self, actions: List[Dict], errors: List[Dict]):
+        """Put the movies of a spooled record that Elasticsearch failed to index back in the queue.
+
+        - The callers of spooled writes did not see these errors, so the movies are built and loaded again
+        - A record holds the actions of a single write, so all of them have the same index and operation
+        - Failed actions of the other indices and failed deletes are only logged
+
+        Args:
+            actions: Bulk actions of the record
+            errors: Items that Elasticsearch failed to process
+        """
+        if not errors:
+            return
+        logger.error('{0} spooled document(s) failed to load.'.format(len(errors)))
+        first = actions[0]
+        is_movie = first['_index'] == self.targets.get(Movie._index, Movie._index)
+        if self.requeue and is_movie and first.get('_op_type') != 'delete':
+            self.requeue(get_failed_ids(errors))
+
+    def bulk(self, actions: List[Dict]) -> List[Dict]:
+        """Send bulk actions and retry the ones rejected by Elasticsearch with exponential backoff.
+
+        Args:
+            actions: List of bulk actions
+
+        Returns:
+            List: Items that Elasticsearch failed to process
+        """
+        errors: List[Dict] = []
+        delay = BULK_INITIAL_BACKOFF
+        for attempt in range(self.max_retries + 1):
+            actions, failures = self.send_once(actions, retry=attempt < self.max_retries)
+            errors.extend(failures)
+            if not actions:
+                break
+            logger.warning('Elasticsearch rejected {0} documents, retrying in {1} seconds.'.format(
+                len(actions), delay,
+            ))
+            time.sleep(delay)
+            delay = min(delay * 2, BULK_MAX_BACKOFF)
+        return errors
+
+    def send_once(self, actions: List[Dict], retry: bool) -> BulkOutcome:
+        """Send bulk actions once, tuning the chunk size from the latency and rejections.
+
+        Args:
+            actions: List of bulk actions
+            retry: Whether actions rejected by an overloaded cluster will be retried
+
+        Raises:
+            TransportError: The request failed, or was rejected and will not be retried
+
+        Returns:
+            tuple: Actions rejected to be retried and items that Elasticsearch failed to process
+        """
+        pending = get_pending(actions)
+        started = time.monotonic()
+        try:
+            rejected, errors = self.check_responses(pending, retry)
+        except TransportError as error:
+            if error.status_code != TOO_MANY_REQUESTS or not retry:
+                raise
+            rejected, errors = list(pending.values()), []
+        self.chunks.observe(
+            len(pending),
+            time.monotonic() - started,
+            rejected=bool(rejected),
+        )
+        return rejected, errors
+
+    def check_responses(self, pending: Dict[str, Dict], retry: bool) -> BulkOutcome:
+        """Send bulk actions and sort out the ones that failed.
+
+        Args:
+            pending: Bulk actions by document ID
+            retry: Whether actions rejected by an overloaded cluster will be retried
+
+        Returns:
+            tuple: Actions rejected to be retried and items that Elasticsearch failed to process
+        """
+        rejected: List[Dict] = []
+        errors: List[Dict] = []
+        for ok, response in self.send(pending.values()):
+            if not is_failure(ok, response):
+                continue
+            outcome = next(iter(response.values()))
+            if retry and outcome.get('status') == TOO_MANY_REQUESTS:
+                rejected.append(pending[str(outcome['_id'])])
+            else:
+                logger.error('Failed to process document: {0}'.format(response))
+                errors.append(response)
+        return rejected, errors
+
+    def send(self, actions: Iterable[Dict]) -> Iterator[Tuple[bool, Dict]]:
+        """Send bulk actions in chunks limited by count and size.
+
+        - With more than one thread, chunks are sent concurrently
+
+        Args:
+            actions: Bulk actions
+
+        Returns:
+            Iterator: Result of each action
+        """
+        if self.threads > 1:
+            return helpers.parallel_bulk(
+                self.elastic,
+                actions,
+                thread_count=self.threads,
+                queue_size=self.threads,
+                chunk_size=self.chunks.size,
+                max_chunk_bytes=self.max_chunk_bytes,
+                raise_on_error=False,
+            )
+        return helpers.streaming_bulk(
+            self.elastic,
+            actions,
+            chunk_size=self.chunks.size,
+            max_chunk_bytes=self.max_chunk_bytes,
+            raise_on_error=False,
         )
-        helpers.bulk(self.elastic, actions, chunk_size=BATCH_SIZE)
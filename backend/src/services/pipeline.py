@@ -0,0 +1,179 @@
+from dataclasses import dataclass, field
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from typing import Any, Callable, Iterable, List, Optional
+
+from core.config import PIPELINE_QUEUE_SIZE
+
+POLL_INTERVAL = 0.1
+
+SENTINEL = object()
+
+
+@dataclass
+class Stage(object):
+    """Step of a pipeline run by one or more threads.
+
+    Attributes:
+        func: Function applied to every item; its result is passed to the next stage.
+        workers: Number of threads running the function.
+    """
+
+    func: Callable[[Any], Any]
+    workers: int = 1
+
+
+@dataclass
+class Pipeline(object):
+    """Class for running stages concurrently, connected by bounded queues.
+
+    - Each stage works on its own items, so the throughput is that of the slowest stage
+    - Bounded queues stop fast stages from running ahead of slow ones
+    - The first error stops all stages and is raised from `run`
+    """
+
+    stages: List[Stage]
+    queue_size: int = PIPELINE_QUEUE_SIZE
+    errors: List[BaseException] = field(default_factory=list, init=False)
+
+    def run(self, source: Iterable[Any]):
+        """Feed items from the source through all stages and wait until they are processed.
+
+        Args:
+            source: Items for the first stage.
+
+        Raises:
+            BaseException: The first error raised by a stage.
+        """
+        self.stop = Event()
+        self.errors = []
+        queues: List[Queue] = [Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads = self.start(queues)
+        self.feed(queues[0], source)
+        for inbox, stage_threads in zip(queues, threads):
+            self.join_stage(inbox, stage_threads)
+        if self.errors:
+            raise self.errors[0]
+
+    def start(self, queues: List[Queue]) -> List[List[Thread]]:
+        """Start the threads of all stages, each stage passing its output to the queue of the next one.
+
+        Args:
+            queues: Queue with items for each stage.
+
+        Returns:
+            List: Started threads of each stage.
+        """
+        outboxes: List[Optional[Queue]] = [*queues[1:], None]
+        return [
+            self.start_stage(stage, inbox, outbox)
+            for stage, inbox, outbox in zip(self.stages, queues, outboxes)
+        ]
+
+    def start_stage(self, stage: Stage, inbox: Queue, outbox: Optional[Queue]) -> List[Thread]:
+        """Start the threads of a stage.
+
+        Args:
+            stage: Stage to run.
+            inbox: Queue with items for the stage.
+            outbox: Queue with items for the next stage, if any.
+
+        Returns:
+            List: Started threads.
+        """
+        threads = [
+            Thread(target=self.work, args=(stage, inbox, outbox), daemon=True)
+            for _ in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def feed(self, queue: Queue, source: Iterable[Any]):
+        """Put items from the source into the queue of the first stage until it is exhausted or the pipeline stops.
+
+        Args:
+            queue: Queue of the first stage.
+            source: Items for the first stage.
+        """
+        try:
+            for element in source:
+                if not self.put(queue, element):
+                    break
+        except BaseException as error:
+            self.fail(error)
+
+    def join_stage(self, inbox: Queue, threads: List[Thread]):
+        """Send a sentinel to every thread of a stage and wait for them to finish.
+
+        Args:
+            inbox: Queue with items for the stage.
+            threads: Threads of the stage.
+        """
+        for _ in threads:
+            self.put(inbox, SENTINEL)
+        for thread in threads:
+            thread.join()
+
+    def work(self, stage: Stage, inbox: Queue, outbox: Optional[Queue]):
+        """Process items of a stage until the sentinel is received or the pipeline stops.
+
+        Args:
+            stage: Stage to run.
+            inbox: Queue with items for the stage.
+            outbox: Queue with items for the next stage, if any.
+        """
+        while not self.stop.is_set():
+            try:
+                element = inbox.get(timeout=POLL_INTERVAL)
+            except Empty:
+                continue
+            if element is SENTINEL or not self.process(stage, element, outbox):
+                return
+
+    def process(self, stage: Stage, element: Any, outbox: Optional[Queue]) -> bool:
+        """Apply the function of a stage to an item and pass its result to the next stage.
+
+        Args:
+            stage: Stage to run.
+            element: Item for the stage.
+            outbox: Queue with items for the next stage, if any.
+
+        Returns:
+            bool: False if the function raised an error and the pipeline has stopped.
+        """
+        try:
+            output = stage.func(element)
+        except BaseException as error:
+            self.fail(error)
+            return False
+        if outbox is not None and output is not None:
+            self.put(outbox, output)
+        return True
+
+    def put(self, queue: Queue, element: Any) -> bool:
+        """Put an item into a queue, waiting for free space unless the pipeline stops.
+
+        Args:
+            queue: Queue.
+            element: Item.
+
+        Returns:
+            bool: False if the pipeline has stopped.
+        """
+        while not self.stop.is_set():
+            try:
+                queue.put(element, timeout=POLL_INTERVAL)
+            except Full:
+                continue
+            return True
+        return False
+
+    def fail(self, error: BaseException):
+        """Record an error and stop all stages.
+
+        Args:
+            error: Error raised by a stage.
+        """
+        self.errors.append(error)
+        self.stop.set()
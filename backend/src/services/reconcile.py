@@ -0,0 +1,140 @@
+import time
+from dataclasses import dataclass
+from itertools import chain, islice
+from typing import Iterable, Iterator, List, Set
+
+from services.extract import PostgresExtractor
+from services.load import ElasticsearchLoader
+from services.transform import DataTransform
+from core.config import BATCH_SIZE, RECONCILE_INTERVAL, TABLE_SCHEMAS
+from core.decorators import timed
+from core.logger import logger
+
+Pages = Iterable[List[str]]
+
+
+def missing_ids(source: Pages, target: Pages) -> Iterator[str]:
+    """Iterate the IDs present in the target but not in the source.
+
+    - Both sides are merged as sorted streams, so memory does not grow with the size of the tables
+
+    Args:
+        source: Pages of IDs in ascending order, e.g. from PostgreSQL
+        target: Pages of IDs in ascending order, e.g. from Elasticsearch
+
+    Yields:
+        str: ID missing in the source
+    """
+    source_ids = chain.from_iterable(source)
+    source_id = next(source_ids, None)
+    for target_id in chain.from_iterable(target):
+        while source_id is not None and source_id < target_id:
+            source_id = next(source_ids, None)
+        if source_id != target_id:
+            yield target_id
+
+
+@dataclass
+class Reconciler(object):
+    """Class for deleting documents whose rows no longer exist in PostgreSQL."""
+
+    postgres: PostgresExtractor
+    data: DataTransform
+    elastic: ElasticsearchLoader
+    interval: float = RECONCILE_INTERVAL
+
+    def __post_init__(self):
+        """Make the first reconcile due at once."""
+        self.due = time.monotonic()
+
+    def reconcile_if_due(self, queue: str = 'movie_ids') -> int:
+        """Reconcile if `interval` seconds have passed since the end of the previous reconcile.
+
+        Args:
+            queue: Key of the movies to be updated.
+
+        Returns:
+            int: Number of deleted documents, 0 if the reconcile is not due
+        """
+        if time.monotonic() < self.due:
+            return 0
+        deleted = self.reconcile(queue)
+        self.due = time.monotonic() + self.interval
+        return deleted
+
+    @timed('reconcile')
+    def reconcile(self, queue: str = 'movie_ids') -> int:
+        """Compare the IDs of every table with its index and delete the orphaned documents.
+
+        - Movies that list deleted persons or genres are collected to be rebuilt
+
+        Args:
+            queue: Key of the movies to be updated.
+
+        Returns:
+            int: Number of deleted documents
+        """
+        deleted = 0
+        for table in TABLE_SCHEMAS:
+            orphans = self.get_orphans(table)
+            while ids := list(islice(orphans, BATCH_SIZE)):
+                deleted += self.delete(table, ids, queue)
+        logger.info('Reconcile deleted {0} documents.'.format(deleted))
+        return deleted
+
+    def get_orphans(self, table: str) -> Iterator[str]:
+        """Iterate the IDs indexed from a table that are missing in it.
+
+        Args:
+            table: Table name.
+
+        Returns:
+            Iterator: IDs of the orphaned documents
+        """
+        indexed = self.elastic.get_ids(TABLE_SCHEMAS[table]._index)
+        return missing_ids(self.postgres.get_ids(table), indexed)
+
+    def delete(self, table: str, ids: List[str], queue: str) -> int:
+        """Delete the documents of removed rows.
+
+        - IDs are checked again, as rows may have been inserted and loaded during the scan
+        - Documents that failed to delete are not counted and are found again by the next reconcile,
+          while documents that were already missing are no failure
+
+        Args:
+            table: Table name.
+            ids: IDs missing in the table.
+            queue: Key of the movies to be updated.
+
+        Returns:
+            int: Number of deleted documents
+        """
+        ids = sorted(set(ids) - self.postgres.get_existing_ids(table, ids))
+        if not ids:
+            return 0
+        if table != 'film_work':
+            self.data.collector(queue, self.get_movie_ids(table, ids))
+        errors = self.elastic.bulk_delete(TABLE_SCHEMAS[table]._index, ids)
+        if errors:
+            logger.error('Reconcile failed to delete {0} documents of {1}.'.format(len(errors), table))
+        return len(ids) - len(errors)
+
+    def get_movie_ids(self, table: str, ids: List[str]) -> Set[str]:
+        """Find the movies that list removed persons or genres.
+
+        - Directors are stored in movies without IDs, so their movies are not found
+
+        Args:
+            table: Table name, 'person' or 'genre'.
+            ids: Removed IDs.
+
+        Returns:
+            Set: Movie IDs
+        """
+        if table == 'person':
+            return set(self.elastic.get_movie_ids(self.elastic.persons_query(ids)))
+        genres = self.elastic.get_sources(TABLE_SCHEMAS[table]._index, ids)
+        names = [genre['name'] for genre in genres.values()]
+        if not names:
+            return set()
+        return set(self.elastic.get_movie_ids({'terms': {'genre': names}}))
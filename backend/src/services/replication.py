@@ -0,0 +1,137 @@
+import json
+import select
+import time
+from contextlib import suppress
+from typing import Any, Dict, Optional, Tuple
+
+from psycopg2.errors import DuplicateObject
+from psycopg2.extras import LogicalReplicationConnection, ReplicationMessage
+from pydantic.dataclasses import dataclass
+
+from services.base import Config
+from services.listen import Changes, count_changes
+from core.config import NOTIFY_DELAY, NOTIFY_MAX_CHANGES, REPLICATION_SLOT
+
+
+def get_value(change: Dict[str, Any], column: str) -> Any:
+    """Return the value of a column from the new row or, for deletes, from the old one.
+
+    Args:
+        change: Change in wal2json format
+        column: Column name
+
+    Returns:
+        Any: Column value
+    """
+    columns = change.get('columns', []) + change.get('identity', [])
+    for value in columns:
+        if value['name'] == column:
+            return value['value']
+    return None
+
+
+@dataclass(config=Config)
+class ReplicationExtractor(object):
+    """Class for capturing changes from a logical replication slot decoded by wal2json.
+
+    - Inserts, updates and deletes of the content tables are mapped to the affected film, person and genre IDs
+    - Changes of the link tables are mapped to their films, which requires `REPLICA IDENTITY FULL`
+      on them (see `infra/data/etl_replication.sql`) so that deletes carry the film ID
+    - Consumed changes are confirmed to PostgreSQL only by `acknowledge`, until then they are returned again
+      with the next batch
+    """
+
+    postgres: LogicalReplicationConnection
+    slot: str = REPLICATION_SLOT
+    delay: float = NOTIFY_DELAY
+    max_changes: int = NOTIFY_MAX_CHANGES
+
+    TABLES = ('film_work', 'person', 'genre')
+
+    LINK_TABLES = ('person_film_work', 'genre_film_work')
+
+    def __post_init__(self):
+        """Create the replication slot if it does not exist and start streaming from it."""
+        self.lsn = 0
+        self.reset()
+        self.cursor = self.postgres.cursor()
+        with suppress(DuplicateObject):
+            self.cursor.create_replication_slot(self.slot, output_plugin='wal2json')
+        tables = (*self.TABLES, *self.LINK_TABLES)
+        names = ','.join('content.{table}'.format(table=table) for table in tables)
+        self.cursor.start_replication(
+            slot_name=self.slot,
+            decode=True,
+            options={'format-version': '2', 'add-tables': names},
+        )
+
+    def read_changes(self, timeout: float) -> Tuple[Changes, Changes]:
+        """Wait for changes and collect the ones that follow shortly after into a single batch.
+
+        - The batch starts from the changes read before that were not acknowledged
+
+        Args:
+            timeout: Maximum time to wait for the first change in seconds
+
+        Returns:
+            tuple: Updated and deleted IDs for each table
+        """
+        updates, deletes = self.updates, self.deletes
+        deadline = time.monotonic() + timeout
+        received = False
+        while count_changes(updates) + count_changes(deletes) < self.max_changes:
+            message = self.read_message(deadline - time.monotonic())
+            if message is None:
+                break
+            if not received:
+                received = True
+                deadline = time.monotonic() + self.delay
+            self.decode(message, updates, deletes)
+        return updates, deletes
+
+    def read_message(self, timeout: float) -> Optional[ReplicationMessage]:
+        """Read the next replication message, waiting for it if necessary.
+
+        Args:
+            timeout: Maximum time to wait in seconds
+
+        Returns:
+            ReplicationMessage: Message, or None if nothing arrived in time
+        """
+        message = self.cursor.read_message()
+        if message is None and timeout > 0:
+            select.select([self.cursor], [], [], timeout)
+            message = self.cursor.read_message()
+        return message
+
+    def decode(self, message: ReplicationMessage, updates: Changes, deletes: Changes):
+        """Map a wal2json change to the affected IDs.
+
+        Args:
+            message: Replication message
+            updates: Updated IDs for each table
+            deletes: Deleted IDs for each table
+        """
+        self.lsn = message.data_start
+        change = json.loads(message.payload)
+        table = change.get('table')
+        if table in self.LINK_TABLES:
+            updates['film_work'].add(get_value(change, 'film_work_id'))
+        elif table in self.TABLES and change['action'] == 'D':
+            row_id = get_value(change, 'id')
+            updates[table].discard(row_id)
+            deletes[table].add(row_id)
+        elif table in self.TABLES:
+            row_id = get_value(change, 'id')
+            deletes[table].discard(row_id)
+            updates[table].add(row_id)
+
+    def acknowledge(self):
+        """Confirm to PostgreSQL that the changes read so far have been loaded."""
+        self.cursor.send_feedback(flush_lsn=self.lsn)
+        self.reset()
+
+    def reset(self):
+        """Start a new batch of changes, once the previous one has been acknowledged."""
+        self.updates: Changes = {table: set() for table in self.TABLES}
+        self.deletes: Changes = {table: set() for table in self.TABLES}
@@ -0,0 +1,171 @@
+import json
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+from pydantic.dataclasses import dataclass
+
+from services.base import Config
+from core.config import SPOOL_SEGMENT_BYTES
+from core.logger import logger
+from core.metrics import SPOOL_BYTES
+
+HEADER = struct.Struct('>I')
+
+SUFFIX = '.seg'
+
+
+def find_segments(path: str) -> List[str]:
+    """Return the segments in a directory in the order they were written.
+
+    Args:
+        path: Directory of the segment files.
+
+    Returns:
+        List: Paths of the segments.
+    """
+    names = [name for name in os.listdir(path) if name.endswith(SUFFIX)]
+    return [os.path.join(path, name) for name in sorted(names)]
+
+
+def get_number(segment: str) -> int:
+    """Return the sequence number of a segment.
+
+    Args:
+        segment: Path of the segment.
+
+    Returns:
+        int: Number from the file name.
+    """
+    return int(os.path.basename(segment)[:-len(SUFFIX)])
+
+
+def read_records(data: mmap.mmap, segment: str) -> Iterator[List[Dict]]:
+    """Read the length-prefixed records of a segment, stopping at a record cut short by a crash.
+
+    Args:
+        data: Memory map of the segment.
+        segment: Path of the segment, used for the log.
+
+    Yields:
+        List: Bulk actions of a record.
+    """
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        length = HEADER.unpack_from(data, offset)[0]
+        start = offset + HEADER.size
+        if start + length > len(data):
+            break
+        yield json.loads(data[start:start + length])
+        offset = start + length
+    if offset < len(data):
+        logger.warning('Dropped an incomplete record at the end of {0}.'.format(segment))
+
+
+@dataclass(config=Config)
+class Spool(object):
+    """Class for keeping bulk actions on disk while Elasticsearch cannot take them.
+
+    - Actions are appended to segment files as length-prefixed JSON records and synced to disk
+    - A segment is closed once it reaches `segment_bytes` or before a replay, and segments are replayed in order
+    - Replays and appends are serialized by `lock`
+    - A record cut short by a crash ends its segment and is dropped
+
+    Attributes:
+        path: Directory of the segment files.
+        segment_bytes: Size after which a new segment is started.
+    """
+
+    path: str
+    segment_bytes: int = SPOOL_SEGMENT_BYTES
+
+    def __post_init__(self):
+        """Create the directory and find the segments left by a previous run."""
+        os.makedirs(self.path, exist_ok=True)
+        self.lock = threading.RLock()
+        self.active: Optional[BinaryIO] = None
+        self.retry_at: float = 0
+        self.segments = find_segments(self.path)
+        SPOOL_BYTES.set(self.size())
+
+    @property
+    def empty(self) -> bool:
+        """Whether there are no spooled actions.
+
+        Returns:
+            bool: True if the spool is empty.
+        """
+        return not self.segments
+
+    def append(self, actions: List[Dict]):
+        """Append bulk actions as a single record.
+
+        Args:
+            actions: Bulk actions with their target index and document ID.
+        """
+        payload = json.dumps(actions, default=str).encode()
+        with self.lock:
+            if self.active is None or self.active.tell() >= self.segment_bytes:
+                self.active = self.rotate()
+            self.active.write(HEADER.pack(len(payload)) + payload)
+            self.active.flush()
+            os.fsync(self.active.fileno())
+            SPOOL_BYTES.inc(HEADER.size + len(payload))
+
+    def rotate(self) -> BinaryIO:
+        """Close the active segment and start a new one.
+
+        Returns:
+            BinaryIO: New active segment.
+        """
+        self.seal()
+        number = 0
+        if self.segments:
+            number = get_number(self.segments[-1]) + 1
+        segment = os.path.join(self.path, '{0:020d}{1}'.format(number, SUFFIX))
+        self.segments.append(segment)
+        return Path(segment).open('ab')
+
+    def seal(self):
+        """Close the active segment, so that all segments can be replayed."""
+        with self.lock:
+            if self.active is not None:
+                self.active.close()
+                self.active = None
+
+    def read(self, segment: str) -> Iterator[List[Dict]]:
+        """Read the records of a segment through a memory map.
+
+        Args:
+            segment: Path of the segment.
+
+        Yields:
+            List: Bulk actions of a record.
+        """
+        with open(segment, 'rb') as segment_file:
+            if not os.fstat(segment_file.fileno()).st_size:
+                return
+            with mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield from read_records(data, segment)
+
+    def remove(self, segment: str):
+        """Remove a segment whose records have been loaded.
+
+        Args:
+            segment: Path of the segment.
+        """
+        with self.lock:
+            os.remove(segment)
+            self.segments.remove(segment)
+            SPOOL_BYTES.set(self.size())
+
+    def size(self) -> int:
+        """Return the size of the spooled actions.
+
+        Returns:
+            int: Total size of the segments in bytes.
+        """
+        return sum(os.path.getsize(segment) for segment in self.segments)
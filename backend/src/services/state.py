@@ -1,11 +1,59 @@
 import abc
 import json
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, Optional
 
 from pydantic.dataclasses import dataclass
 from redis import Redis
 
 from services.base import Config
+from core.config import Watermark
+
+STATE_KEY = 'data'
+
+WATERMARKS_KEY = 'watermarks'
+
+
+def dump_state(state: Dict) -> str:
+    """Convert the state to the JSON string kept in Redis.
+
+    Args:
+        state: State as a dictionary.
+
+    Returns:
+        str: State in JSON format.
+    """
+    return json.dumps(state, default=str)
+
+
+def load_state(data: Optional[bytes]) -> Dict:
+    """Convert the JSON string kept in Redis to the state.
+
+    Args:
+        data: State in JSON format, or None if nothing has been saved.
+
+    Returns:
+        Dict: State as a dictionary, empty if nothing has been saved.
+    """
+    return json.loads(data) if data else {}
+
+
+def read_watermarks(state: Dict, tables: Iterable[str], initial: Watermark) -> Dict[str, Watermark]:
+    """Read the position of the last loaded row for each table.
+
+    - Falls back to the global 'last_updated' timestamp saved by earlier versions
+
+    Args:
+        state: Current state as a dictionary.
+        tables: Table names.
+        initial: Position before the first row of a table.
+
+    Returns:
+        Dict: Watermark for each table.
+    """
+    last_updated = state.get('last_updated')
+    default = (last_updated, initial[1]) if last_updated else initial
+    watermarks = state.get(WATERMARKS_KEY, {})
+    return {table: tuple(watermarks.get(table, default)) for table in tables}
 
 
 class BaseStorage(object):
@@ -29,34 +77,35 @@ class RedisStorage(BaseStorage):
     """Class for storing data in JSON format."""
 
     redis_adapter: Redis
+    key: str = STATE_KEY
 
     def __post_init__(self):
-        """When initialized, request and retrieve data from Redis under the 'data' key."""
-        self.data = self.redis_adapter.get('data')
+        """When initialized, request and retrieve data from Redis under the storage key."""
+        self.data = self.redis_adapter.get(self.key)
 
     def save_state(self, state: Dict) -> None:
         """Save the state as a string.
 
         - Get the state with data as a dictionary.
         - Convert the dictionary to a string.
-        - Write the string to the Redis storage under the 'data' key.
+        - Write the string to the Redis storage under the storage key.
 
         Args:
             state: New state as a dictionary.
         """
-        self.redis_adapter.set('data', json.dumps(state, default=str))
+        self.redis_adapter.set(self.key, dump_state(state))
 
     def retrieve_state(self) -> Dict:
         """Load the state as a dictionary.
 
-        - Load the state with data from the Redis storage under the 'data' key as a string.
+        - Load the state with data from the Redis storage under the storage key as a string.
         - Convert the string to a dictionary.
         - If there's no data, return an empty dictionary.
 
         Returns:
             Dict: Current state as a dictionary.
         """
-        return json.loads(self.data) if self.data else {}
+        return load_state(self.data)
 
 
 @dataclass(config=Config)
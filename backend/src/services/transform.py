@@ -1,13 +1,34 @@
+import time
+import zlib
+from collections import defaultdict
 from dataclasses import dataclass
-from typing import Any, Dict, Iterator
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
 
 from redis import Redis
 from redis.exceptions import ConnectionError
 
-from core.config import BATCH_SIZE, PostgresRow
-from core.decorators import backoff
+from services.batching import BatchController
+from core.config import (
+    BATCH_SIZE,
+    MOVIE_BATCH_MAX,
+    MOVIE_BATCH_MIN,
+    MOVIE_BATCH_STEP,
+    MOVIE_BATCH_TARGET,
+    PostgresRow,
+)
+from core.decorators import backoff, timed
+from core.metrics import QUEUE_SIZE
 from models.movie import Movie
-from models.person import Person
+
+POP_BATCH_SCRIPT = """
+local ids = redis.call('SPOP', KEYS[1], ARGV[1])
+if #ids > 0 then
+    redis.call('SADD', KEYS[2], unpack(ids))
+end
+return ids
+"""
+
+Seen = Set[Tuple[str, str]]
 
 
 @dataclass
@@ -15,87 +36,242 @@ class DataTransform(object):
     """Class for data transformation and storing intermediate results in Redis."""
 
     redis: Redis
+    shards: int = 0
+
+    ROLES = ('actor', 'writer', 'director')
+
+    TEMPLATE = Movie.properties()
+
+    LISTS = tuple(
+        field
+        for field, value in TEMPLATE.items()
+        if isinstance(value, list)
+    )
+
+    ROLE_FIELDS = {
+        role: ('{role}s'.format(role=role), '{role}s_names'.format(role=role))
+        for role in ROLES
+    }
+
+    def __post_init__(self):
+        """Register the Lua script that moves a batch of movie IDs to the processing set.
 
+        - Batches of movies start at `BATCH_SIZE` and are tuned from the time taken to process them
+        """
+        self.pop_batch = self.redis.register_script(POP_BATCH_SCRIPT)
+        self.batches = BatchController(
+            'movies', BATCH_SIZE, MOVIE_BATCH_MIN, MOVIE_BATCH_MAX, MOVIE_BATCH_TARGET, MOVIE_BATCH_STEP,
+        )
+
+    @timed('collector')
     @backoff(errors=(ConnectionError,))
-    def collector(self, key: str, film_work_id: str):
+    def collector(self, key: str, film_work_ids: Iterable[str]):
         """Collect movie IDs to be updated at the moment.
 
-        - Stores them in Redis as a set.
+        - Stores them in Redis as a set with a single command per batch.
+        - With shards, each movie ID goes to the set of its shard
+
+        Args:
+            key: The key under which the data is stored.
+            film_work_ids: The movies to be updated.
+        """
+        partitions = self.partition(key, film_work_ids)
+        if not partitions:
+            return
+        with self.redis.pipeline(transaction=False) as pipe:
+            for shard_key, ids in partitions.items():
+                pipe.sadd(shard_key, *ids)
+                pipe.scard(shard_key)
+            sizes = dict(zip(partitions, pipe.execute()[1::2]))
+        for shard_key in partitions:
+            QUEUE_SIZE.labels(shard_key).set(sizes[shard_key])
+
+    def partition(self, key: str, film_work_ids: Iterable[str]) -> Dict[str, List[str]]:
+        """Group movie IDs by the key of their shard.
 
         Args:
             key: The key under which the data is stored.
-            film_work_id: The movie to be updated.
+            film_work_ids: The movies to be updated.
+
+        Returns:
+            Dict: Movie IDs by shard key.
         """
-        self.redis.sadd(key, film_work_id)
+        partitions = defaultdict(list)
+        for film_work_id in film_work_ids:
+            partitions[self.shard_key(key, film_work_id)].append(film_work_id)
+        return partitions
+
+    def shard_key(self, key: str, film_work_id: str) -> str:
+        """Return the key of the shard holding a movie ID.
+
+        Args:
+            key: The key under which the data is stored.
+            film_work_id: Movie ID.
+
+        Returns:
+            str: Key of the shard, or the key itself without shards.
+        """
+        if not self.shards:
+            return key
+        shard = zlib.crc32(str(film_work_id).encode()) % self.shards
+        return '{key}:{shard}'.format(key=key, shard=shard)
+
+    def shard_keys(self, key: str) -> List[str]:
+        """Return the keys of all shards.
+
+        Args:
+            key: The key under which the data is stored.
+
+        Returns:
+            List: Keys of the shards, or the key itself without shards.
+        """
+        if not self.shards:
+            return [key]
+        return ['{key}:{shard}'.format(key=key, shard=shard) for shard in range(self.shards)]
 
     @backoff(errors=(ConnectionError,))
     def batcher(self, key: str) -> Iterator[Dict[str, Any]]:
         """Iterate data from Redis in batches and generate dictionaries.
 
-        - Divides data with movie IDs and decodes them from bytes to strings
-        - Generates dictionaries where keys are movie IDs and values are the movie model schema
-        - After the iterations are complete, deletes the IDs of movies to be updated at the moment
+        - Returns movie IDs left unacknowledged by an interrupted run to the set
+        - Atomically pops batches of movie IDs and moves them to the processing set until they are acknowledged
+        - The batch size adapts to the time between batches, which includes processing them
+          or waiting for a busy pipeline
+        - Generates dictionaries where keys are movie IDs and values are empty movies
 
         Args:
             key: The key under which the data is stored
 
         Yields:
-            Dict: Dictionary with movie IDs and the movie model schema
+            Dict: Dictionary with movie IDs and empty movies
         """
-        cursor = '0'
-        while cursor != 0:
-            cursor, data = self.redis.sscan(key, cursor=cursor, count=BATCH_SIZE)  # type: ignore[assignment, arg-type]
+        processing = '{key}:processing'.format(key=key)
+        with self.redis.pipeline() as pipe:
+            pipe.sunionstore(key, key, processing)
+            pipe.delete(processing)
+            pipe.execute()
+        keys = [key, processing]
+        started = time.monotonic()
+        while data := self.pop_batch(keys=keys, args=[self.batches.size]):
+            QUEUE_SIZE.labels(key).dec(len(data))
             yield {
-                movie_id.decode(): Movie.properties() for movie_id in data
+                movie_id.decode(): self.new_movie() for movie_id in data
             }
-        self.redis.delete(key)
+            self.batches.observe(len(data), time.monotonic() - started)
+            started = time.monotonic()
 
-    def parser(self, row: PostgresRow, movie: Dict):
+    @timed('acknowledge')
+    @backoff(errors=(ConnectionError,))
+    def acknowledge(self, key: str, film_work_ids: Iterable[str]):
+        """Remove movie IDs that have been loaded from the processing set.
+
+        Args:
+            key: The key under which the data is stored.
+            film_work_ids: The movies that have been loaded.
+        """
+        film_work_ids = list(film_work_ids)
+        if film_work_ids:
+            self.redis.srem('{key}:processing'.format(key=key), *film_work_ids)
+
+    def new_movie(self) -> Dict:
+        """Return an empty movie copied from the template of the movie model schema.
+
+        Returns:
+            Dict: Movie in dictionary format
+        """
+        movie = dict(self.TEMPLATE)
+        for field in self.LISTS:
+            movie[field] = []
+        return movie
+
+    def parse_rows(self, rows: Iterable[PostgresRow], movies: Dict[str, Dict]):
+        """Parse the rows of the joined movie query and add them to their movies.
+
+        - The persons and genres already added are tracked by movie ID next to the batch,
+          so the movies hold only the fields of the model schema
+
+        Args:
+            rows: Data in PostgreSQL format, a row for each person and genre of a movie
+            movies: Movies in dictionary format by movie ID
+        """
+        seen: Dict[str, Seen] = defaultdict(set)
+        for row in rows:
+            movie_id = str(row['id'])
+            self.parser(row, movies[movie_id], seen[movie_id])
+
+    def parser(self, row: PostgresRow, movie: Dict, seen: Seen):
         """Parse data in PostgreSQL format and add it to the corresponding movie.
 
         Args:
             movie: Movie in dictionary format
             row: Data in PostgreSQL format
+            seen: Persons and genres already added to the movie
         """
         if not movie['id']:
             movie['id'] = row['id']
             movie['title'] = row['title']
             movie['description'] = row['description']
             movie['imdb_rating'] = row['rating']
-        movie.update(self.add_person(row, movie) if row['person_id'] else {})
-        movie.update(self.add_genre(row, movie) if row['genre_name'] else {})
+        if row['person_id']:
+            movie.update(self.add_person(row, movie, seen))
+        if row['genre_name']:
+            movie.update(self.add_genre(row, movie, seen))
+
+    def build_movie(self, row: PostgresRow) -> Dict:
+        """Map a pre-aggregated row in PostgreSQL format straight to a movie.
+
+        Args:
+            row: Data in PostgreSQL format with genre names and persons grouped by role
+
+        Returns:
+            Dict: Movie in dictionary format
+        """
+        movie = {
+            'id': row['id'],
+            'title': row['title'],
+            'description': row['description'],
+            'imdb_rating': row['rating'],
+            'genre': row['genres'],
+        }
+        for role in self.ROLES:
+            persons = row['persons'].get(role, [])
+            movie['{role}s'.format(role=role)] = persons
+            movie['{role}s_names'.format(role=role)] = [person['name'] for person in persons]
+        return movie
 
-    def add_person(self, row: PostgresRow, movie: Dict) -> Dict:
+    def add_person(self, row: PostgresRow, movie: Dict, seen: Seen) -> Dict:
         """Add and distribute data with movie participants by roles.
 
         Args:
             movie: Movie in dictionary format
             row: Data in PostgreSQL format
+            seen: Persons and genres already added to the movie
 
         Returns:
             Dict: Data with roles of movie participants
         """
-        role = '{role}s'.format(role=row['role'])
-        role_names = '{role}s_names'.format(role=row['role'])
+        role, role_names = self.ROLE_FIELDS[row['role']]
         persons_list = movie.get(role, [])
         person_names_list = movie.get(role_names, [])
-        person = Person(id=row['person_id'], full_name=row['full_name'])  # type: ignore[call-arg]
-        if person not in persons_list:
-            persons_list.append(person)
-            person_names_list.append(person.full_name)
+        if (role, row['person_id']) not in seen:
+            seen.add((role, row['person_id']))
+            persons_list.append({'id': row['person_id'], 'name': row['full_name']})
+            person_names_list.append(row['full_name'])
         return {role: persons_list, role_names: person_names_list}
 
-    def add_genre(self, row: PostgresRow, movie: Dict) -> Dict:
+    def add_genre(self, row: PostgresRow, movie: Dict, seen: Seen) -> Dict:
         """Add data with genres to the movie.
 
         Args:
             movie: Movie in dictionary format
             row: Data in PostgreSQL format
+            seen: Persons and genres already added to the movie
 
         Returns:
             Dict: Data with movie genre names
         """
         genre_names_list = movie.get('genre', [])
-        if row['genre_name'] not in genre_names_list:
+        if ('genre', row['genre_name']) not in seen:
+            seen.add(('genre', row['genre_name']))
             genre_names_list.append(row['genre_name'])
         return {'genre': genre_names_list}
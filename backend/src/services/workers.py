@@ -0,0 +1,140 @@
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+from multiprocessing.util import Finalize
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from services import cache
+from services.extract import PostgresExtractor
+from services.load import ElasticsearchLoader, get_failed_ids, serialize
+from services.transform import DataTransform
+from core.config import POSTGRES_HEALTH_CHECK_INTERVAL, POSTGRES_PARAMS, REDIS_PARAMS, SUBMIT_WINDOW
+from core.decorators import timed
+from db.postgres import get_postgres_pool
+from db.redis import get_redis
+from models.movie import Movie
+
+_worker: Dict = {}
+
+Submitted = Tuple[List[str], Future]
+
+
+@contextmanager
+def get_pool(processes: int, movie_query: str, validation_rate: float) -> Iterator[Optional['TransformPool']]:
+    """
+    Context manager function for starting processes that build movie documents.
+
+    Args:
+        processes: Number of processes, or 0 to build movies in the main process
+        movie_query: Shape of the movie rows, 'aggregated' or 'joined'
+        validation_rate: Share of documents validated by the models
+
+    Yields:
+        TransformPool: Pool of processes, or None without processes
+    """
+    if processes:
+        initargs = (movie_query, validation_rate)
+        with ProcessPoolExecutor(processes, initializer=initialize, initargs=initargs) as executor:
+            yield TransformPool(executor, processes)
+    else:
+        yield None
+
+
+def initialize(movie_query: str, validation_rate: float):
+    """Open the connections of a worker process, which are closed when the process exits.
+
+    Args:
+        movie_query: Shape of the movie rows, 'aggregated' or 'joined'
+        validation_rate: Share of documents validated by the models
+    """
+    stack = ExitStack()
+    postgres = stack.enter_context(get_postgres_pool(1, 1, POSTGRES_HEALTH_CHECK_INTERVAL, **POSTGRES_PARAMS))
+    _worker['postgres'] = PostgresExtractor(postgres, movie_query=movie_query)
+    _worker['data'] = DataTransform(stack.enter_context(get_redis(**REDIS_PARAMS)))
+    _worker['validation_rate'] = validation_rate
+    Finalize(None, stack.close, exitpriority=10)
+
+
+def build_documents(movie_ids: List[str]) -> Dict[str, str]:
+    """Fetch, build and serialize a batch of movies in a worker process.
+
+    Args:
+        movie_ids: Movie IDs
+
+    Returns:
+        Dict: Movie IDs with documents serialized to JSON, without movies missing in PostgreSQL
+    """
+    movies = build_movies(_worker['postgres'], _worker['data'], movie_ids)
+    return {
+        movie_id: cache.dumps(serialize(Movie, movie, _worker['validation_rate']))
+        for movie_id, movie in movies.items() if movie['id']
+    }
+
+
+def build_movies(postgres: PostgresExtractor, data: DataTransform, movie_ids: List[str]) -> Dict[str, Dict]:
+    """Fetch and build a batch of movies with the row shape of the extractor.
+
+    Args:
+        postgres: Extracts data from PostgreSQL
+        data: Transforms the rows into movies
+        movie_ids: Movie IDs
+
+    Returns:
+        Dict: Movie IDs with movies, empty for the movies missing in PostgreSQL
+    """
+    if postgres.movie_query == 'aggregated':
+        rows = postgres.get_movie_documents(movie_ids)
+        return {row['id']: data.build_movie(row) for row in rows}
+    movies = {movie_id: data.new_movie() for movie_id in movie_ids}
+    data.parse_rows(postgres.get_movie_data(movie_ids), movies)
+    return movies
+
+
+@dataclass
+class TransformPool(object):
+    """Class for building movies in worker processes and loading them from the main process."""
+
+    executor: ProcessPoolExecutor
+    processes: int
+
+    def load_movies(self, data: DataTransform, elastic: ElasticsearchLoader, queue: str):
+        """Build and load the movies collected for the update.
+
+        - Batches are submitted in order, with at most `SUBMIT_WINDOW` batches per process in flight
+        - Each batch is acknowledged once it has been loaded
+
+        Args:
+            data: Transforms and stores intermediate data.
+            elastic: Loads data into Elasticsearch.
+            queue: Key of the movies to be updated.
+        """
+        pending: Deque[Submitted] = deque()
+        for movies in data.batcher(queue):
+            movie_ids = list(movies)
+            pending.append((movie_ids, self.executor.submit(build_documents, movie_ids)))
+            if len(pending) >= self.processes * SUBMIT_WINDOW:
+                self.index_documents(data, elastic, queue, *pending.popleft())
+        while pending:
+            self.index_documents(data, elastic, queue, *pending.popleft())
+
+    @timed('index_documents')
+    def index_documents(
+        self,
+        data: DataTransform,
+        elastic: ElasticsearchLoader,
+        queue: str,
+        movie_ids: List[str],
+        future: Future,
+    ):
+        """Load a batch of movies built by a worker process and acknowledge the ones that were loaded.
+
+        Args:
+            data: Transforms and stores intermediate data.
+            elastic: Loads data into Elasticsearch.
+            queue: Key of the movies to be updated.
+            movie_ids: Movie IDs of the batch.
+            future: Movies serialized by the worker process.
+        """
+        errors = elastic.bulk_insert_serialized(Movie, future.result())
+        data.acknowledge(queue, set(movie_ids).difference(get_failed_ids(errors)))
@@ -0,0 +1,17 @@
+--
+-- Indexes for keyset pagination of updates by (modified, id)
+--
+
+CREATE INDEX IF NOT EXISTS film_work_modified_id_idx ON content.film_work USING btree (modified, id);
+
+CREATE INDEX IF NOT EXISTS genre_modified_id_idx ON content.genre USING btree (modified, id);
+
+CREATE INDEX IF NOT EXISTS person_modified_id_idx ON content.person USING btree (modified, id);
+
+--
+-- Indexes for resolving the films of changed persons and genres from the link tables
+--
+
+CREATE INDEX IF NOT EXISTS person_film_work_person_idx ON content.person_film_work USING btree (person_id, film_work_id);
+
+CREATE INDEX IF NOT EXISTS genre_film_work_genre_idx ON content.genre_film_work USING btree (genre_id, film_work_id);
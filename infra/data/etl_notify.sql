@@ -0,0 +1,43 @@
+--
+-- Notifications about changed rows for the event-driven ETL mode (--listen)
+--
+
+CREATE OR REPLACE FUNCTION content.notify_etl_changes() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    changed RECORD;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        changed := OLD;
+    ELSE
+        changed := NEW;
+    END IF;
+    IF TG_TABLE_NAME IN ('person_film_work', 'genre_film_work') THEN
+        PERFORM pg_notify('etl_changes', json_build_object('table', 'film_work', 'id', changed.film_work_id)::text);
+    ELSE
+        PERFORM pg_notify('etl_changes', json_build_object('table', TG_TABLE_NAME, 'id', changed.id)::text);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER film_work_notify_etl_changes
+    AFTER INSERT OR UPDATE OR DELETE ON content.film_work
+    FOR EACH ROW EXECUTE FUNCTION content.notify_etl_changes();
+
+CREATE OR REPLACE TRIGGER person_notify_etl_changes
+    AFTER INSERT OR UPDATE OR DELETE ON content.person
+    FOR EACH ROW EXECUTE FUNCTION content.notify_etl_changes();
+
+CREATE OR REPLACE TRIGGER genre_notify_etl_changes
+    AFTER INSERT OR UPDATE OR DELETE ON content.genre
+    FOR EACH ROW EXECUTE FUNCTION content.notify_etl_changes();
+
+CREATE OR REPLACE TRIGGER person_film_work_notify_etl_changes
+    AFTER INSERT OR UPDATE OR DELETE ON content.person_film_work
+    FOR EACH ROW EXECUTE FUNCTION content.notify_etl_changes();
+
+CREATE OR REPLACE TRIGGER genre_film_work_notify_etl_changes
+    AFTER INSERT OR UPDATE OR DELETE ON content.genre_film_work
+    FOR EACH ROW EXECUTE FUNCTION content.notify_etl_changes();
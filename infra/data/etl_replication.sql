@@ -0,0 +1,8 @@
+--
+-- Full replica identity of the link tables for the logical replication mode (--replicate),
+-- so that deleted rows carry the film ID
+--
+
+ALTER TABLE content.person_film_work REPLICA IDENTITY FULL;
+
+ALTER TABLE content.genre_film_work REPLICA IDENTITY FULL;
@@ -0,0 +1,128 @@
+import os
+import sys
+from collections import defaultdict
+from typing import Callable, Dict, Iterator, List, Set
+
+import pytest
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import ConnectionError as ElasticConnectionError
+from redis import Redis
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'backend', 'src'))
+
+from services.extract import PostgresExtractor  # noqa: E402
+from services.load import ElasticsearchLoader  # noqa: E402
+from services.transform import DataTransform  # noqa: E402
+from core.config import ELASTIC_PARAMS, REDIS_PARAMS, Schemas  # noqa: E402
+from db.elastic import get_elastic  # noqa: E402
+from db.postgres import PostgresPool  # noqa: E402
+from db.redis import get_redis  # noqa: E402
+from factories import new_id  # noqa: E402
+
+
+@pytest.fixture
+def elastic() -> Iterator[Elasticsearch]:
+    """Connect to Elasticsearch, skipping the test if it is not running.
+
+    Yields:
+        Elasticsearch: Client.
+    """
+    client = get_elastic(**ELASTIC_PARAMS)
+    try:
+        client.info()
+    except ElasticConnectionError:
+        pytest.skip('Elasticsearch is not running')
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def redis() -> Iterator[Redis]:
+    """Connect to Redis, skipping the test if it is not running.
+
+    Yields:
+        Redis: Client.
+    """
+    client = get_redis(**REDIS_PARAMS, retries=0)
+    try:
+        client.ping()
+    except RedisConnectionError:
+        pytest.skip('Redis is not running')
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def loader(elastic: Elasticsearch) -> ElasticsearchLoader:
+    """Create the loader with in-place updates of names.
+
+    Args:
+        elastic: Elasticsearch client.
+
+    Returns:
+        ElasticsearchLoader: Loader.
+    """
+    return ElasticsearchLoader(elastic, threads=1, partial_updates=True)
+
+
+@pytest.fixture
+def documents(loader: ElasticsearchLoader) -> Iterator[Callable[[Schemas, List[Dict]], None]]:
+    """Index test documents and delete them after the test.
+
+    - Test documents have random IDs, so the data already in the indices is left untouched
+
+    Args:
+        loader: Loader.
+
+    Yields:
+        Callable: Function indexing rows of a schema and refreshing its index.
+    """
+    written: Dict[str, Set[str]] = defaultdict(set)
+
+    def index(schema: Schemas, rows: List[Dict]):
+        assert not loader.bulk_insert(schema, rows)
+        loader.elastic.indices.refresh(index=schema._index)
+        written[schema._index].update(str(row['id']) for row in rows)
+
+    yield index
+    for index_name, ids in written.items():
+        loader.bulk_delete(index_name, ids)
+
+
+@pytest.fixture
+def postgres() -> PostgresExtractor:
+    """Create an extractor without a database, whose queries are replaced by the tests.
+
+    Returns:
+        PostgresExtractor: Extractor.
+    """
+    return PostgresExtractor(PostgresPool.__new__(PostgresPool))
+
+
+@pytest.fixture
+def queue(redis: Redis) -> Iterator[str]:
+    """Return a key for the movies to be updated that is deleted after the test.
+
+    Args:
+        redis: Redis client.
+
+    Yields:
+        str: Queue key.
+    """
+    key = 'test_movie_ids:{0}'.format(new_id())
+    yield key
+    redis.delete(key)
+
+
+@pytest.fixture
+def data(redis: Redis) -> DataTransform:
+    """Create the transform collecting the movies to be updated.
+
+    Args:
+        redis: Redis client.
+
+    Returns:
+        DataTransform: Transform.
+    """
+    return DataTransform(redis)
@@ -0,0 +1,37 @@
+import uuid
+from typing import Dict, List
+
+
+def new_id() -> str:
+    """Return a random document ID that does not clash with the loaded data.
+
+    Returns:
+        str: UUID.
+    """
+    return str(uuid.uuid4())
+
+
+def make_movie(movie_id: str, actors: List[Dict], writers: List[Dict], genres: List[str]) -> Dict:
+    """Build the data of a movie as returned by the aggregated movie query.
+
+    Args:
+        movie_id: Movie ID.
+        actors: Actors with their IDs and names.
+        writers: Writers with their IDs and names.
+        genres: Genre names.
+
+    Returns:
+        Dict: Movie data.
+    """
+    return {
+        'id': movie_id,
+        'imdb_rating': 7.5,
+        'genre': genres,
+        'title': 'Test movie',
+        'description': '',
+        'directors_names': [],
+        'actors_names': [actor['name'] for actor in actors],
+        'writers_names': [writer['name'] for writer in writers],
+        'actors': actors,
+        'writers': writers,
+    }
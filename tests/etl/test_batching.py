@@ -0,0 +1,63 @@
+import pytest
+
+from services.batching import BatchController
+
+
+@pytest.fixture
+def controller():
+    """Create a controller starting at 100 items with a target latency of one second.
+
+    Returns:
+        BatchController: Controller.
+    """
+    return BatchController('test', size=100, min_size=10, max_size=200, target=1, step=20)
+
+
+def test_initial_size_is_clamped():
+    """An initial size outside the bounds is moved inside them."""
+    assert BatchController('test', size=1000, min_size=10, max_size=200, target=1, step=20).size == 200
+    assert BatchController('test', size=1, min_size=10, max_size=200, target=1, step=20).size == 10
+
+
+def test_fast_full_batches_grow_additively(controller):
+    """Every full batch faster than the target grows the size by the step, up to the maximum."""
+    controller.observe(100, 0.5)
+    assert controller.size == 120
+
+    for _ in range(10):
+        controller.observe(controller.size, 0.5)
+    assert controller.size == 200
+
+
+def test_partial_batches_do_not_grow(controller):
+    """A fast batch smaller than the size was not limited by it and leaves the size unchanged."""
+    controller.observe(50, 0.1)
+    assert controller.size == 100
+
+
+def test_latency_within_tolerance_keeps_size(controller):
+    """A batch slower than the target but within the slow factor leaves the size unchanged."""
+    controller.observe(100, 1.2)
+    assert controller.size == 100
+
+
+def test_slow_batches_shrink_multiplicatively(controller):
+    """A batch much slower than the target halves the size, down to the minimum."""
+    controller.observe(100, 2)
+    assert controller.size == 50
+
+    for _ in range(5):
+        controller.observe(controller.size, 2)
+    assert controller.size == 10
+
+
+def test_rejections_shrink(controller):
+    """A rejected batch halves the size whatever its latency."""
+    controller.observe(100, 0.1, rejected=True)
+    assert controller.size == 50
+
+
+def test_latency_is_averaged_per_batch(controller):
+    """Work spanning several batches is judged by the time per batch."""
+    controller.observe(400, 2)
+    assert controller.size == 120
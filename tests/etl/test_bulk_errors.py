@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import pytest
+from elasticsearch.helpers import BulkIndexError
+
+from main import etl_process, index_movies
+from services.state import RedisStorage, State
+from factories import new_id
+from models.person import Person
+
+
+def failing_loader(failed_ids, schema=None):
+    """Return a stand-in for the loader whose bulk requests fail for some documents.
+
+    Args:
+        failed_ids: IDs of the documents that fail.
+        schema: Schema whose documents fail, or None for every schema.
+
+    Returns:
+        SimpleNamespace: Loader.
+    """
+    def bulk_insert(bulk_schema, rows):
+        if schema not in {None, bulk_schema}:
+            return []
+        return [
+            {'index': {'_id': row['id'], 'status': 400, 'error': {'type': 'mapper_parsing_exception'}}}
+            for row in rows if row['id'] in failed_ids
+        ]
+
+    return SimpleNamespace(bulk_insert=bulk_insert, replay_spool=lambda: True, partial_updates=False, targets={})
+
+
+def test_failed_movies_stay_unacknowledged(data, redis, queue):
+    """Movies that fail to load are not acknowledged and are taken back by the next run."""
+    loaded, failed = new_id(), new_id()
+    data.collector(queue, [loaded, failed])
+    movies = next(data.batcher(queue))
+    for movie_id, movie in movies.items():
+        movie['id'] = movie_id
+
+    index_movies(data, failing_loader({failed}), queue, movies)
+
+    assert redis.smembers('{0}:processing'.format(queue)) == {failed.encode()}
+    assert list(next(data.batcher(queue))) == [failed]
+    redis.delete('{0}:processing'.format(queue))
+
+
+def test_failed_rows_keep_the_watermark(postgres, data, redis, queue, monkeypatch):
+    """A batch with failed documents raises before its watermark is saved."""
+    genres = [{'id': new_id(), 'name': 'Genre', 'description': '', 'modified': '2024-01-01 00:00:00'}]
+    persons = [{'id': new_id(), 'full_name': 'Person', 'modified': '2024-01-02 00:00:00'}]
+    monkeypatch.setattr(postgres, 'get_updates', lambda watermarks: iter([('genre', genres), ('person', persons)]))
+    monkeypatch.setattr(postgres, 'get_film_work_ids', lambda table, rows: [])
+    state = State(RedisStorage(redis, key=queue))
+
+    with pytest.raises(BulkIndexError):
+        etl_process(postgres, data, failing_loader({persons[0]['id']}, Person), state, queue=queue)
+
+    watermarks = State(RedisStorage(redis, key=queue)).read_state('watermarks')
+    assert watermarks['genre'] == [genres[0]['modified'], genres[0]['id']]
+    assert watermarks['person'] == list(postgres.INITIAL_WATERMARK)
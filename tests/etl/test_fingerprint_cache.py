@@ -0,0 +1,49 @@
+from typing import Iterator, List
+
+import pytest
+from redis import Redis
+
+from services.cache import FingerprintCache
+from factories import new_id
+
+
+@pytest.fixture
+def cache(redis: Redis) -> Iterator[FingerprintCache]:
+    """Create a cache of two fingerprints per index.
+
+    Args:
+        redis: Redis client.
+
+    Yields:
+        FingerprintCache: Cache.
+    """
+    fingerprints = FingerprintCache(redis, max_size=2)
+    yield fingerprints
+    fingerprints.clear('test')
+
+
+def write(cache: FingerprintCache, *ids: str) -> List[str]:
+    """Filter documents and remember the fingerprints of the changed ones only.
+
+    Args:
+        cache: Cache.
+        ids: Document IDs, each document holding only its ID.
+
+    Returns:
+        List: IDs of the changed documents.
+    """
+    actions = [{'_id': document_id, '_source': {'id': document_id}} for document_id in ids]
+    changed, fingerprints = cache.filter('test', actions)
+    written = [action['_id'] for action in changed]
+    cache.update('test', {document_id: fingerprints[document_id] for document_id in written})
+    return written
+
+
+def test_skipped_documents_are_recently_used(cache: FingerprintCache):
+    first, second, third = new_id(), new_id(), new_id()
+    assert write(cache, first) == [first]
+    assert write(cache, second) == [second]
+    assert write(cache, first) == []
+    write(cache, third)
+    assert write(cache, first) == []
+    assert write(cache, second) == [second]
@@ -0,0 +1,129 @@
+import pytest
+from redis import Redis
+
+from services.lease import RENEW_SCRIPT, LeaseManager, get_key
+
+TTL = 30
+
+
+class ClockRedis(Redis):
+    """Stand-in for Redis keeping the lease keys in memory, with expiry driven by a fake clock."""
+
+    def __init__(self):
+        """Start the clock at zero with no keys, without connecting to a server."""
+        super().__init__()
+        self.now = 0.0
+        self.values = {}
+
+    def get(self, name):
+        """Return the value of a key unless it has expired."""
+        value, expires_at = self.values.get(name, (None, 0))
+        return value if expires_at > self.now else None
+
+    def set(self, name, value, nx=False, px=None, **kwargs):
+        """Set a key expiring after `px` milliseconds, only if it does not exist with `nx`."""
+        if nx and self.get(name) is not None:
+            return None
+        self.values[name] = (value, self.now + px / 1000)
+        return True
+
+    def register_script(self, script):
+        """Return the stand-in of a Lua script of the lease manager."""
+        return self.renew if script == RENEW_SCRIPT else self.release
+
+    def renew(self, keys, args):
+        """Extend a key held by the owner."""
+        owner, ttl_ms = args
+        if self.get(keys[0]) != owner:
+            return 0
+        self.values[keys[0]] = (owner, self.now + ttl_ms / 1000)
+        return 1
+
+    def release(self, keys, args):
+        """Delete a key held by the owner."""
+        if self.get(keys[0]) != args[0]:
+            return 0
+        del self.values[keys[0]]
+        return 1
+
+
+@pytest.fixture
+def clock_redis():
+    """Create the in-memory Redis with a fake clock.
+
+    Returns:
+        ClockRedis: Redis stand-in.
+    """
+    return ClockRedis()
+
+
+@pytest.fixture
+def managers(clock_redis):
+    """Create the lease managers of two instances sharing the same Redis.
+
+    Returns:
+        Tuple: Lease managers.
+    """
+    return LeaseManager(clock_redis, ttl=TTL), LeaseManager(clock_redis, ttl=TTL)
+
+
+def test_acquire_is_exclusive(managers):
+    """A lease held by one instance cannot be claimed by another until it is released."""
+    first, second = managers
+
+    assert first.acquire('shard:0')
+    assert not second.acquire('shard:0')
+    assert first.held == {'shard:0'}
+
+    first.release('shard:0')
+    assert second.acquire('shard:0')
+    assert not first.held
+
+
+def test_renew_keeps_the_lease(clock_redis, managers):
+    """A lease renewed before its TTL runs out stays with its owner."""
+    first, second = managers
+    first.acquire('shard:0')
+
+    clock_redis.now = TTL - 1
+    first.renew()
+    clock_redis.now = TTL + 1
+
+    assert not second.acquire('shard:0')
+    assert first.held == {'shard:0'}
+
+
+def test_expired_lease_is_reassigned(clock_redis, managers):
+    """The lease of an instance that stopped renewing expires, is claimed by another one and is forgotten by its owner."""
+    first, second = managers
+    first.acquire('shard:0')
+
+    clock_redis.now = TTL + 1
+    assert second.acquire('shard:0')
+
+    first.renew()
+    assert not first.held
+    assert clock_redis.get(get_key('shard:0')) == second.owner
+
+
+def test_release_by_other_owner_is_ignored(clock_redis, managers):
+    """An instance whose lease expired does not release the lease claimed since by another one."""
+    first, second = managers
+    first.acquire('shard:0')
+    clock_redis.now = TTL + 1
+    second.acquire('shard:0')
+
+    first.release('shard:0')
+
+    assert clock_redis.get(get_key('shard:0')) == second.owner
+
+
+def test_lease_context(managers):
+    """The lease context yields whether the lease was claimed and releases it afterwards."""
+    first, second = managers
+
+    with first.lease('shard:0') as claimed:
+        assert claimed
+        with second.lease('shard:0') as other:
+            assert not other
+    assert second.acquire('shard:0')
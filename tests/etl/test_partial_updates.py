@@ -0,0 +1,46 @@
+from main import rename_movies
+from factories import make_movie, new_id
+from models.genre import Genre
+from models.movie import Movie
+from models.person import Person
+
+
+def test_rename_person_and_genre(loader, documents, postgres, monkeypatch):
+    """Renamed actors, writers and genres are updated inside the movies that list them."""
+    actor, writer, genre = new_id(), new_id(), new_id()
+    genre_name = 'Genre {0}'.format(genre)
+    movie = new_id()
+    documents(Person, [{'id': actor, 'full_name': 'Old actor'}, {'id': writer, 'full_name': 'Old writer'}])
+    documents(Genre, [{'id': genre, 'name': genre_name, 'description': ''}])
+    documents(Movie, [make_movie(
+        movie,
+        actors=[{'id': actor, 'name': 'Old actor'}],
+        writers=[{'id': writer, 'name': 'Old writer'}],
+        genres=[genre_name],
+    )])
+    monkeypatch.setattr(postgres, 'get_director_ids', lambda person_ids: set())
+
+    persons = [{'id': actor, 'full_name': 'New actor'}, {'id': writer, 'full_name': 'New writer'}]
+    assert rename_movies(postgres, loader, 'person', persons) == []
+    genres = [{'id': genre, 'name': 'Renamed {0}'.format(genre), 'description': ''}]
+    assert rename_movies(postgres, loader, 'genre', genres) == []
+
+    document = loader.get_sources(Movie._index, [movie])[movie]
+    assert document['actors'] == [{'id': actor, 'name': 'New actor'}]
+    assert document['actors_names'] == ['New actor']
+    assert document['writers'] == [{'id': writer, 'name': 'New writer'}]
+    assert document['writers_names'] == ['New writer']
+    assert document['genre'] == ['Renamed {0}'.format(genre)]
+    assert loader.get_sources(Person._index, [actor])[actor]['full_name'] == 'New actor'
+
+
+def test_rename_director_needs_rebuild(loader, documents, postgres, monkeypatch):
+    """Directors are stored in movies without IDs, so their rows are returned to rebuild the movies."""
+    director, movie = new_id(), new_id()
+    documents(Person, [{'id': director, 'full_name': 'Old director'}])
+    documents(Movie, [make_movie(movie, actors=[], writers=[], genres=[])])
+    monkeypatch.setattr(postgres, 'get_director_ids', lambda person_ids: {director})
+
+    rows = [{'id': director, 'full_name': 'New director'}]
+    assert rename_movies(postgres, loader, 'person', rows) == rows
+
@@ -0,0 +1,72 @@
+import itertools
+import threading
+
+import pytest
+
+from services.pipeline import Pipeline, Stage
+
+TIMEOUT = 5
+
+
+def run_in_thread(pipeline, source):
+    """Run a pipeline in a thread and wait for it, so a hanging pipeline fails the test instead of blocking it.
+
+    Args:
+        pipeline: Pipeline to run.
+        source: Items for the first stage.
+
+    Returns:
+        List: Errors raised by `run`.
+    """
+    raised = []
+
+    def target():
+        try:
+            pipeline.run(source)
+        except Exception as error:
+            raised.append(error)
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(TIMEOUT)
+    assert not thread.is_alive(), 'The pipeline did not stop'
+    return raised
+
+
+def test_items_pass_through_all_stages():
+    """Every item is processed by each stage in turn."""
+    loaded = []
+    stages = [Stage(lambda item: item * 2), Stage(lambda item: item + 1, workers=3), Stage(loaded.append)]
+
+    Pipeline(stages, queue_size=1).run(range(20))
+
+    assert sorted(loaded) == [item * 2 + 1 for item in range(20)]
+
+
+@pytest.mark.parametrize('failing', [0, 1, 2])
+def test_stage_error_stops_the_pipeline(failing):
+    """An error in any stage is raised from run and stops the other stages and an endless source."""
+    loaded = []
+
+    def fail(item):
+        raise ValueError('Stage failed')
+
+    funcs = [lambda item: item, lambda item: item, loaded.append]
+    funcs[failing] = fail
+    pipeline = Pipeline([Stage(func, workers=2) for func in funcs], queue_size=1)
+
+    raised = run_in_thread(pipeline, itertools.count())
+
+    assert [type(error) for error in raised] == [ValueError]
+    assert pipeline.stop.is_set()
+
+
+def test_source_error_stops_the_pipeline():
+    """An error raised while reading the source is raised from run."""
+    def source():
+        yield from range(3)
+        raise KeyError('Source failed')
+
+    raised = run_in_thread(Pipeline([Stage(lambda item: item)], queue_size=1), source())
+
+    assert [type(error) for error in raised] == [KeyError]
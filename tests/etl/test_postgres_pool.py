@@ -0,0 +1,99 @@
+from types import SimpleNamespace
+
+import pytest
+from psycopg2 import OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+
+from db import postgres
+from db.postgres import PostgresPool
+
+
+class FakeCursor(object):
+    """Cursor that records the statements executed on its connection."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        """Leave the cursor."""
+
+    def execute(self, statement):
+        self.conn.statements.append(statement)
+        self.conn.info.transaction_status = TRANSACTION_STATUS_INTRANS
+
+
+class FakeConnection(object):
+    """Connection that tracks its transaction status and whether it is closed."""
+
+    def __init__(self):
+        self.closed = 0
+        self.info = SimpleNamespace(transaction_status=TRANSACTION_STATUS_IDLE)
+        self.statements = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.info.transaction_status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """Replace psycopg2.connect with fake connections.
+
+    Returns:
+        List: Connections opened by the pool.
+    """
+    connections = []
+
+    def connect(**dsn):
+        connections.append(FakeConnection())
+        return connections[-1]
+
+    monkeypatch.setattr(postgres.psycopg2, 'connect', connect)
+    return connections
+
+
+def test_returned_connections_are_reused(opened):
+    """Connections are kept open after use, so repeated checkouts do not open new ones or grow the bookkeeping."""
+    pool = PostgresPool(1, 4, health_check_interval=30)
+    for _ in range(100):
+        with pool.connection() as first, pool.connection() as second:
+            pool.prepare(first, 'ids', 'SELECT $1')
+            pool.prepare(second, 'ids', 'SELECT $1')
+            first.cursor().execute('SELECT 1;')
+
+    assert len(opened) == 2
+    assert not any(conn.closed for conn in opened)
+    assert all(conn.info.transaction_status == TRANSACTION_STATUS_IDLE for conn in opened)
+    assert len(pool.prepared) == 2
+    assert all(conn.statements.count('PREPARE ids AS SELECT $1') == 1 for conn in opened)
+
+
+def test_broken_connection_is_replaced(opened):
+    """A connection that failed is closed and forgotten, and the next checkout opens a new one."""
+    pool = PostgresPool(1, 1, health_check_interval=30)
+    with pytest.raises(OperationalError):
+        with pool.connection() as conn:
+            pool.prepare(conn, 'ids', 'SELECT $1')
+            raise OperationalError('server closed the connection unexpectedly')
+
+    assert conn.closed
+    assert not pool.prepared
+    with pool.connection() as conn:
+        assert conn is opened[-1]
+    assert len(opened) == 2
+
+
+def test_close(opened):
+    """Closing the pool closes the idle connections."""
+    pool = PostgresPool(2, 2, health_check_interval=30)
+    pool.close()
+
+    assert all(conn.closed for conn in opened)
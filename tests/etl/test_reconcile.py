@@ -0,0 +1,95 @@
+import pytest
+
+from services.reconcile import Reconciler, missing_ids
+from core.config import TABLE_SCHEMAS
+from factories import make_movie, new_id
+from models.genre import Genre
+from models.movie import Movie
+from models.person import Person
+
+
+@pytest.mark.parametrize('source, target, missing', [
+    ([], [['a', 'b']], ['a', 'b']),
+    ([['a', 'b']], [], []),
+    ([['a'], ['c']], [['a', 'b'], ['c', 'd']], ['b', 'd']),
+    ([['b', 'c'], ['e']], [['a'], ['c', 'e']], ['a']),
+    ([['a', 'b', 'c']], [['a'], ['b'], ['c']], []),
+])
+def test_missing_ids(source, target, missing):
+    """IDs of the target that the source lacks are found across page boundaries."""
+    assert list(missing_ids(source, target)) == missing
+
+
+@pytest.fixture
+def database(postgres, loader, monkeypatch):
+    """Replace the ID queries of the extractor with a database holding every indexed row except the removed ones.
+
+    Returns:
+        Dict: Removed IDs ('removed') and IDs inserted after the scan of the table ('inserted').
+    """
+    rows = {'removed': set(), 'inserted': set()}
+
+    def get_ids(table):
+        for page in loader.get_ids(TABLE_SCHEMAS[table]._index):
+            yield [row_id for row_id in page if row_id not in rows['removed'] | rows['inserted']]
+
+    def get_existing_ids(table, ids):
+        return set(ids) - rows['removed']
+
+    monkeypatch.setattr(postgres, 'get_ids', get_ids)
+    monkeypatch.setattr(postgres, 'get_existing_ids', get_existing_ids)
+    return rows
+
+
+def test_reconcile_deleted_person_and_genre(loader, documents, postgres, data, redis, queue, database):
+    """Documents of removed persons and genres are deleted and the movies listing them are queued."""
+    actor, writer, genre = new_id(), new_id(), new_id()
+    genre_name = 'Genre {0}'.format(genre)
+    acted, written, unrelated = new_id(), new_id(), new_id()
+    documents(Person, [{'id': actor, 'full_name': 'Actor'}, {'id': writer, 'full_name': 'Writer'}])
+    documents(Genre, [{'id': genre, 'name': genre_name, 'description': ''}])
+    documents(Movie, [
+        make_movie(acted, actors=[{'id': actor, 'name': 'Actor'}], writers=[], genres=[]),
+        make_movie(written, actors=[], writers=[{'id': writer, 'name': 'Writer'}], genres=[genre_name]),
+        make_movie(unrelated, actors=[], writers=[], genres=[]),
+    ])
+    database['removed'].update({actor, genre})
+
+    assert Reconciler(postgres, data, loader).reconcile(queue) == 2
+
+    assert not loader.get_sources(Person._index, [actor])
+    assert loader.get_sources(Person._index, [writer])
+    assert not loader.get_sources(Genre._index, [genre])
+    assert {movie_id.decode() for movie_id in redis.smembers(queue)} == {acted, written}
+    assert len(loader.get_sources(Movie._index, [acted, written, unrelated])) == 3
+
+
+def test_reconcile_keeps_rows_inserted_during_scan(loader, documents, postgres, data, redis, queue, database):
+    """IDs missing from the scan but found when checked again are not deleted."""
+    person = new_id()
+    documents(Person, [{'id': person, 'full_name': 'Person'}])
+    database['inserted'].add(person)
+
+    assert Reconciler(postgres, data, loader).reconcile(queue) == 0
+
+    assert loader.get_sources(Person._index, [person])
+    assert not redis.smembers(queue)
+
+
+def test_reconcile_counts_only_deleted_documents(loader, documents, postgres, data, queue, database, monkeypatch):
+    """Documents that Elasticsearch failed to delete are not counted."""
+    deleted, failed = new_id(), new_id()
+    documents(Person, [{'id': deleted, 'full_name': 'Deleted'}, {'id': failed, 'full_name': 'Failed'}])
+    database['removed'].update({deleted, failed})
+    bulk_delete = loader.bulk_delete
+
+    def failing_delete(index, ids):
+        errors = bulk_delete(index, [row_id for row_id in ids if row_id != failed])
+        return errors + [{'delete': {'_id': failed, 'status': 500}}] if failed in ids else errors
+
+    monkeypatch.setattr(loader, 'bulk_delete', failing_delete)
+
+    assert Reconciler(postgres, data, loader).reconcile(queue) == 1
+
+    assert not loader.get_sources(Person._index, [deleted])
+    assert loader.get_sources(Person._index, [failed])
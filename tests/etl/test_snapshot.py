@@ -0,0 +1,47 @@
+from services.snapshot import CopySink
+
+COPY_LINES = (
+    rb'{"id":"1","title":"Plain"}' + b'\n',
+    rb'{"id":"2","description":"Line one\\nLine two"}' + b'\n',
+    rb'{"id":"3","path":"C:\\\\films\\\\new"}' + b'\n',
+)
+
+
+def test_copy_lines_are_unescaped():
+    """Backslashes escaped by COPY are undone, so the JSON escapes of newlines and backslashes are read back."""
+    batches = []
+    sink = CopySink('film_work', batches.append, batch_size=10)
+
+    sink.write(b''.join(COPY_LINES))
+    sink.flush()
+
+    assert batches == [[
+        {'id': '1', 'title': 'Plain'},
+        {'id': '2', 'description': 'Line one\nLine two'},
+        {'id': '3', 'path': 'C:\\films\\new'},
+    ]]
+
+
+def test_lines_split_across_chunks():
+    """A line cut between two chunks is parsed once the rest of it arrives."""
+    batches = []
+    sink = CopySink('film_work', batches.append, batch_size=10)
+    output = b''.join(COPY_LINES)
+
+    sink.write(output[:40])
+    sink.write(output[40:])
+    sink.flush()
+
+    assert [row['id'] for row in batches[0]] == ['1', '2', '3']
+
+
+def test_full_batches_are_passed_while_copying():
+    """Full batches reach the handler as soon as they are parsed and the rest on flush."""
+    batches = []
+    sink = CopySink('film_work', batches.append, batch_size=2)
+
+    sink.write(b''.join(COPY_LINES))
+    assert [[row['id'] for row in batch] for batch in batches] == [['1', '2']]
+
+    sink.flush()
+    assert [[row['id'] for row in batch] for batch in batches] == [['1', '2'], ['3']]
@@ -0,0 +1,121 @@
+import pytest
+from elasticsearch.exceptions import ConnectionError as ElasticConnectionError
+
+from services.load import ElasticsearchLoader
+from services.spool import HEADER, Spool
+from factories import make_movie, new_id
+from models.movie import Movie
+from models.person import Person
+
+
+def make_actions(count):
+    """Build index actions for new person documents.
+
+    Args:
+        count: Number of actions.
+
+    Returns:
+        List: Bulk actions.
+    """
+    return [
+        {'_index': Person._index, '_id': person_id, '_source': {'id': person_id, 'full_name': 'Person'}}
+        for person_id in (new_id() for _ in range(count))
+    ]
+
+
+def unavailable(actions):
+    """Stand in for the bulk requests of a loader while Elasticsearch is down.
+
+    Args:
+        actions: Bulk actions.
+
+    Raises:
+        ConnectionError: Always.
+    """
+    raise ElasticConnectionError('N/A', 'Elasticsearch is down', None)
+
+
+@pytest.fixture
+def spooling_loader(elastic, tmp_path, monkeypatch):
+    """Create a loader with a spool whose bulk requests fail until the test restores them.
+
+    Returns:
+        ElasticsearchLoader: Loader.
+    """
+    loader = ElasticsearchLoader(elastic, threads=1, spool=Spool(str(tmp_path)))
+    monkeypatch.setattr(loader, 'bulk', unavailable)
+    return loader
+
+
+def test_records_round_trip(tmp_path):
+    """Appended records are read back in order after the segment is sealed."""
+    spool = Spool(str(tmp_path))
+    records = [make_actions(2), make_actions(1)]
+    for actions in records:
+        spool.append(actions)
+    spool.seal()
+
+    assert len(spool.segments) == 1
+    assert list(spool.read(spool.segments[0])) == records
+
+
+def test_torn_record_is_dropped(tmp_path):
+    """A record cut short by a crash ends its segment and the complete records before it are kept."""
+    spool = Spool(str(tmp_path))
+    actions = make_actions(1)
+    spool.append(actions)
+    spool.seal()
+    with open(spool.segments[0], 'ab') as segment:
+        segment.write(HEADER.pack(100) + b'[{"_id"')
+
+    assert list(Spool(str(tmp_path)).read(spool.segments[0])) == [actions]
+
+
+def test_segments_roll_over(tmp_path):
+    """A new segment is started once the active one is full, and a new spool finds the segments in order."""
+    spool = Spool(str(tmp_path), segment_bytes=1)
+    records = [make_actions(1) for _ in range(3)]
+    for actions in records:
+        spool.append(actions)
+    spool.seal()
+
+    reopened = Spool(str(tmp_path))
+    assert reopened.segments == spool.segments
+    assert len(reopened.segments) == 3
+    assert [list(reopened.read(segment)) for segment in reopened.segments] == [[actions] for actions in records]
+
+
+def test_replay_after_recovery(spooling_loader, monkeypatch):
+    """Documents written while Elasticsearch is down are spooled and loaded once it is back."""
+    person_id = new_id()
+
+    assert not spooling_loader.bulk_insert(Person, [{'id': person_id, 'full_name': 'Person'}])
+    assert not spooling_loader.replay_spool()
+    assert not spooling_loader.spool.empty
+
+    monkeypatch.undo()
+    spooling_loader.spool.retry_at = 0
+    assert spooling_loader.replay_spool()
+
+    assert spooling_loader.spool.empty
+    assert spooling_loader.get_sources(Person._index, [person_id])
+    spooling_loader.bulk_delete(Person._index, [person_id])
+
+
+def test_failed_movies_are_requeued(spooling_loader, monkeypatch):
+    """Movies that fail when the spool is replayed are put back in the queue before the segment is removed."""
+    loaded, failed = new_id(), new_id()
+    requeued = []
+    spooling_loader.requeue = requeued.extend
+    movies = [make_movie(movie_id, actors=[], writers=[], genres=[]) for movie_id in (loaded, failed)]
+    spooling_loader.bulk_insert(Movie, movies)
+
+    def bulk(actions):
+        return [{'index': {'_id': failed, 'status': 400}}]
+
+    monkeypatch.setattr(spooling_loader, 'bulk', bulk)
+    spooling_loader.spool.retry_at = 0
+    assert spooling_loader.replay_spool()
+
+    assert spooling_loader.spool.empty
+    assert requeued == [failed]